@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import logging
+import hashlib
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from batch_manifest import hash_file
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1  # Tăng khi cách tạo artifact thay đổi để bỏ các bản cache cũ
+EVICT_GRACE_SECONDS = 3600  # Artifact được dùng trong chừng này giây không bị xóa (job khác có thể đang đọc)
+
+
+class ArtifactCache:
+    """Cache các file trung gian (audio đã ghép, ASS...) theo nội dung, giới hạn dung lượng, xóa theo LRU
+
+    Khóa của artifact là hash của tên stage, nội dung các file đầu vào và tham số của stage, nên cùng
+    đầu vào thì dùng lại được giữa các job và giữa các lần chạy. Mỗi artifact có thể kèm metadata
+    (ví dụ: thời lượng) trong file .json cạnh nó. mtime được cập nhật mỗi lần dùng để làm LRU.
+
+    Artifact vừa được dùng trong evict_grace_seconds giây không bị xóa dù cache vượt giới hạn, vì
+    job khác (process khác, máy khác) có thể đã nhận đường dẫn từ fetch nhưng ffmpeg chưa mở file.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, evict_grace_seconds: float = EVICT_GRACE_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.evict_grace_seconds = evict_grace_seconds
+        self.file_hashes: Dict[Tuple[str, int, int], str] = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls, settings: Optional[dict]) -> Optional['ArtifactCache']:
+        """Tạo cache từ mục 'artifact_cache' trong batch_settings.json, None nếu không bật"""
+        if not settings or not settings.get("enabled"):
+            return None
+        return cls(
+            settings.get("dir") or os.path.join(os.getcwd(), "cache", "artifacts"),
+            int(float(settings.get("max_gb", 10)) * 1024 ** 3),
+            float(settings.get("evict_grace_seconds", EVICT_GRACE_SECONDS)),
+        )
+
+    def remember_hashes(self, hashes: Dict[str, Dict]):
+        """Nạp hash file đã tính sẵn (BatchManifest.hashes_for) để job không phải đọc lại file đầu vào
+
+        Cache được pickle sang process con cho mỗi job nên phải nạp trước khi submit job.
+        """
+        for path, entry in hashes.items():
+            self.file_hashes[(os.path.abspath(path), entry['size'], entry['mtime_ns'])] = entry['sha1']
+
+    def file_hash(self, path: str) -> str:
+        """Hash nội dung file, nhớ theo (size, mtime) để không đọc lại file không đổi"""
+        stat = os.stat(path)
+        ident = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if ident not in self.file_hashes:
+            self.file_hashes[ident] = hash_file(path)
+        return self.file_hashes[ident]
+
+    def key(self, stage: str, inputs: Iterable[Optional[str]], params: Optional[dict] = None) -> str:
+        data = {
+            'version': CACHE_VERSION,
+            'stage': stage,
+            'inputs': [self.file_hash(p) if p else None for p in inputs],
+            'params': params or {},
+        }
+        return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _paths(self, stage: str, key: str, suffix: str) -> Tuple[str, str]:
+        path = os.path.join(self.cache_dir, f"{stage}_{key}{suffix}")
+        return path, f"{path}.json"
+
+    def fetch(self, stage: str, inputs: Iterable[Optional[str]], params: Optional[dict], suffix: str,
+              build: Callable[[str], Optional[dict]]) -> Tuple[str, dict]:
+        """Lấy artifact trong cache, nếu chưa có thì tạo bằng build rồi đưa vào cache
+
+        Args:
+            stage: Tên stage (ví dụ: 'audio', 'ass'), dùng làm tiền tố tên file
+            inputs: Các file đầu vào của stage (None được bỏ qua nhưng vẫn tính vào khóa)
+            params: Tham số ảnh hưởng tới kết quả (preset, offset...), phải serialize được sang JSON
+            suffix: Đuôi file của artifact
+            build: Hàm (đường dẫn đích) -> metadata, ghi artifact vào đường dẫn được truyền vào
+
+        Returns:
+            (đường dẫn artifact trong cache, metadata). File trong cache chỉ được đọc, không sửa.
+        """
+        key = self.key(stage, inputs, params)
+        path, meta_path = self._paths(stage, key, suffix)
+        if os.path.exists(path) and os.path.exists(meta_path):
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                os.utime(path)
+                logger.info(f"Reusing cached {stage} artifact: {os.path.basename(path)}")
+                return path, meta
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring broken cache entry {os.path.basename(path)}: {e}")
+
+        # Ghi ra file tạm rồi rename để process khác không bao giờ đọc phải artifact dở
+        tmp = f"{path}.{os.getpid()}.tmp{suffix}"
+        try:
+            meta = build(tmp) or {}
+            with open(f"{meta_path}.{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(tmp, path)
+            os.replace(f"{meta_path}.{os.getpid()}.tmp", meta_path)
+        finally:
+            for leftover in (tmp, f"{meta_path}.{os.getpid()}.tmp"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        self.evict()
+        return path, meta
+
+    def evict(self):
+        """Xóa các artifact ít được dùng gần đây nhất cho tới khi cache nằm trong giới hạn
+
+        Artifact được dùng trong evict_grace_seconds giây gần đây được giữ lại.
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and '.tmp' not in entry.name and not entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        protected_after = time.time() - self.evict_grace_seconds
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if mtime >= protected_after:
+                logger.warning(f"Artifact cache over limit by {(total - self.max_bytes) / 1024 ** 2:.0f} MB, "
+                               f"remaining entries are in use")
+                break
+            try:
+                os.remove(path)
+                if os.path.exists(f"{path}.json"):
+                    os.remove(f"{path}.json")
+                total -= size
+                logger.info(f"Evicted cached artifact: {os.path.basename(path)}")
+            except OSError as e:
+                logger.error(f"Error evicting {path}: {e}")
@@ -0,0 +1,175 @@
+import os
+import logging
+import struct
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from ffmpeg_utils import run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+MAX_WAV_DATA_SIZE = 0xFFFFFFFF - 36  # Giới hạn của header RIFF 32-bit
+
+# (audio_format, bits_per_sample) -> codec ffmpeg tương ứng
+PCM_CODECS = {
+    (1, 16): 'pcm_s16le',
+    (1, 24): 'pcm_s24le',
+    (1, 32): 'pcm_s32le',
+    (3, 32): 'pcm_f32le',
+}
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+@dataclass
+class WavInfo:
+    path: str
+    audio_format: int
+    channels: int
+    sample_rate: int
+    bits_per_sample: int
+    byte_rate: int
+    fmt_chunk: bytes  # Nội dung chunk 'fmt ' giữ nguyên để ghi lại vào file ghép
+    data_offset: int
+    data_size: int
+
+    @property
+    def duration(self) -> float:
+        """Thời lượng chính xác tính từ kích thước data, không cần ffprobe"""
+        return self.data_size / self.byte_rate if self.byte_rate else 0.0
+
+    @property
+    def codec(self) -> Optional[str]:
+        return PCM_CODECS.get((self.audio_format, self.bits_per_sample))
+
+    def same_format(self, other: 'WavInfo') -> bool:
+        """Cùng layout PCM thì dữ liệu có thể nối thẳng với nhau"""
+        return ((self.audio_format, self.channels, self.sample_rate, self.bits_per_sample)
+                == (other.audio_format, other.channels, other.sample_rate, other.bits_per_sample))
+
+
+def read_wav_info(path: str) -> Optional[WavInfo]:
+    """Đọc header của file WAV (chỉ đọc các chunk header, không đọc dữ liệu audio)
+
+    Returns:
+        WavInfo, hoặc None nếu không phải file RIFF/WAVE PCM hợp lệ
+    """
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+            if riff != b'RIFF' or wave != b'WAVE':
+                return None
+
+            fmt_chunk = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                chunk_id, chunk_size = struct.unpack('<4sI', header)
+                if chunk_id == b'fmt ':
+                    fmt_chunk = f.read(chunk_size)
+                    f.seek(chunk_size % 2, os.SEEK_CUR)  # Chunk được pad cho chẵn byte
+                elif chunk_id == b'data':
+                    if fmt_chunk is None or len(fmt_chunk) < 16:
+                        return None
+                    data_offset = f.tell()
+                    # File ghi dạng stream có thể để size = 0/0xFFFFFFFF, lấy phần còn lại của file
+                    if chunk_size in (0, 0xFFFFFFFF) or data_offset + chunk_size > file_size:
+                        chunk_size = file_size - data_offset
+                    audio_format, channels, sample_rate, byte_rate, _, bits = struct.unpack('<HHIIHH', fmt_chunk[:16])
+                    if audio_format == WAVE_FORMAT_EXTENSIBLE and len(fmt_chunk) >= 26:
+                        # Sub-format GUID bắt đầu bằng mã format thật
+                        audio_format = struct.unpack('<H', fmt_chunk[24:26])[0]
+                    return WavInfo(path, audio_format, channels, sample_rate, bits, byte_rate,
+                                   fmt_chunk, data_offset, chunk_size)
+                else:
+                    f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+
+def transcode_to_wav(src: str, dst: str, like: Optional[WavInfo] = None,
+                     run: Callable = run_ffmpeg) -> WavInfo:
+    """Decode một file audio sang WAV bằng ffmpeg (stream, không load vào RAM của Python)
+
+    Args:
+        like: Nếu có, dùng cùng codec/sample rate/số kênh để file ra ghép được với file này
+        run: Hàm chạy lệnh ffmpeg (mặc định run_ffmpeg, có watchdog khi ffmpeg treo)
+    """
+    codec, sample_rate, channels = 'pcm_s16le', None, None
+    if like and like.codec:
+        codec, sample_rate, channels = like.codec, like.sample_rate, like.channels
+
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-i', src, '-vn', '-map_metadata', '-1', '-c:a', codec]
+    if sample_rate:
+        cmd.extend(['-ar', str(sample_rate), '-ac', str(channels)])
+    cmd.extend(['-f', 'wav', dst])
+    run(cmd)
+
+    info = read_wav_info(dst)
+    if not info:
+        raise ValueError(f"ffmpeg produced an invalid WAV file: {dst}")
+    return info
+
+
+def write_joined_wav(parts: List[WavInfo], output_path: str) -> WavInfo:
+    """Ghép các file WAV cùng format: ghi header mới rồi copy nguyên dữ liệu PCM của từng file"""
+    first = parts[0]
+    data_size = sum(p.data_size for p in parts)
+    if data_size > MAX_WAV_DATA_SIZE:
+        raise ValueError("Joined audio is larger than the 4GB WAV limit")
+
+    fmt_chunk = first.fmt_chunk + (b'\0' if len(first.fmt_chunk) % 2 else b'')
+    with open(output_path, 'wb') as out:
+        out.write(struct.pack('<4sI4s', b'RIFF', 4 + 8 + len(fmt_chunk) + 8 + data_size, b'WAVE'))
+        out.write(struct.pack('<4sI', b'fmt ', len(first.fmt_chunk)))
+        out.write(fmt_chunk)
+        out.write(struct.pack('<4sI', b'data', data_size))
+        data_offset = out.tell()
+        for part in parts:
+            with open(part.path, 'rb') as src:
+                src.seek(part.data_offset)
+                remaining = part.data_size
+                while remaining > 0:
+                    chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ValueError(f"Unexpected end of audio data in {part.path}")
+                    out.write(chunk)
+                    remaining -= len(chunk)
+
+    return WavInfo(output_path, first.audio_format, first.channels, first.sample_rate,
+                   first.bits_per_sample, first.byte_rate, first.fmt_chunk, data_offset, data_size)
+
+
+def join_audio(paths: List[str], output_path: str, temp_path_factory,
+               run: Callable = run_ffmpeg) -> Tuple[str, List[float]]:
+    """Ghép nhiều file audio thành một file WAV và trả về thời lượng chính xác của từng phần
+
+    Các file WAV cùng format được copy thẳng (không decode). File khác (MP3, WAV khác format)
+    được ffmpeg decode sang đúng format của file WAV đầu tiên trước khi ghép.
+
+    Args:
+        paths: Danh sách file audio theo thứ tự phát
+        output_path: File WAV đầu ra
+        temp_path_factory: Hàm (prefix, suffix) -> đường dẫn file tạm
+        run: Hàm chạy lệnh ffmpeg decode (VideoProcessor truyền vào để áp timeout và cancel của job)
+
+    Returns:
+        (output_path, [thời lượng từng phần tính bằng giây])
+    """
+    infos = [read_wav_info(p) for p in paths]
+    reference = next((i for i in infos if i and i.codec), None)
+
+    parts = []
+    for index, (path, info) in enumerate(zip(paths, infos)):
+        if info and reference and info.same_format(reference):
+            parts.append(info)
+        else:
+            logger.info(f"Decoding {os.path.basename(path)} to PCM for joining")
+            decoded = transcode_to_wav(path, temp_path_factory(f"part{index}", '.wav'), reference, run)
+            reference = reference or decoded
+            parts.append(decoded)
+
+    joined = write_joined_wav(parts, output_path)
+    return joined.path, [p.duration for p in parts]
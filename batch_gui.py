@@ -1,9 +1,18 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import os
-from video_processor import VideoProcessor
+import queue
+import threading
+from batch_runner import BatchRunner
 from batch_settings import BatchSettings
-import shutil
+from log_setup import setup_logging
+from transcode_cache import TranscodeCache
+from artifact_cache import ArtifactCache
+from ffmpeg_utils import ProcessLimits
+from concurrency import ConcurrencyController
+from job_order import JobOrder
+
+POLL_INTERVAL_MS = 16  # ~60 fps
 
 class BatchProcessorGUI(ctk.CTk):
     def __init__(self):
@@ -22,6 +31,11 @@ class BatchProcessorGUI(ctk.CTk):
         self.work_dir = os.path.join(os.getcwd(), "temp")
         os.makedirs(self.work_dir, exist_ok=True)
         
+        # Batch chạy ở thread nền, gửi tiến độ về main loop qua queue này
+        self.events = queue.Queue()
+        self.worker = None
+        self.cancel_event = None
+        
         # Create main frame
         self.main_frame = ctk.CTkFrame(self)
         self.main_frame.pack(expand=True, fill="both", padx=20, pady=20)
@@ -78,6 +92,15 @@ class BatchProcessorGUI(ctk.CTk):
         if self.batch_settings.settings["preset_name"]:
             self.batch_preset.set(self.batch_settings.settings["preset_name"])
             
+        # Parallel workers
+        workers_row = ctk.CTkFrame(self.main_frame)
+        workers_row.pack(fill="x", pady=5)
+        
+        ctk.CTkLabel(workers_row, text="Parallel Jobs (0 = auto):").pack(side="left")
+        self.batch_workers = ctk.CTkEntry(workers_row)
+        self.batch_workers.pack(side="left", fill="x", expand=True, padx=5)
+        self.batch_workers.insert(0, str(self.batch_settings.settings.get("max_workers") or 0))
+            
         # File suffixes
         suffix_frame = ctk.CTkFrame(self.main_frame)
         suffix_frame.pack(fill="x", pady=10)
@@ -107,14 +130,24 @@ class BatchProcessorGUI(ctk.CTk):
         save_btn.pack(pady=10)
         
         # Process button
-        process_btn = ctk.CTkButton(
+        self.process_btn = ctk.CTkButton(
             self.main_frame,
             text="Process All Files",
             command=self.process_batch,
             height=40,
             font=("Helvetica", 14, "bold")
         )
-        process_btn.pack(pady=10)
+        self.process_btn.pack(pady=10)
+        
+        # Cancel button (chỉ bật khi batch đang chạy)
+        self.cancel_btn = ctk.CTkButton(
+            self.main_frame,
+            text="Cancel",
+            command=self.cancel_batch,
+            height=30,
+            state="disabled"
+        )
+        self.cancel_btn.pack(pady=5)
         
         # Progress
         self.batch_progress = ctk.CTkProgressBar(self.main_frame)
@@ -149,13 +182,14 @@ class BatchProcessorGUI(ctk.CTk):
             "output_folder": self.batch_output.get(),
             "video_folder": self.batch_video.get(),
             "preset_name": self.batch_preset.get(),
+            "max_workers": int(self.batch_workers.get() or 0),
             "suffixes": {k: v.get() for k, v in self.suffix_entries.items()}
         })
         self.batch_settings.save_settings()
         messagebox.showinfo("Success", "Settings saved!")
         
     def process_batch(self):
-        """Process all matching files in batch, one at a time"""
+        """Kiểm tra input trên main thread rồi chạy batch ở thread nền, UI cập nhật qua self.events"""
         try:
             # Validate folders
             input_folder = self.batch_input.get()
@@ -176,92 +210,154 @@ class BatchProcessorGUI(ctk.CTk):
             from subtitle_settings import SubtitlePresetManager
             preset_manager = SubtitlePresetManager()
             settings = preset_manager.presets[preset_name]
-                
+            
+            # Đọc mọi giá trị widget ở đây: thread nền không được đụng vào Tk
+            max_workers = int(self.batch_workers.get() or 0) or None  # None = tự chọn theo tài nguyên máy
+        except Exception as e:
+            self.batch_status.configure(text="Error: " + str(e))
+            messagebox.showerror("Error", str(e))
+            return
+        
+        self.cancel_event = threading.Event()
+        self.set_running(True)
+        self.batch_progress.set(0)
+        self.batch_status.configure(text="Scanning input folder...")
+        self.worker = threading.Thread(
+            target=self.run_batch,
+            args=(output_folder, video_folder, settings, max_workers),
+            daemon=True
+        )
+        self.worker.start()
+        self.after(POLL_INTERVAL_MS, self.poll_events)
+        
+    def run_batch(self, output_folder, video_folder, settings, max_workers):
+        """Chạy trên thread nền: chỉ gửi sự kiện vào self.events, không gọi Tk trực tiếp"""
+        try:
             # Get all base names
             base_names = self.batch_settings.get_base_names()
             if not base_names:
                 raise Exception("No valid files found in input folder!")
                 
-            # Process each file set sequentially
-            total = len(base_names)
-            self.batch_progress.set(0)
+            # Find matching files for every base name up front
+            jobs = {}
+            for base_name in base_names:
+                files = self.batch_settings.find_matching_files(base_name)
+                if not files["audio"]:
+                    print(f"Skipping {base_name}: No audio file found")
+                    continue
+                jobs[base_name] = files
+                
+            total = len(jobs)
+            problems = self.batch_settings.problems
+            warning = f" ({len(problems)} file set warnings, see log)" if problems else ""
+            self.events.put(("status", f"Processing {total} files{warning}...", 0.0))
+            
+            running = {}  # base_name -> % của các job đang chạy, để thanh tiến độ chạy mượt
+            finished = [0]
+            
+            def fraction():
+                return min(1.0, (finished[0] + sum(running.values()) / 100) / total)
+            
+            def on_job_progress(base_name, percent, status, progress):
+                running[base_name] = percent
+                self.events.put(("status", f"{base_name}: {status} ({finished[0]}/{total} done)", fraction()))
             
-            for i, base_name in enumerate(base_names):
-                try:
-                    # Update progress and status
-                    progress = (i / total) * 100
-                    self.batch_progress.set(progress / 100)
-                    self.batch_status.configure(text=f"Processing {base_name} ({i+1}/{total})")
-                    self.update()
-                    
-                    # Find matching files
-                    files = self.batch_settings.find_matching_files(base_name)
-                    
-                    # Skip if required files not found
-                    if not files["audio"]:
-                        print(f"Skipping {base_name}: No audio file found")
-                        continue
-                    
-                    # Create new processor for each file to ensure clean state
-                    processor = VideoProcessor(self.work_dir, output_folder)
-                    
-                    try:
-                        # Process video
-                        print(f"\nProcessing {base_name}...")
-                        print(f"Files found: {files}")
-                        
-                        output = processor.process_video(
-                            hook_mp3=files["hook"],
-                            audio_mp3=files["audio"],
-                            hook_srt=files["hook_subtitle"],
-                            audio_srt=files["subtitle"],
-                            thumbnail=files["thumbnail"],
-                            video_folder=video_folder,
-                            subtitle_settings=settings
-                        )
-                        
-                        if output and os.path.exists(output):
-                            print(f"Successfully processed {base_name}")
-                            
-                            # Copy .ass files to output folder
-                            work_dir = processor.work_dir
-                            code_dir = os.getcwd()  # Thư mục chứa code
-                            for file in os.listdir(work_dir):
-                                if file.endswith('.ass'):
-                                    ass_path = os.path.join(work_dir, file)
-                                    # Copy to output folder
-                                    ass_output = os.path.join(output_folder, file)
-                                    print(f"Copying ASS file to output: {ass_output}")
-                                    shutil.copy2(ass_path, ass_output)
-                                    # Copy to code directory
-                                    ass_code = os.path.join(code_dir, file)
-                                    print(f"Copying ASS file to code: {ass_code}")
-                                    shutil.copy2(ass_path, ass_code)
-                            
-                    except Exception as e:
-                        print(f"Error processing {base_name}: {e}")
-                        raise e
-                        
-                except Exception as e:
-                    error_msg = f"Failed to process {base_name}: {str(e)}"
-                    print(error_msg)
-                    if not messagebox.askyesno("Error", f"{error_msg}\n\nContinue with next file?"):
-                        raise Exception("Batch processing cancelled by user")
+            def on_job_done(done, total, result):
+                running.pop(result.base_name, None)
+                finished[0] = done
+                state = "up to date" if result.skipped else ("done" if result.success else "failed")
+                self.events.put(("status", f"{result.base_name} {state} ({done}/{total})", fraction()))
             
-            # Done
-            self.batch_progress.set(1)
-            self.batch_status.configure(text="Processing complete!")
-            messagebox.showinfo("Success", f"Successfully processed {total} files!")
+            # Render song song, lỗi từng job được gom lại thay vì hỏi từng lần
+            limits = ProcessLimits.from_settings(self.batch_settings.settings.get("timeouts"))
+            runner = BatchRunner(
+                self.work_dir,
+                output_folder,
+                video_folder,
+                subtitle_settings=settings,
+                max_workers=max_workers,
+                seed=self.batch_settings.settings.get("background_seed"),
+                encoder=self.batch_settings.settings.get("encoder"),
+                transcode_cache=TranscodeCache.from_settings(self.batch_settings.settings.get("transcode_cache"), limits),
+                segments=self.batch_settings.settings.get("segments", 1),
+                incremental=self.batch_settings.settings.get("incremental", True),
+                artifact_cache=ArtifactCache.from_settings(self.batch_settings.settings.get("artifact_cache")),
+                report_dir=self.batch_settings.settings.get("report_dir") or os.path.join(output_folder, "reports"),
+                limits=limits,
+                concurrency=ConcurrencyController.from_settings(self.batch_settings.settings.get("concurrency")),
+                job_order=JobOrder.from_settings(self.batch_settings.settings.get("job_order"))
+            )
+            summary = runner.run(jobs, callback=on_job_done, progress_callback=on_job_progress,
+                                 cancel_event=self.cancel_event)
+            self.events.put(("finished", summary, total))
             
         except Exception as e:
-            self.batch_status.configure(text="Error: " + str(e))
-            messagebox.showerror("Error", str(e))
+            self.events.put(("error", str(e)))
             
-        finally:
+    def poll_events(self):
+        """Áp các sự kiện từ thread nền lên UI (~60 lần/giây) cho tới khi batch kết thúc"""
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == "status":
+                _, text, fraction = event
+                self.batch_status.configure(text=text)
+                self.batch_progress.set(fraction)
+            elif kind == "finished":
+                self.show_summary(*event[1:])
+            elif kind == "error":
+                self.batch_status.configure(text="Error: " + event[1])
+                messagebox.showerror("Error", event[1])
+        
+        if self.worker is not None and (self.worker.is_alive() or not self.events.empty()):
+            self.after(POLL_INTERVAL_MS, self.poll_events)
+        else:
+            self.worker = None
             self.batch_progress.set(0)
-            self.update()
+            self.set_running(False)
+            
+    def show_summary(self, summary, total):
+        cancelled = self.cancel_event is not None and self.cancel_event.is_set()
+        self.batch_progress.set(1)
+        self.batch_status.configure(
+            text=("Cancelled! " if cancelled else "Processing complete! ") +
+                 f"{summary.videos_per_hour:.1f} videos/hour"
+        )
+        if cancelled:
+            messagebox.showinfo(
+                "Cancelled",
+                f"Processed {len(summary.succeeded)}/{total} files before cancelling "
+                f"({len(summary.skipped)} up to date)."
+            )
+        elif summary.failed:
+            failed_list = "\n".join(f"{r.base_name}: {r.error}" for r in summary.failed)
+            messagebox.showwarning(
+                "Finished with errors",
+                f"Processed {len(summary.succeeded)}/{total} files "
+                f"({len(summary.skipped)} up to date).\n\nFailed:\n{failed_list}"
+            )
+        else:
+            messagebox.showinfo(
+                "Success",
+                f"Successfully processed {len(summary.succeeded)} files "
+                f"({len(summary.skipped)} already up to date)!"
+            )
+            
+    def cancel_batch(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.cancel_btn.configure(state="disabled")
+            self.batch_status.configure(text="Cancelling...")
+            
+    def set_running(self, running):
+        self.process_btn.configure(state="disabled" if running else "normal")
+        self.cancel_btn.configure(state="normal" if running else "disabled")
 
 def main():
+    setup_logging(BatchSettings().settings.get("log_level", "INFO"))
     app = BatchProcessorGUI()
     app.mainloop()
 
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import logging
+import hashlib
+import threading
+from dataclasses import asdict, is_dataclass
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = ".batch_manifest.json"
+MANIFEST_VERSION = 1
+HASH_CHUNK = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    """SHA1 nội dung file, đọc theo từng khối để không load cả file vào RAM"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BatchManifest:
+    """Ghi lại hash đầu vào và file output của từng job để chạy lại batch chỉ render phần thay đổi
+
+    Hash của job gồm nội dung các file đầu vào (audio, hook, SRT, thumbnail), preset subtitle và
+    encoder profile. Hash nội dung file được cache theo (size, mtime) nên lần chạy sau không phải
+    đọc lại các file không đổi. Clip nền không thuộc đầu vào vì được chọn ngẫu nhiên mỗi lần.
+    Manifest nằm trong thư mục output, cạnh các video nó mô tả.
+    """
+
+    def __init__(self, output_folder: str, manifest_path: Optional[str] = None):
+        self.manifest_path = manifest_path or os.path.join(output_folder, MANIFEST_FILENAME)
+        self.files: Dict[str, Dict] = {}
+        self.jobs: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_VERSION:
+                return
+            self.files = data.get('files', {})
+            self.jobs = data.get('jobs', {})
+        except Exception as e:
+            logger.error(f"Error loading batch manifest: {e}")
+            self.files = {}
+            self.jobs = {}
+
+    def save(self):
+        """Ghi manifest (file tạm rồi rename để không bao giờ để lại manifest dở)"""
+        with self.lock:
+            data = {'version': MANIFEST_VERSION, 'files': dict(self.files), 'jobs': dict(self.jobs)}
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+        except Exception as e:
+            logger.error(f"Error saving batch manifest: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def file_hash(self, path: str) -> str:
+        """Hash nội dung file, dùng lại kết quả cũ nếu size và mtime không đổi"""
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.files.get(path)
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha1']
+        sha1 = hash_file(path)
+        with self.lock:
+            self.files[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': sha1}
+        return sha1
+
+    def hashes_for(self, paths) -> Dict[str, Dict]:
+        """Hash đã biết của các file (path -> size, mtime_ns, sha1), chỉ các file có trong manifest"""
+        with self.lock:
+            return {path: dict(self.files[path]) for path in paths if path and path in self.files}
+
+    def fingerprint(self, files: Dict[str, Optional[str]], subtitle_settings=None, encoder=None) -> str:
+        """Hash tổng hợp mọi thứ quyết định nội dung video output của một job
+
+        Args:
+            files: Kết quả của BatchSettings.find_matching_files
+            subtitle_settings: Preset subtitle (SubtitleSettings hoặc dict)
+            encoder: EncoderProfile (hoặc dict cấu hình encoder)
+        """
+        def plain(value):
+            return asdict(value) if is_dataclass(value) else value
+
+        parts = {
+            role: self.file_hash(path) if path else None
+            for role, path in sorted(files.items())
+        }
+        parts['subtitle_settings'] = plain(subtitle_settings)
+        parts['encoder'] = plain(encoder)
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def output_if_current(self, base_name: str, fingerprint: str) -> Optional[str]:
+        """Trả về output của lần render trước nếu đầu vào không đổi và file output vẫn còn"""
+        with self.lock:
+            entry = self.jobs.get(base_name)
+        if entry and entry.get('inputs') == fingerprint and os.path.exists(entry.get('output') or ''):
+            return entry['output']
+        return None
+
+    def record(self, base_name: str, fingerprint: str, output: str):
+        with self.lock:
+            self.jobs[base_name] = {'inputs': fingerprint, 'output': output, 'finished': time.time()}
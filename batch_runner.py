@@ -0,0 +1,486 @@
+import os
+import queue
+import logging
+import time
+import multiprocessing
+from concurrent.futures import (FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, ThreadPoolExecutor,
+                                wait)
+from dataclasses import asdict, dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from artifact_cache import ArtifactCache
+from audio_join import read_wav_info
+from batch_manifest import BatchManifest
+from clip_selector import ClipSelector
+from concurrency import ConcurrencyController, available_cores, pin_worker
+from encoder_profiles import make_profile
+from job_order import JobOrder
+from ffmpeg_utils import Cancelled, ProcessLimits
+from log_setup import setup_logging
+from media_index import ClipInfo, MediaIndex
+from stage_timer import StageTimer, write_batch_report
+from transcode_cache import TranscodeCache
+from video_processor import VideoProcessor, BACKGROUND_MARGIN
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers() -> int:
+    """Số job chạy song song mặc định: mỗi ffmpeg tự dùng nhiều thread nên chỉ lấy 1/4 số core"""
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def init_worker(log_level, cpu_slots=None):
+    """Initializer của worker process: cấu hình logging và gắn CPU (nếu bật affinity)"""
+    setup_logging(log_level)
+    pin_worker(cpu_slots)
+
+
+@dataclass
+class JobResult:
+    base_name: str
+    success: bool
+    output: Optional[str] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    skipped: bool = False  # Đầu vào không đổi so với lần render trước, dùng lại output cũ
+    timings: Dict[str, Dict[str, float]] = field(default_factory=dict)  # StageTimer.as_dict() của job
+    encoder: Optional[str] = None  # Tên encoder đã encode job (khác encoder được chọn nếu phải dùng dự phòng)
+
+
+@dataclass
+class BatchSummary:
+    results: List[JobResult] = field(default_factory=list)
+    elapsed: float = 0.0
+    timings: Dict[str, Dict[str, float]] = field(default_factory=dict)  # Các stage chạy ở process cha
+
+    @property
+    def succeeded(self) -> List[JobResult]:
+        return [r for r in self.results if r.success and not r.skipped]
+
+    @property
+    def skipped(self) -> List[JobResult]:
+        return [r for r in self.results if r.skipped]
+
+    @property
+    def failed(self) -> List[JobResult]:
+        return [r for r in self.results if not r.success]
+
+    @property
+    def videos_per_hour(self) -> float:
+        """Throughput tổng của cả batch (chỉ tính video thành công)"""
+        if self.elapsed <= 0:
+            return 0.0
+        return len(self.succeeded) * 3600.0 / self.elapsed
+
+
+class ProgressReporter:
+    """Callback của process_video cho job chạy không có GUI
+
+    Log tiến độ encode định kỳ, cảnh báo khi vị trí encode không tăng quá STALL_SECONDS và chuyển
+    tiến độ về process cha qua progress_queue (nếu có).
+    """
+
+    LOG_INTERVAL = 10.0
+    STALL_SECONDS = 60.0
+
+    def __init__(self, base_name: str, progress_queue=None):
+        self.base_name = base_name
+        self.progress_queue = progress_queue
+        self.last_log = 0.0
+        self.last_time = -1.0
+        self.last_advance = time.monotonic()
+        self.stalled = False
+
+    def __call__(self, status: str, percent: float, progress=None):
+        now = time.monotonic()
+        if progress is None:
+            logger.info(f"{self.base_name}: {status}")
+        else:
+            if progress.time > self.last_time:
+                self.last_time = progress.time
+                self.last_advance = now
+                self.stalled = False
+            elif not self.stalled and now - self.last_advance > self.STALL_SECONDS:
+                self.stalled = True
+                logger.warning(f"{self.base_name}: encode has not advanced for "
+                               f"{now - self.last_advance:.0f}s at {progress.time:.1f}s")
+            if progress.done or now - self.last_log >= self.LOG_INTERVAL:
+                self.last_log = now
+                logger.info(f"{self.base_name}: {progress.describe()}")
+
+        if self.progress_queue is not None:
+            self.progress_queue.put((self.base_name, percent, status, progress))
+
+
+def run_job(base_name: str,
+            files: Dict[str, Optional[str]],
+            work_dir: str,
+            output_folder: str,
+            video_folder: str,
+            subtitle_settings=None,
+            background_videos: Optional[List[str]] = None,
+            encoder=None,
+            transcode_cache: Optional[TranscodeCache] = None,
+            segments: int = 1,
+            artifact_cache: Optional[ArtifactCache] = None,
+            progress_queue=None,
+            cancel_event=None,
+            limits: Optional[ProcessLimits] = None) -> JobResult:
+    """Render một bộ file trong process con. Không raise, lỗi được trả về trong JobResult
+
+    Args:
+        base_name: Tên gốc của bộ file (ví dụ: 'KB2')
+        files: Kết quả của BatchSettings.find_matching_files
+        work_dir: Thư mục tạm chung, VideoProcessor tự tạo thư mục con riêng cho job
+        background_videos: Clip nền đã được BatchRunner chọn trước
+        encoder: Cấu hình encoder (xem encoder_profiles.make_profile)
+        transcode_cache: Cache clip nền chuẩn hóa, dùng khi job phải tự chọn clip
+        segments: Số đoạn encode song song trong một job (1 = encode một lượt)
+        artifact_cache: Cache audio đã ghép và file ASS, dùng chung giữa các job
+        progress_queue: Queue (multiprocessing.Manager) nhận (base_name, percent, status, progress)
+        cancel_event: Event (multiprocessing.Manager) để hủy job đang chạy
+        limits: Timeout, watchdog và số lần thử lại của các lệnh ffmpeg trong job
+    """
+    start = time.perf_counter()
+    processor = None
+    try:
+        if not files.get("audio"):
+            raise Exception("No audio file found")
+
+        processor = VideoProcessor(work_dir, output_folder, encoder, transcode_cache, segments, artifact_cache,
+                                   limits)
+
+        logger.info(f"Processing {base_name}...")
+        logger.info(f"Files found: {files}")
+
+        output = processor.process_video(
+            hook_mp3=files["hook"],
+            audio_mp3=files["audio"],
+            hook_srt=files["hook_subtitle"],
+            audio_srt=files["subtitle"],
+            thumbnail=files["thumbnail"],
+            video_folder=video_folder,
+            subtitle_settings=subtitle_settings,
+            callback=ProgressReporter(base_name, progress_queue),
+            ass_output_dir=output_folder,
+            background_videos=background_videos,
+            cancel_event=cancel_event
+        )
+
+        if cancel_event is not None and cancel_event.is_set():
+            raise Cancelled()
+        if not output or not os.path.exists(output):
+            raise Exception("Failed to create output video")
+
+        logger.info(f"Successfully processed {base_name}")
+        return JobResult(base_name, True, output=output, elapsed=time.perf_counter() - start,
+                         timings=processor.timer.as_dict(),
+                         encoder=processor.used_encoder.name if processor.used_encoder else None)
+
+    except Cancelled:
+        return JobResult(base_name, False, error="Cancelled", elapsed=time.perf_counter() - start,
+                         timings=processor.timer.as_dict() if processor else {})
+
+    except Exception as e:
+        logger.error(f"Error processing {base_name}: {e}")
+        return JobResult(base_name, False, error=str(e), elapsed=time.perf_counter() - start,
+                         timings=processor.timer.as_dict() if processor else {})
+
+
+class BatchRunner:
+    """Chạy nhiều VideoProcessor.process_video song song bằng process pool"""
+
+    def __init__(self, work_dir: str, output_folder: str, video_folder: str,
+                 subtitle_settings=None, max_workers: Optional[int] = None,
+                 seed: Optional[int] = None, encoder=None,
+                 transcode_cache: Optional[TranscodeCache] = None, segments: int = 1,
+                 incremental: bool = True, artifact_cache: Optional[ArtifactCache] = None,
+                 report_dir: Optional[str] = None, limits: Optional[ProcessLimits] = None,
+                 concurrency: Optional[ConcurrencyController] = None,
+                 job_order: Optional[JobOrder] = None):
+        self.work_dir = work_dir
+        self.output_folder = output_folder
+        self.video_folder = video_folder
+        self.subtitle_settings = subtitle_settings
+        self.max_workers = max_workers  # None/0 = để concurrency controller chọn (hoặc default_workers)
+        self.concurrency = concurrency  # Chọn số job song song và số thread mỗi job theo tài nguyên máy
+        self.job_order = job_order or JobOrder()  # Thứ tự gửi job vào pool (shortest/longest first, priority)
+        self.seed = seed  # Seed cho việc chọn clip nền, None = ngẫu nhiên mỗi lần chạy
+        self.encoder = make_profile(encoder)
+        self.transcode_cache = transcode_cache
+        self.segments = segments
+        self.artifact_cache = artifact_cache
+        self.limits = limits
+        self.report_dir = report_dir  # Nếu có, ghi báo cáo hiệu năng của mỗi batch vào thư mục này
+        # Manifest trong thư mục output: chạy lại batch chỉ render các job có đầu vào thay đổi
+        self.manifest = BatchManifest(output_folder) if incremental else None
+
+    def get_job_duration(self, files: Dict[str, Optional[str]]) -> float:
+        """Thời lượng audio (hook + main) của một job, chỉ đọc header (WAV) hoặc ffprobe"""
+        processor = VideoProcessor(self.work_dir, self.output_folder, limits=self.limits)
+        duration = 0.0
+        for path in (files["audio"], files.get("hook")):
+            if path:
+                info = read_wav_info(path)
+                duration += info.duration if info else processor.get_audio_duration(path)
+        return duration
+
+    def get_job_durations(self, jobs: Dict[str, Dict[str, Optional[str]]]) -> Dict[str, Optional[float]]:
+        """Thời lượng audio của mọi job (đọc song song), None cho job không đọc được"""
+        def duration_or_none(files):
+            try:
+                return self.get_job_duration(files)
+            except Exception as e:
+                logger.error(f"Error reading audio duration: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            return dict(zip(jobs, executor.map(duration_or_none, jobs.values())))
+
+    def select_backgrounds(self, jobs: Dict[str, Dict[str, Optional[str]]],
+                           selector: Optional[ClipSelector] = None,
+                           durations: Optional[Dict[str, Optional[float]]] = None) -> Dict[str, List[ClipInfo]]:
+        """Chọn trước clip nền (clip gốc trong thư viện) cho mọi job bằng một ClipSelector chung
+
+        Job không lấy được thời lượng không có trong kết quả.
+
+        Args:
+            selector: ClipSelector dùng lại qua nhiều lần gọi (watch folder), mặc định tạo mới theo seed
+            durations: Kết quả get_job_durations nếu đã có
+        """
+        try:
+            clips = MediaIndex(self.video_folder, limits=self.limits).refresh()
+        except Exception as e:
+            logger.error(f"Error refreshing media index: {e}")
+            return {}
+        if not clips:
+            return {}
+
+        if durations is None:
+            durations = self.get_job_durations(jobs)
+
+        # Duyệt theo thứ tự cố định để cùng seed cho cùng kết quả
+        selector = selector or ClipSelector(seed=self.seed)
+        selections = {}
+        for name in sorted(jobs):
+            if durations[name] is not None:
+                selections[name] = selector.select(clips, durations[name] + BACKGROUND_MARGIN)
+        return selections
+
+    def plan_backgrounds(self, jobs: Dict[str, Dict[str, Optional[str]]],
+                         selector: Optional[ClipSelector] = None,
+                         durations: Optional[Dict[str, Optional[float]]] = None) -> Dict[str, Optional[List[str]]]:
+        """Chọn clip nền cho mọi job (select_backgrounds) và đổi sang bản trong transcode cache nếu có
+
+        Job nào không lấy được thời lượng thì để None, process_video sẽ tự chọn.
+        """
+        plans = {name: None for name in jobs}
+        selections = self.select_backgrounds(jobs, selector, durations)
+
+        if self.transcode_cache and selections:
+            # Chỉ transcode các clip batch này cần, lần sau dùng lại bản cache
+            needed = {clip.path: clip for selected in selections.values() for clip in selected}
+            self.transcode_cache.ingest(needed.values())
+
+        for name, selected in selections.items():
+            if self.transcode_cache:
+                plans[name] = self.transcode_cache.resolve(selected)
+            else:
+                plans[name] = [clip.path for clip in selected]
+        return plans
+
+    def skip_current(self, jobs: Dict[str, Dict[str, Optional[str]]]) -> Tuple[Dict[str, str], List[JobResult]]:
+        """Tính hash đầu vào của mọi job và tách các job đã render với đúng đầu vào này
+
+        Returns:
+            (map base_name -> fingerprint của các job cần render, kết quả của các job được bỏ qua)
+        """
+        def fingerprint_or_none(files):
+            try:
+                return self.manifest.fingerprint(files, self.subtitle_settings, self.encoder)
+            except OSError as e:
+                logger.error(f"Error hashing inputs: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            fingerprints = dict(zip(jobs, executor.map(fingerprint_or_none, jobs.values())))
+        self.manifest.save()  # Lưu cache hash file ngay cả khi batch bị dừng giữa chừng
+
+        pending = {}
+        skipped = []
+        for base_name, fingerprint in fingerprints.items():
+            output = fingerprint and self.manifest.output_if_current(base_name, fingerprint)
+            if output:
+                skipped.append(JobResult(base_name, True, output=output, skipped=True))
+            else:
+                pending[base_name] = fingerprint
+        if skipped:
+            logger.info(f"Skipping {len(skipped)} up-to-date jobs")
+        return pending, skipped
+
+    @staticmethod
+    def drain_progress(progress_queue, progress_callback):
+        """Chuyển các báo cáo tiến độ đang chờ trong queue cho progress_callback (trên thread gọi run)"""
+        if progress_queue is None:
+            return
+        while True:
+            try:
+                item = progress_queue.get_nowait()
+            except queue.Empty:
+                return
+            progress_callback(*item)
+
+    def record_speed(self, summary: BatchSummary, durations: Dict[str, Optional[float]], workers: int,
+                     job_count: int, elapsed: float):
+        """Lưu tốc độ của batch cho ConcurrencyController nếu lần đo có ý nghĩa
+
+        Batch có ít hơn 2 job mỗi worker chủ yếu đo thời gian chờ job dài nhất (worker khác ngồi
+        không), nên không được lưu. Tốc độ được lưu theo encoder đã thực sự encode; batch phải dùng
+        nhiều encoder khác nhau (dự phòng giữa chừng) không thuộc về encoder nào nên cũng bỏ qua.
+        """
+        if job_count < workers * 2:
+            logger.debug(f"Not recording speed: {job_count} jobs for {workers} workers")
+            return
+        rendered = [r for r in summary.results if r.success and not r.skipped]
+        used = {r.encoder for r in rendered if r.encoder}
+        if len(used) != 1:
+            logger.debug(f"Not recording speed: encoders used {sorted(used)}")
+            return
+        encoder = replace(self.encoder, name=used.pop())
+        media_seconds = sum(durations.get(r.base_name) or 0 for r in rendered)
+        self.concurrency.record(encoder, self.segments, workers, media_seconds, elapsed)
+
+    def run(self, jobs: Dict[str, Dict[str, Optional[str]]],
+            callback: Optional[Callable[[int, int, JobResult], None]] = None,
+            progress_callback: Optional[Callable] = None,
+            cancel_event=None) -> BatchSummary:
+        """Chạy tất cả job và gom kết quả
+
+        Args:
+            jobs: Map base_name -> files (từ BatchSettings.find_matching_files)
+            callback: Gọi sau mỗi job xong với (số job đã xong, tổng số job, kết quả)
+            progress_callback: Gọi với (base_name, percent, status, progress) khi job báo tiến độ;
+                progress là FfmpegProgress trong lúc encode, None ở các bước khác.
+                Cả hai callback đều được gọi trên thread đang chạy run()
+            cancel_event: threading.Event; khi được set, job chưa chạy bị bỏ và job đang chạy bị dừng
+        """
+        summary = BatchSummary()
+        total = len(jobs)
+        if not total:
+            return summary
+
+        start = time.perf_counter()
+        timer = StageTimer()
+
+        fingerprints = {}
+        if self.manifest:
+            with timer.stage("hash_inputs"):
+                fingerprints, skipped = self.skip_current(jobs)
+            for result in skipped:
+                summary.results.append(result)
+                if callback:
+                    callback(len(summary.results), total, result)
+            jobs = {name: jobs[name] for name in fingerprints}
+            if self.artifact_cache:
+                # Hash đầu vào vừa tính cho manifest được dùng lại làm khóa cache trong job
+                self.artifact_cache.remember_hashes(
+                    self.manifest.hashes_for(path for files in jobs.values() for path in files.values()))
+            if not jobs:
+                summary.elapsed = time.perf_counter() - start
+                summary.timings = timer.as_dict()
+                return summary
+
+        # Probe thư viện video nền và chọn clip một lần trước khi chia job
+        with timer.stage("job_durations"):
+            durations = self.get_job_durations(jobs)
+        with timer.stage("plan_backgrounds"):
+            backgrounds = self.plan_backgrounds(jobs, durations=durations)
+        # Pool nhận job theo thứ tự submit nên sắp xếp ở đây là đủ
+        jobs = {name: jobs[name] for name in self.job_order.sort(list(jobs), durations)}
+
+        encoder = self.encoder
+        cpu_slots = None
+        if self.concurrency:
+            budget = self.concurrency.plan(encoder, self.segments, len(jobs), self.max_workers)
+            workers = budget.workers
+            # Thread chỉ định trong settings được giữ nguyên, chỉ chia phần để ffmpeg tự chọn
+            encoder = replace(encoder, threads=encoder.threads or budget.threads,
+                              filter_threads=encoder.filter_threads or budget.filter_threads)
+            if budget.cpu_slots:
+                cpu_slots = multiprocessing.Queue()
+                for slot in budget.cpu_slots:
+                    cpu_slots.put(slot)
+        else:
+            workers = min(self.max_workers or default_workers(), len(jobs))
+            if self.segments > 1 and encoder.spec.cpu and not encoder.threads:
+                # Các đoạn của mọi job chạy cùng lúc chia nhau số core, không phải mỗi job lấy hết
+                encoder = replace(encoder, threads=max(1, available_cores() // (workers * self.segments)))
+        logger.info(f"Running {len(jobs)} jobs with {workers} workers")
+        render_start = time.perf_counter()
+
+        # Worker process (spawn trên Windows) không thừa hưởng cấu hình logging của process cha
+        log_level = logging.getLogger().getEffectiveLevel()
+        # Process con gửi tiến độ qua queue của Manager, process cha đọc giữa các lần chờ job.
+        # Event hủy cũng phải là của Manager để process con thấy được
+        manager = multiprocessing.Manager() if progress_callback or cancel_event else None
+        progress_queue = manager.Queue() if progress_callback else None
+        job_cancel = manager.Event() if cancel_event else None
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(log_level, cpu_slots)) as executor:
+                futures = {
+                    executor.submit(run_job, base_name, files, self.work_dir,
+                                    self.output_folder, self.video_folder,
+                                    self.subtitle_settings, backgrounds[base_name],
+                                    encoder, self.transcode_cache, self.segments,
+                                    self.artifact_cache, progress_queue, job_cancel, self.limits): base_name
+                    for base_name, files in jobs.items()
+                }
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                    self.drain_progress(progress_queue, progress_callback)
+                    if cancel_event is not None and cancel_event.is_set() and not job_cancel.is_set():
+                        logger.warning("Cancelling batch...")
+                        job_cancel.set()
+                        for future in pending:
+                            future.cancel()  # Job chưa bắt đầu thì không chạy nữa
+                    for future in done:
+                        try:
+                            result = future.result()
+                        except CancelledError:
+                            result = JobResult(futures[future], False, error="Cancelled")
+                        except Exception as e:
+                            # Process con bị chết (ví dụ: hết RAM) thì vẫn ghi nhận lỗi
+                            result = JobResult(futures[future], False, error=str(e))
+                        if result.success and fingerprints.get(result.base_name):
+                            # Ghi ngay sau mỗi job để batch bị dừng giữa chừng vẫn không phải render lại
+                            self.manifest.record(result.base_name, fingerprints[result.base_name], result.output)
+                            self.manifest.save()
+                        summary.results.append(result)
+                        if callback:
+                            callback(len(summary.results), total, result)
+        finally:
+            if manager:
+                manager.shutdown()
+
+        if self.concurrency and not (cancel_event is not None and cancel_event.is_set()):
+            self.record_speed(summary, durations, workers, len(jobs), time.perf_counter() - render_start)
+
+        summary.elapsed = time.perf_counter() - start
+        summary.timings = timer.as_dict()
+        if self.report_dir:
+            try:
+                write_batch_report(summary, self.report_dir, {
+                    'batch_stages': summary.timings,
+                    'workers': workers,
+                    'segments': self.segments,
+                    'encoder': asdict(encoder),
+                })
+            except Exception as e:
+                logger.error(f"Error writing performance report: {e}")
+        logger.info(f"Batch finished: {len(summary.succeeded)}/{total} rendered, "
+                    f"{len(summary.skipped)} up to date, {len(summary.failed)} failed "
+                    f"in {summary.elapsed:.1f}s ({summary.videos_per_hour:.1f} videos/hour)")
+        return summary
@@ -1,11 +1,30 @@
 import json
 import os
-from typing import Dict, Optional
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3')
+SUBTITLE_EXTENSIONS = ('.srt',)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Vai trò -> (key trong "suffixes", các đuôi file hợp lệ)
+ROLE_RULES = {
+    "audio": ("audio", AUDIO_EXTENSIONS),
+    "hook": ("hook", AUDIO_EXTENSIONS),
+    "subtitle": ("subtitle", SUBTITLE_EXTENSIONS),
+    "hook_subtitle": ("hook_subtitle", SUBTITLE_EXTENSIONS),
+    "thumbnail": ("thumbnail", IMAGE_EXTENSIONS),
+}
 
 class BatchSettings:
     def __init__(self, settings_file: str = "batch_settings.json"):
         self.settings_file = settings_file
         self.settings = self.load_settings()
+        self.index = None  # base name -> files của lần quét input folder gần nhất
+        self.index_key = None  # (input folder, suffixes) lúc quét, đổi thì phải quét lại
+        self.problems: List[str] = []  # Bộ file nhập nhằng hoặc thiếu của lần quét gần nhất
         
     def load_settings(self) -> Dict:
         """Load settings from file"""
@@ -20,6 +39,63 @@ class BatchSettings:
             "output_folder": "",
             "video_folder": "",
             "preset_name": "",
+            "max_workers": 0,  # 0 = auto (xem mục concurrency)
+            "log_level": "INFO",  # DEBUG để in chi tiết từng subtitle event
+            "background_seed": None,  # Seed chọn clip nền, None = ngẫu nhiên
+            "encoder": {
+                "name": "nvenc",      # nvenc | x264 | x265 | av1
+                "speed": "quality",   # fast | balanced | quality
+                "crf": None,
+                "bitrate": None,
+                "threads": 0
+            },
+            "segments": 1,  # > 1: chia mỗi video thành nhiều đoạn encode song song (encoder CPU)
+            "incremental": True,  # Bỏ qua job có đầu vào không đổi (xem batch_manifest.py)
+            "report_dir": "",  # Thư mục ghi báo cáo thời gian từng stage, mặc định <output>/reports
+            "transcode_cache": {
+                "enabled": False,  # Transcode clip nền về 1080x1920/30fps một lần rồi dùng lại
+                "dir": "",         # Mặc định: cache/clips trong thư mục hiện tại
+                "max_gb": 50,
+                "workers": 2,
+                "evict_grace_seconds": 86400  # Không xóa clip dùng trong 24 giờ qua (batch đang chạy có thể cần)
+            },
+            "artifact_cache": {
+                "enabled": False,  # Dùng lại audio đã ghép và file ASS khi đầu vào không đổi
+                "dir": "",         # Mặc định: cache/artifacts trong thư mục hiện tại
+                "max_gb": 10,
+                "evict_grace_seconds": 3600  # Không xóa artifact vừa được dùng (job khác có thể đang đọc)
+            },
+            "job_order": {
+                "policy": "name",  # name | shortest_first | longest_first
+                "priorities": {}   # Pattern base name -> priority, số lớn chạy trước, ví dụ {"short_*": 10}
+            },
+            "concurrency": {
+                "auto": True,               # Chọn số job song song và thread mỗi job theo core/RAM/tốc độ đo được
+                "max_threads_per_job": 8,   # Trần số thread encoder của một job
+                "memory_per_job_mb": 1500,  # RAM ước tính của một job, dùng để giới hạn số job song song
+                "reserve_memory_mb": 1024,
+                "gpu_sessions": 3,          # Số job NVENC song song tối đa
+                "affinity": False,          # Gắn mỗi worker vào một nhóm core riêng (Linux)
+                "state_file": ""            # Tốc độ đã đo, mặc định cache/concurrency.json
+            },
+            "timeouts": {
+                "stage_seconds": 0,    # Thời gian tối đa của mỗi lệnh ffmpeg, 0 = không giới hạn
+                "job_seconds": 0,      # Thời gian tối đa của cả job, 0 = không giới hạn
+                "stall_seconds": 120,  # ffmpeg không tiến triển quá chừng này giây thì bị dừng
+                "probe_seconds": 60,
+                "retries": 1,          # Chạy lại lệnh bị timeout/treo, chờ retry_backoff giây (gấp đôi mỗi lần)
+                "retry_backoff": 5
+            },
+            "watch": {
+                "settle_seconds": 10,  # File không đổi trong chừng này giây thì coi là đã ghi xong
+                "poll_seconds": 5,     # Chu kỳ quét lại input folder (có inotify thì phản hồi ngay)
+                "require": ["audio", "subtitle"]  # Vai trò bắt buộc trước khi render, ví dụ thêm "hook"
+            },
+            "queue": {
+                "path": "",            # Đường dẫn jobs.db trên thư mục share, mặc định ./jobs.db
+                "lease_seconds": 600,  # Worker không heartbeat quá thời gian này thì job được nhận lại
+                "max_attempts": 3
+            },
             "suffixes": {
                 "audio": "_audio",  # Required
                 "hook": "_hook",    # Optional
@@ -37,8 +113,79 @@ class BatchSettings:
         except Exception as e:
             print(f"Error saving settings: {e}")
             
+    def index_key_for_settings(self):
+        """(input folder, suffixes chữ thường) hiện tại; subtitle mặc định dùng chung suffix với audio/hook"""
+        suffixes = {k: (v or "").lower() for k, v in self.settings["suffixes"].items()}
+        suffixes.setdefault("subtitle", suffixes.get("audio"))
+        suffixes.setdefault("hook_subtitle", suffixes.get("hook"))
+        return self.settings["input_folder"], tuple(sorted(suffixes.items()))
+
+    def scan_input_folder(self, log_problems: bool = True) -> Dict[str, Dict[str, Optional[str]]]:
+        """Đọc input folder một lần (os.scandir) và lập index base name -> file của từng vai trò
+
+        Quy tắc khớp giống như trước: file thuộc vai trò nếu tên (không phân biệt hoa thường) chứa
+        suffix của vai trò và có đuôi phù hợp; base name là phần đứng trước suffix. Nếu nhiều file
+        cùng khớp một vai trò thì ưu tiên file đúng tên <base><suffix>.<ext>, sau đó theo thứ tự tên.
+        Bộ file nhập nhằng hoặc thiếu được ghi vào self.problems và log ngay khi quét
+        (log_problems=False khi quét lặp lại liên tục, ví dụ watch folder).
+
+        Returns:
+            Dictionary base name (chữ thường) -> dictionary file types và paths
+        """
+        input_folder, suffixes = self.index_key_for_settings()
+        suffixes = dict(suffixes)
+        candidates: Dict[str, Dict[str, List[str]]] = {}
+
+        if input_folder and os.path.isdir(input_folder):
+            with os.scandir(input_folder) as entries:
+                names = sorted(entry.name for entry in entries if entry.is_file())
+            for file in names:
+                file_lower = file.lower()
+                extension = os.path.splitext(file_lower)[1]
+                for role, (suffix_key, extensions) in ROLE_RULES.items():
+                    suffix = suffixes.get(suffix_key)
+                    if not suffix or extension not in extensions or suffix not in file_lower:
+                        continue
+                    base_name = file_lower.split(suffix)[0]
+                    candidates.setdefault(base_name, {}).setdefault(role, []).append(file)
+
+        index = {}
+        problems = []
+        for base_name, roles in sorted(candidates.items()):
+            files = dict.fromkeys(ROLE_RULES)
+            for role, matches in roles.items():
+                suffix = suffixes[ROLE_RULES[role][0]]
+                # File đúng tên chuẩn (KB2_audio.wav) đứng trước các bản phụ (KB2_audio_old.wav)
+                matches.sort(key=lambda name: os.path.splitext(name.lower())[0] != base_name + suffix)
+                files[role] = os.path.join(input_folder, matches[0])
+                if len(matches) > 1:
+                    problems.append(f"{base_name}: {len(matches)} files match {role} "
+                                    f"({', '.join(matches)}), using {matches[0]}")
+            index[base_name] = files
+
+            if not files["audio"]:
+                problems.append(f"{base_name}: no audio file, ignoring "
+                                f"{', '.join(os.path.basename(p) for p in files.values() if p)}")
+                continue
+            if not files["subtitle"]:
+                problems.append(f"{base_name}: no subtitle file")
+            if files["hook"] and not files["hook_subtitle"]:
+                problems.append(f"{base_name}: hook audio without hook subtitle")
+            if files["hook_subtitle"] and not files["hook"]:
+                problems.append(f"{base_name}: hook subtitle without hook audio")
+
+        if log_problems:
+            for problem in problems:
+                logger.warning(problem)
+        self.index = index
+        self.index_key = self.index_key_for_settings()
+        self.problems = problems
+        return index
+
     def find_matching_files(self, base_name: str) -> Dict[str, Optional[str]]:
         """Find all matching files for a given base name, case insensitive
+
+        Dùng index của lần quét gần nhất (quét lại nếu input folder hoặc suffix đã đổi).
         
         Args:
             base_name: Base name of the file set (e.g. 'KB2' for 'KB2_audio.wav')
@@ -46,62 +193,15 @@ class BatchSettings:
         Returns:
             Dictionary of file types and their paths
         """
-        input_folder = self.settings["input_folder"]
-        suffixes = self.settings["suffixes"]
-        
-        result = {
-            "audio": None,
-            "hook": None,
-            "subtitle": None,
-            "hook_subtitle": None,
-            "thumbnail": None
-        }
-        
-        # Convert base name and suffixes to lower case for comparison
-        base_name_lower = base_name.lower()
-        suffix_map = {k: v.lower() for k, v in suffixes.items()}
-        
-        # Find all matching files
-        for file in os.listdir(input_folder):
-            file_path = os.path.join(input_folder, file)
-            file_lower = file.lower()
-            
-            # Required: Audio file
-            if file_lower.startswith(base_name_lower + suffix_map["audio"]):
-                if file_lower.endswith(('.wav', '.mp3')):
-                    result["audio"] = file_path
-                elif file_lower.endswith('.srt'):
-                    result["subtitle"] = file_path
-                    
-            # Optional: Hook files
-            if suffix_map["hook"] and file_lower.startswith(base_name_lower + suffix_map["hook"]):
-                if file_lower.endswith(('.wav', '.mp3')):
-                    result["hook"] = file_path
-                elif file_lower.endswith('.srt'):
-                    result["hook_subtitle"] = file_path
-                    
-            # Optional: Thumbnail
-            if suffix_map["thumbnail"] and file_lower.startswith(base_name_lower + suffix_map["thumbnail"]):
-                if file_lower.endswith(('.png', '.jpg', '.jpeg')):
-                    result["thumbnail"] = file_path
-        
-        return result
+        index = self.index
+        if index is None or self.index_key != self.index_key_for_settings():
+            index = self.scan_input_folder()
+        return dict(index.get(base_name.lower()) or dict.fromkeys(ROLE_RULES))
         
     def get_base_names(self) -> list:
-        """Get all unique base names from the input folder, case insensitive"""
-        input_folder = self.settings["input_folder"]
-        if not input_folder or not os.path.exists(input_folder):
-            return []
-            
-        # Get all audio files (required)
-        audio_suffix = self.settings["suffixes"]["audio"].lower()
-        base_names = set()
-        
-        for file in os.listdir(input_folder):
-            file_lower = file.lower()
-            if file_lower.endswith(('.wav', '.mp3')) and audio_suffix in file_lower:
-                # Remove suffix and extension to get base name
-                base_name = file_lower.split(audio_suffix)[0]
-                base_names.add(base_name)
-                
-        return sorted(list(base_names))
+        """Get all unique base names from the input folder, case insensitive
+
+        Mỗi lần gọi quét lại input folder một lần; find_matching_files sau đó dùng index này.
+        """
+        index = self.scan_input_folder()
+        return [base_name for base_name, files in index.items() if files["audio"]]
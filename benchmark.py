@@ -0,0 +1,248 @@
+"""Benchmark pipeline render với dữ liệu tổng hợp (không cần file thật)
+
+    python -m benchmark --quick                          # chạy nhanh vài kịch bản nhỏ
+    python -m benchmark --save-baseline bench_base.json  # lưu kết quả làm baseline
+    python -m benchmark --baseline bench_base.json       # so sánh, exit code 1 nếu chậm đi
+
+Audio (tone hoặc nhiễu điều biến giống giọng nói), SRT, thư viện video nền (test pattern) và
+thumbnail đều được tạo bằng ffmpeg lavfi trong thư mục benchmark và dùng lại giữa các lần chạy.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import subprocess
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from ffmpeg_utils import OUTPUT_FPS, OUTPUT_HEIGHT, OUTPUT_WIDTH
+from log_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.15   # Chậm hơn baseline quá 15% thì coi là regression
+MIN_REGRESSION_SECONDS = 0.05  # Bỏ qua chênh lệch nhỏ hơn mức nhiễu đo
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua").split()
+
+
+@dataclass
+class Scenario:
+    name: str
+    audio_seconds: float
+    hook_seconds: float = 5.0
+    library_size: int = 5
+    clip_seconds: float = 20.0
+    srt_events_per_minute: int = 20
+    audio_format: str = "wav"  # wav | mp3
+    audio_kind: str = "speech"  # tone | speech
+    thumbnail: bool = True
+
+
+QUICK_SCENARIOS = [
+    Scenario("short_wav", 30, library_size=3),
+    Scenario("short_mp3", 30, library_size=3, audio_format="mp3"),
+]
+
+DEFAULT_SCENARIOS = QUICK_SCENARIOS + [
+    Scenario("medium_lib10", 120, library_size=10),
+    Scenario("medium_lib50", 120, library_size=50, clip_seconds=10),
+    Scenario("long_dense_srt", 600, library_size=20, srt_events_per_minute=60),
+]
+
+
+def run_ffmpeg_quiet(args: List[str]):
+    subprocess.run(['ffmpeg', '-y', '-v', 'error'] + args, check=True)
+
+
+def generate_audio(path: str, duration: float, kind: str = "speech"):
+    """Tạo audio mono 44.1kHz: tone 440Hz hoặc nhiễu hồng điều biến ~4Hz (nhịp âm tiết giống giọng nói)"""
+    if os.path.exists(path):
+        return path
+    if kind == "tone":
+        source = f"sine=frequency=440:sample_rate=44100:duration={duration}"
+        filters = []
+    else:
+        source = f"anoisesrc=color=pink:sample_rate=44100:duration={duration}"
+        filters = ['-af', "volume='0.2+0.8*abs(sin(2*PI*2*t))':eval=frame"]
+    codec = ['-c:a', 'libmp3lame', '-b:a', '128k'] if path.endswith('.mp3') else ['-c:a', 'pcm_s16le']
+    run_ffmpeg_quiet(['-f', 'lavfi', '-i', source] + filters + ['-ac', '1'] + codec + [path])
+    return path
+
+
+def _srt_time(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    s, ms = divmod(ms, 1000)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def generate_srt(path: str, duration: float, events_per_minute: int, words_per_event: int = 12):
+    """Tạo SRT phủ đều thời lượng, mỗi event đủ dài để bị ngắt dòng theo max_chars"""
+    count = max(1, int(duration * events_per_minute / 60))
+    step = duration / count
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            start = i * step
+            text = ' '.join(WORDS[(i + j) % len(WORDS)] for j in range(words_per_event))
+            f.write(f"{i + 1}\n{_srt_time(start)} --> {_srt_time(start + step * 0.9)}\n{text}\n\n")
+    return path
+
+
+def generate_library(folder: str, count: int, clip_seconds: float) -> str:
+    """Tạo thư viện clip test pattern dọc, mỗi clip một pattern/màu khác nhau"""
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        path = os.path.join(folder, f"clip_{i:03d}.mp4")
+        if os.path.exists(path):
+            continue
+        source = (f"testsrc2=size={OUTPUT_WIDTH}x{OUTPUT_HEIGHT}:rate={OUTPUT_FPS}:duration={clip_seconds},"
+                  f"hue=h={i * 37 % 360}")
+        run_ffmpeg_quiet(['-f', 'lavfi', '-i', source, '-c:v', 'libx264', '-preset', 'ultrafast',
+                          '-pix_fmt', 'yuv420p', '-g', str(OUTPUT_FPS * 2), path])
+    return folder
+
+
+def generate_thumbnail(path: str):
+    if not os.path.exists(path):
+        run_ffmpeg_quiet(['-f', 'lavfi', '-i', 'testsrc=size=1280x720:rate=1', '-frames:v', '1', path])
+    return path
+
+
+def prepare_inputs(scenario: Scenario, media_dir: str) -> Dict[str, Optional[str]]:
+    """Tạo (hoặc dùng lại) toàn bộ đầu vào của một kịch bản"""
+    os.makedirs(media_dir, exist_ok=True)
+    tag = f"{scenario.audio_kind}_{scenario.audio_seconds:g}"
+    audio = generate_audio(os.path.join(media_dir, f"audio_{tag}.{scenario.audio_format}"),
+                           scenario.audio_seconds, scenario.audio_kind)
+    hook = None
+    hook_srt = None
+    if scenario.hook_seconds > 0:
+        hook = generate_audio(os.path.join(media_dir, f"hook_{scenario.audio_kind}_{scenario.hook_seconds:g}."
+                                           f"{scenario.audio_format}"),
+                              scenario.hook_seconds, scenario.audio_kind)
+        hook_srt = generate_srt(os.path.join(media_dir, f"hook_{scenario.hook_seconds:g}_"
+                                             f"{scenario.srt_events_per_minute}.srt"),
+                                scenario.hook_seconds, scenario.srt_events_per_minute)
+    subtitle = generate_srt(os.path.join(media_dir, f"audio_{scenario.audio_seconds:g}_"
+                                         f"{scenario.srt_events_per_minute}.srt"),
+                            scenario.audio_seconds, scenario.srt_events_per_minute)
+    library = generate_library(os.path.join(media_dir, f"library_{scenario.library_size}_"
+                                            f"{scenario.clip_seconds:g}"),
+                               scenario.library_size, scenario.clip_seconds)
+    thumbnail = generate_thumbnail(os.path.join(media_dir, "thumbnail.png")) if scenario.thumbnail else None
+    return {"audio": audio, "hook": hook, "subtitle": subtitle, "hook_subtitle": hook_srt,
+            "thumbnail": thumbnail, "video_folder": library}
+
+
+def run_scenario(scenario: Scenario, bench_dir: str, encoder, repeat: int = 3, segments: int = 1) -> Dict:
+    """Chạy process_video nhiều lần cho một kịch bản, trả về median/min của tổng và từng stage"""
+    from subtitle_settings import SubtitleSettings
+    from video_processor import VideoProcessor
+
+    inputs = prepare_inputs(scenario, os.path.join(bench_dir, "media"))
+    output_folder = os.path.join(bench_dir, "output")
+    os.makedirs(output_folder, exist_ok=True)
+
+    totals = []
+    stages: Dict[str, List[float]] = {}
+    for run in range(repeat):
+        processor = VideoProcessor(os.path.join(bench_dir, "work"), output_folder, encoder, segments=segments)
+        start = time.perf_counter()
+        output = processor.process_video(
+            inputs["hook"], inputs["audio"], inputs["hook_subtitle"], inputs["subtitle"],
+            inputs["thumbnail"], inputs["video_folder"], SubtitleSettings()
+        )
+        elapsed = time.perf_counter() - start
+        if not output:
+            raise Exception(f"Scenario {scenario.name} failed to render")
+        os.remove(output)
+        totals.append(elapsed)
+        for name, values in processor.timer.as_dict().items():
+            stages.setdefault(name, []).append(values['wall'])
+        logger.info(f"{scenario.name} run {run + 1}/{repeat}: {elapsed:.2f}s")
+
+    def stats(values: List[float]) -> Dict[str, float]:
+        return {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+
+    return {
+        'scenario': asdict(scenario),
+        'total': stats(totals),
+        'realtime_factor': (scenario.audio_seconds + scenario.hook_seconds) / statistics.median(totals),
+        'stages': {name: stats(values) for name, values in stages.items()},
+    }
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """So sánh median wall time với baseline, trả về danh sách regression (rỗng nếu không có)"""
+    regressions = []
+    for name, result in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        metrics = [('total', result['total'], base['total'])] + [
+            (stage, values, base['stages'][stage])
+            for stage, values in result['stages'].items() if stage in base.get('stages', {})
+        ]
+        for metric, current, previous in metrics:
+            delta = current['median'] - previous['median']
+            if delta > MIN_REGRESSION_SECONDS and current['median'] > previous['median'] * (1 + threshold):
+                regressions.append(f"{name}/{metric}: {previous['median']:.3f}s -> {current['median']:.3f}s "
+                                   f"(+{delta / previous['median'] * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Render pipeline benchmark")
+    parser.add_argument("--dir", default=os.path.join(os.getcwd(), "bench"), help="Benchmark working folder")
+    parser.add_argument("--quick", action="store_true", help="Only run the small scenarios")
+    parser.add_argument("--scenario", action="append", help="Run only these scenarios (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--encoder", default="x264", help="Encoder name (nvenc/x264/x265/av1)")
+    parser.add_argument("--speed", default="fast", help="Encoder speed preset")
+    parser.add_argument("--segments", type=int, default=1)
+    parser.add_argument("--baseline", help="Compare against this results file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--save-baseline", help="Also write the results to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    setup_logging(args.log_level)
+    scenarios = QUICK_SCENARIOS if args.quick else DEFAULT_SCENARIOS
+    if args.scenario:
+        scenarios = [s for s in DEFAULT_SCENARIOS if s.name in args.scenario]
+
+    encoder = {"name": args.encoder, "speed": args.speed}
+    results = {'created': time.time(), 'encoder': encoder, 'segments': args.segments, 'scenarios': {}}
+    for scenario in scenarios:
+        result = run_scenario(scenario, args.dir, encoder, args.repeat, args.segments)
+        results['scenarios'][scenario.name] = result
+        stage_text = ', '.join(f"{k} {v['median']:.2f}s" for k, v in result['stages'].items())
+        print(f"{scenario.name}: {result['total']['median']:.2f}s "
+              f"({result['realtime_factor']:.1f}x realtime) [{stage_text}]")
+
+    os.makedirs(os.path.join(args.dir, "results"), exist_ok=True)
+    results_path = os.path.join(args.dir, "results", f"bench_{int(time.time())}.json")
+    for path in filter(None, [results_path, args.save_baseline]):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    print(f"Results written to {results_path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import random
+from typing import Dict, List, Optional
+
+from media_index import ClipInfo
+
+
+class ClipSelector:
+    """Chọn ngẫu nhiên một tập clip nền vừa đủ phủ thời lượng audio, dư ít nhất có thể
+
+    Mỗi lần chọn thử nhiều phương án ngẫu nhiên rồi giữ phương án có điểm thấp nhất:
+        điểm = thời lượng dư (giây) + usage_weight * tổng số lần các clip đã được dùng
+    Số lần dùng được đếm trên cả batch để các clip được dùng đều nhau.
+    Cùng seed + cùng thứ tự gọi select() thì cho cùng kết quả.
+    """
+
+    def __init__(self, seed: Optional[int] = None, trials: int = 32, usage_weight: float = 1.0):
+        self.rng = random.Random(seed)
+        self.trials = trials
+        self.usage_weight = usage_weight
+        self.usage: Dict[str, int] = {}
+
+    def _score(self, selected: List[ClipInfo], total_duration: float) -> float:
+        overhang = sum(c.duration for c in selected) - total_duration
+        return overhang + self.usage_weight * sum(self.usage.get(c.path, 0) for c in selected)
+
+    def _trial(self, clips: List[ClipInfo], total_duration: float) -> List[ClipInfo]:
+        # Ưu tiên clip ít được dùng, trong cùng mức thì ngẫu nhiên
+        order = sorted(clips, key=lambda c: (self.usage.get(c.path, 0), self.rng.random()))
+
+        selected = []
+        remaining = total_duration
+        pool = list(order)
+        while remaining > 0 and pool:
+            if pool[0].duration < remaining:
+                # Clip tiếp theo chưa phủ hết: lấy theo thứ tự ngẫu nhiên
+                clip = pool.pop(0)
+            else:
+                # Slot cuối: chọn clip dư ít nhất (best fit), có tính điểm usage
+                clip = min((c for c in pool if c.duration >= remaining),
+                           key=lambda c: (c.duration - remaining)
+                           + self.usage_weight * self.usage.get(c.path, 0))
+                pool.remove(clip)
+            selected.append(clip)
+            remaining -= clip.duration
+
+        # Bỏ bớt clip thừa nếu vẫn đủ thời lượng (clip dài nhất có thể bỏ trước)
+        overhang = -remaining
+        for clip in sorted(selected, key=lambda c: -c.duration):
+            if clip.duration <= overhang:
+                selected.remove(clip)
+                overhang -= clip.duration
+
+        return selected
+
+    def select(self, clips: List[ClipInfo], total_duration: float) -> List[ClipInfo]:
+        """Chọn danh sách clip (đã xáo trộn thứ tự phát) và ghi nhận số lần sử dụng
+
+        Args:
+            clips: Các clip hợp lệ trong thư viện (từ MediaIndex)
+            total_duration: Thời lượng cần phủ (giây)
+        """
+        if not clips:
+            return []
+        # Thứ tự đầu vào (index, listdir) có thể khác giữa các lần chạy; cố định để cùng seed cho cùng kết quả
+        clips = sorted(clips, key=lambda c: c.path)
+
+        if sum(c.duration for c in clips) <= total_duration:
+            # Không đủ footage: dùng hết như trước đây
+            best = list(clips)
+        else:
+            best, best_score = None, None
+            for _ in range(self.trials):
+                candidate = self._trial(clips, total_duration)
+                score = self._score(candidate, total_duration)
+                if best_score is None or score < best_score:
+                    best, best_score = candidate, score
+
+        self.rng.shuffle(best)
+        for clip in best:
+            self.usage[clip.path] = self.usage.get(clip.path, 0) + 1
+        return best
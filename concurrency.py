@@ -0,0 +1,182 @@
+import os
+import json
+import socket
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = os.path.join(os.getcwd(), "cache", "concurrency.json")
+MAX_THREADS_PER_JOB = 8    # x264/x265 ở 1080x1920 gần như không nhanh thêm khi vượt quá số thread này
+MEMORY_PER_JOB_MB = 1500   # RAM ước tính của một ffmpeg encode 1080x1920 (decode + filter + encoder)
+RESERVE_MEMORY_MB = 1024   # Chừa lại cho hệ điều hành và GUI
+GPU_SESSIONS = 3           # Số phiên NVENC song song an toàn trên card phổ thông
+SPEED_SMOOTHING = 0.5      # Trọng số của lần đo mới khi cập nhật tốc độ đã lưu
+
+
+@dataclass
+class JobBudget:
+    """Tài nguyên của một job: số job song song và số thread của mỗi lệnh ffmpeg"""
+    workers: int
+    threads: int                          # -threads của encoder (chia tiếp cho segment nếu có)
+    filter_threads: int                   # -filter_complex_threads
+    cpu_slots: Optional[List[List[int]]] = None  # Tập CPU của từng worker nếu bật affinity
+
+
+def available_cores() -> int:
+    """Số core process được phép dùng (tôn trọng taskset/cgroup nếu có)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def available_memory_mb() -> Optional[float]:
+    """MemAvailable trong /proc/meminfo (MB), None nếu không đọc được (Windows, macOS)"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class ConcurrencyController:
+    """Chọn số job chạy song song và chia thread cho mỗi job theo tài nguyên của máy
+
+    Số job bị giới hạn bởi số core, RAM còn trống và (encoder GPU) số phiên NVENC. Trong giới
+    hạn đó, tốc độ encode đo được của mỗi batch (giây video trên giây thực) được lưu theo máy và
+    encoder; batch sau dùng mức song song nhanh nhất đã biết và thử dần các mức lân cận chưa đo,
+    nên sau vài batch sẽ tự về mức tối ưu mà không phải chỉnh tay.
+    """
+
+    def __init__(self, state_file: str = DEFAULT_STATE_FILE, max_threads_per_job: int = MAX_THREADS_PER_JOB,
+                 memory_per_job_mb: float = MEMORY_PER_JOB_MB, reserve_memory_mb: float = RESERVE_MEMORY_MB,
+                 gpu_sessions: int = GPU_SESSIONS, affinity: bool = False):
+        self.state_file = state_file
+        self.max_threads_per_job = max(1, max_threads_per_job)
+        self.memory_per_job_mb = memory_per_job_mb
+        self.reserve_memory_mb = reserve_memory_mb
+        self.gpu_sessions = max(1, gpu_sessions)
+        self.affinity = affinity and hasattr(os, 'sched_setaffinity')
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict]) -> Optional["ConcurrencyController"]:
+        """Tạo từ mục 'concurrency' trong batch_settings.json, None nếu bị tắt"""
+        settings = settings or {}
+        if not settings.get("auto", True):
+            return None
+        return cls(
+            state_file=settings.get("state_file") or DEFAULT_STATE_FILE,
+            max_threads_per_job=int(settings.get("max_threads_per_job", MAX_THREADS_PER_JOB)),
+            memory_per_job_mb=float(settings.get("memory_per_job_mb", MEMORY_PER_JOB_MB)),
+            reserve_memory_mb=float(settings.get("reserve_memory_mb", RESERVE_MEMORY_MB)),
+            gpu_sessions=int(settings.get("gpu_sessions", GPU_SESSIONS)),
+            affinity=bool(settings.get("affinity", False)),
+        )
+
+    @staticmethod
+    def history_key(encoder, segments: int) -> str:
+        return f"{socket.gethostname()}|{encoder.name}|{encoder.speed}|{segments}"
+
+    def load_history(self) -> Dict[str, Dict[str, float]]:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def max_workers(self, encoder, job_count: int) -> int:
+        """Giới hạn trên của số job song song theo core, RAM và loại encoder"""
+        cores = available_cores()
+        limit = cores if encoder.spec.cpu else min(cores, self.gpu_sessions)
+        memory = available_memory_mb()
+        if memory is not None:
+            limit = min(limit, int((memory - self.reserve_memory_mb) // self.memory_per_job_mb))
+        return max(1, min(limit, job_count))
+
+    def choose_workers(self, encoder, segments: int, job_count: int) -> int:
+        """Mức song song cho batch tiếp theo: nhanh nhất đã đo, hoặc mức lân cận chưa đo"""
+        limit = self.max_workers(encoder, job_count)
+        measured = {int(w): speed for w, speed in
+                    self.load_history().get(self.history_key(encoder, segments), {}).items()
+                    if int(w) <= limit}
+        if not measured:
+            if encoder.spec.cpu:
+                start = available_cores() // (self.max_threads_per_job * max(1, segments))
+            else:
+                start = 2  # Một job decode/filter trong lúc job kia dùng GPU
+            return max(1, min(limit, start))
+
+        best = max(measured, key=measured.get)
+        for candidate in (best + 1, best - 1):
+            if 1 <= candidate <= limit and candidate not in measured:
+                return candidate
+        return best
+
+    def plan(self, encoder, segments: int, job_count: int, workers: Optional[int] = None) -> JobBudget:
+        """Tính JobBudget cho một batch
+
+        Args:
+            encoder: EncoderProfile của batch
+            segments: Số đoạn encode song song trong mỗi job
+            workers: Số job song song cố định (người dùng chỉ định), None = tự chọn
+        """
+        cores = available_cores()
+        segments = max(1, segments)
+        workers = max(1, min(workers or self.choose_workers(encoder, segments, job_count), job_count))
+        if self.affinity and workers > cores:
+            # Mỗi worker cần ít nhất một CPU riêng khi bị pin
+            logger.warning(f"{workers} parallel jobs requested but only {cores} cores, using {cores}")
+            workers = cores
+        per_job = max(1, cores // workers)
+        threads = max(1, min(self.max_threads_per_job, per_job // segments))
+        # Filter graph (libass, overlay) nhẹ hơn encode nhiều; mặc định ffmpeg dùng mọi core cho mỗi job
+        filter_threads = max(1, min(4, per_job // 2))
+
+        cpu_slots = None
+        if self.affinity and workers > 1:
+            cpus = sorted(os.sched_getaffinity(0))
+            cpu_slots = [cpus[i * per_job:(i + 1) * per_job] for i in range(workers)]
+
+        logger.info(f"Concurrency: {workers} jobs x {threads} encoder threads "
+                    f"({filter_threads} filter threads) on {cores} cores"
+                    f"{', pinned' if cpu_slots else ''}")
+        return JobBudget(workers, threads, filter_threads, cpu_slots)
+
+    def record(self, encoder, segments: int, workers: int, media_seconds: float, elapsed: float):
+        """Lưu tốc độ đo được (giây video render được trên mỗi giây thực) của một batch"""
+        if media_seconds <= 0 or elapsed <= 0:
+            return
+        speed = media_seconds / elapsed
+        with self.lock:
+            history = self.load_history()
+            entry = history.setdefault(self.history_key(encoder, segments), {})
+            previous = entry.get(str(workers))
+            entry[str(workers)] = speed if previous is None else \
+                previous + SPEED_SMOOTHING * (speed - previous)
+            tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(history, f, indent=2)
+                os.replace(tmp_path, self.state_file)
+            except OSError as e:
+                logger.error(f"Error saving concurrency history: {e}")
+        logger.info(f"Measured {speed:.2f}x realtime with {workers} parallel jobs")
+
+
+def pin_worker(cpu_slots):
+    """Initializer của worker process: lấy một tập CPU từ queue và chỉ chạy trên đó (ffmpeg con thừa hưởng)"""
+    if cpu_slots is None:
+        return
+    try:
+        cpus = cpu_slots.get(timeout=1)
+        os.sched_setaffinity(0, cpus)
+        logger.debug(f"Worker {os.getpid()} pinned to CPUs {cpus}")
+    except Exception as e:
+        logger.warning(f"Could not pin worker to CPUs: {e}")
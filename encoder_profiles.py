@@ -0,0 +1,189 @@
+import logging
+import subprocess
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Union
+
+from ffmpeg_utils import ProcessLimits, run_process
+
+logger = logging.getLogger(__name__)
+
+SPEEDS = ("fast", "balanced", "quality")
+
+
+@dataclass(frozen=True)
+class EncoderSpec:
+    codec: str                   # Tên encoder trong ffmpeg
+    presets: Dict[str, str]      # speed -> giá trị của option preset
+    preset_option: str = "-preset"
+    default_crf: Optional[int] = None
+    default_bitrate: Optional[str] = None
+    crf_option: str = "-crf"
+    hwaccel: Optional[str] = None
+    cpu: bool = True
+
+
+ENCODERS: Dict[str, EncoderSpec] = {
+    "nvenc": EncoderSpec(
+        codec="h264_nvenc",
+        presets={"fast": "p2", "balanced": "p5", "quality": "p7"},
+        default_bitrate="5M",
+        crf_option="-cq",
+        hwaccel="cuda",
+        cpu=False,
+    ),
+    "x264": EncoderSpec(
+        codec="libx264",
+        presets={"fast": "veryfast", "balanced": "medium", "quality": "slow"},
+        default_crf=23,
+    ),
+    "x265": EncoderSpec(
+        codec="libx265",
+        presets={"fast": "veryfast", "balanced": "medium", "quality": "slow"},
+        default_crf=28,
+    ),
+    "av1": EncoderSpec(
+        codec="libsvtav1",
+        presets={"fast": "10", "balanced": "8", "quality": "5"},
+        default_crf=35,
+    ),
+}
+
+# Thứ tự thử lại khi encoder được chọn không có hoặc bị lỗi lúc chạy (ví dụ: máy không có GPU)
+FALLBACK_ORDER = ["x264", "x265", "av1"]
+
+
+@dataclass
+class EncoderProfile:
+    name: str = "nvenc"          # Key trong ENCODERS
+    speed: str = "quality"       # fast | balanced | quality
+    crf: Optional[int] = None    # Ưu tiên CRF/CQ nếu có
+    bitrate: Optional[str] = None  # Ví dụ: '5M'. Không có CRF/bitrate thì dùng mặc định của encoder
+    threads: int = 0             # 0 = để ffmpeg tự chọn
+    filter_threads: int = 0      # Thread của filter graph (-filter_complex_threads), 0 = mọi core
+
+    @property
+    def spec(self) -> EncoderSpec:
+        return ENCODERS[self.name]
+
+    def input_args(self) -> List[str]:
+        """Option đặt trước input (hwaccel decode, số thread của filter graph)"""
+        args = []
+        if self.filter_threads:
+            args.extend(['-filter_complex_threads', str(self.filter_threads)])
+        if self.spec.hwaccel:
+            args.extend(['-hwaccel', self.spec.hwaccel])
+        return args
+
+    def output_args(self) -> List[str]:
+        """Option encode video cho output"""
+        spec = self.spec
+        args = ['-c:v', spec.codec, spec.preset_option, spec.presets.get(self.speed, spec.presets["balanced"])]
+
+        if self.crf is not None:
+            args.extend([spec.crf_option, str(self.crf)])
+        elif self.bitrate:
+            args.extend(['-b:v', self.bitrate])
+        elif spec.default_crf is not None:
+            args.extend([spec.crf_option, str(spec.default_crf)])
+        elif spec.default_bitrate:
+            args.extend(['-b:v', spec.default_bitrate])
+
+        if spec.cpu:
+            # Overlay PNG có thể đẩy pix_fmt lên 4:4:4, giữ 4:2:0 cho tương thích player
+            args.extend(['-pix_fmt', 'yuv420p'])
+            if self.threads:
+                if spec.codec == 'libx265':
+                    args.extend(['-x265-params', f'pools={self.threads}'])
+                elif spec.codec == 'libsvtav1':
+                    args.extend(['-svtav1-params', f'lp={self.threads}'])
+                else:
+                    args.extend(['-threads', str(self.threads)])
+        return args
+
+
+@dataclass
+class Capabilities:
+    encoders: Set[str] = field(default_factory=set)
+    filters: Set[str] = field(default_factory=set)
+    hwaccels: Set[str] = field(default_factory=set)
+
+
+def _ffmpeg_list(flag: str) -> List[str]:
+    """Chạy `ffmpeg -hide_banner <flag>` và trả về các dòng output
+
+    ffmpeg lỗi hoặc treo quá probe_seconds thì coi như không có khả năng nào (danh sách rỗng).
+    """
+    try:
+        output = run_process(['ffmpeg', '-hide_banner', flag], ProcessLimits().probe_seconds)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.error(f"Error querying ffmpeg {flag}: {e}")
+        return []
+    # -encoders có dòng '------' ngăn cách phần chú thích với danh sách
+    if '------' in output:
+        output = output.split('------', 1)[1]
+    return output.splitlines()
+
+
+def _names(lines: List[str]) -> Set[str]:
+    """Lấy cột tên từ các dòng dạng ' V....D libx264   mô tả'"""
+    return {parts[1] for parts in (line.split() for line in lines) if len(parts) >= 2}
+
+
+@lru_cache(maxsize=1)
+def detect_capabilities() -> Capabilities:
+    """Kiểm tra encoder/filter/hwaccel mà ffmpeg trên máy hỗ trợ (chạy một lần mỗi process)"""
+    caps = Capabilities(
+        encoders=_names(_ffmpeg_list('-encoders')),
+        filters=_names(_ffmpeg_list('-filters')),
+        # -hwaccels: một dòng tiêu đề 'Hardware acceleration methods:' rồi mỗi dòng một tên
+        hwaccels={line.strip() for line in _ffmpeg_list('-hwaccels')
+                  if line.strip() and not line.strip().endswith(':')},
+    )
+    logger.info(f"ffmpeg capabilities: {len(caps.encoders)} encoders, {len(caps.filters)} filters, "
+                f"hwaccels: {', '.join(sorted(caps.hwaccels)) or 'none'}")
+    return caps
+
+
+def is_available(profile: EncoderProfile, caps: Optional[Capabilities] = None) -> bool:
+    caps = caps or detect_capabilities()
+    spec = ENCODERS.get(profile.name)
+    if not spec or spec.codec not in caps.encoders:
+        return False
+    return not spec.hwaccel or spec.hwaccel in caps.hwaccels
+
+
+def make_profile(settings: Union[None, str, Dict, EncoderProfile] = None) -> EncoderProfile:
+    """Tạo EncoderProfile từ tên, dict trong batch_settings.json hoặc profile có sẵn"""
+    if isinstance(settings, EncoderProfile):
+        return settings
+    if isinstance(settings, str):
+        return EncoderProfile(name=settings)
+    profile = EncoderProfile(**(settings or {}))
+    if profile.name not in ENCODERS:
+        raise ValueError(f"Unknown encoder: {profile.name} (available: {', '.join(ENCODERS)})")
+    if profile.speed not in SPEEDS:
+        raise ValueError(f"Unknown encoder speed: {profile.speed} (available: {', '.join(SPEEDS)})")
+    return profile
+
+
+def resolve_profiles(settings: Union[None, str, Dict, EncoderProfile] = None) -> List[EncoderProfile]:
+    """Danh sách profile theo thứ tự thử: profile được chọn trước, rồi các encoder CPU dự phòng
+
+    Chỉ giữ các encoder mà ffmpeg trên máy hỗ trợ. Profile dự phòng dùng lại speed/threads
+    nhưng dùng CRF mặc định của encoder đó.
+    """
+    profile = make_profile(settings)
+    caps = detect_capabilities()
+
+    chain = [profile] + [
+        replace(profile, name=name, crf=None, bitrate=None)
+        for name in FALLBACK_ORDER if name != profile.name
+    ]
+    available = [p for p in chain if is_available(p, caps)]
+    if not available:
+        # Không đọc được danh sách encoder: cứ thử profile được chọn, ffmpeg sẽ báo lỗi rõ ràng
+        return [profile]
+    if available[0] is not profile:
+        logger.warning(f"Encoder '{profile.name}' is not available, falling back to '{available[0].name}'")
+    return available
@@ -0,0 +1,273 @@
+import os
+import time
+import queue
+import signal
+import logging
+import threading
+import subprocess
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FPS = 30  # fps cố định của video đầu ra
+OUTPUT_WIDTH = 1080  # Khung hình video dọc đầu ra
+OUTPUT_HEIGHT = 1920
+
+DEFAULT_STALL_SECONDS = 120  # ffmpeg không tiến thêm frame nào trong chừng này giây thì coi là treo
+WATCH_INTERVAL = 0.5  # Chu kỳ kiểm tra cancel/timeout khi ffmpeg không in gì
+KILL_GRACE_SECONDS = 5  # Thời gian chờ ffmpeg tự thoát sau SIGTERM trước khi SIGKILL
+
+
+def escape_filter_path(path: str) -> str:
+    """Escape đường dẫn file để dùng làm giá trị option trong filtergraph của ffmpeg
+
+    ffmpeg unescape hai lần: một lần khi parse filtergraph, một lần khi parse option của filter.
+    Dùng '/' thay cho '\\' để đường dẫn Windows (C:\\...) không bị hiểu nhầm.
+    """
+    path = path.replace('\\', '/')
+    # Mức option: ':' ngăn cách các option, "'" là ký tự quote
+    for ch in ('\\', "'", ':'):
+        path = path.replace(ch, '\\' + ch)
+    # Mức filtergraph
+    for ch in ('\\', "'", '[', ']', ',', ';'):
+        path = path.replace(ch, '\\' + ch)
+    return path
+
+
+def write_concat_file(path: str, files) -> str:
+    """Ghi danh sách file cho concat demuxer (dùng với -f concat -safe 0)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for file in files:
+            # Trong concat list, dấu ' được viết là '\''
+            escaped = os.path.abspath(file).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return path
+
+
+class Cancelled(Exception):
+    """Job bị người dùng hủy (cancel_event được set)"""
+
+
+class JobTimeout(Exception):
+    """Job chạy quá job_seconds; không thử lại vì job không còn thời gian"""
+
+
+class Stalled(subprocess.SubprocessError):
+    """ffmpeg không tiến triển quá stall_timeout giây và đã bị dừng"""
+
+
+@dataclass
+class ProcessLimits:
+    """Giới hạn thời gian cho các lệnh ffmpeg/ffprobe của một job (0 = không giới hạn)"""
+    stage_seconds: float = 0     # Mỗi lệnh ffmpeg
+    job_seconds: float = 0       # Cả job (mọi lệnh cộng lại)
+    stall_seconds: float = DEFAULT_STALL_SECONDS
+    probe_seconds: float = 60    # Mỗi lệnh ffprobe
+    retries: int = 1             # Số lần chạy lại lệnh bị timeout/treo
+    retry_backoff: float = 5.0   # Giây chờ trước lần thử lại đầu tiên, gấp đôi sau mỗi lần
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict]) -> "ProcessLimits":
+        """Tạo từ mục 'timeouts' trong batch_settings.json"""
+        settings = settings or {}
+        return cls(**{k: v for k, v in settings.items() if k in cls.__dataclass_fields__})
+
+
+@dataclass
+class FfmpegProgress:
+    """Tiến độ của một lệnh ffmpeg, đọc từ output của -progress"""
+    time: float = 0.0      # Vị trí hiện tại trong video đầu ra (giây)
+    total: float = 0.0     # Thời lượng cần encode (giây), 0 nếu không biết
+    frame: int = 0
+    fps: float = 0.0       # Tốc độ encode (frame/giây)
+    speed: float = 0.0     # Bội số so với realtime (2.0 = nhanh gấp đôi thời gian thực)
+    elapsed: float = 0.0   # Thời gian đã chạy (giây)
+    done: bool = False
+
+    @property
+    def percent(self) -> float:
+        if self.total <= 0:
+            return 0.0
+        return min(100.0, self.time * 100.0 / self.total)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Số giây còn lại ước tính, None nếu chưa đủ dữ liệu"""
+        if self.total <= 0 or self.time <= 0:
+            return None
+        speed = self.speed or (self.time / self.elapsed if self.elapsed > 0 else 0)
+        if speed <= 0:
+            return None
+        return max(0.0, (self.total - self.time) / speed)
+
+    def describe(self) -> str:
+        eta = self.eta
+        eta_text = f"{int(eta // 60)}:{int(eta % 60):02d}" if eta is not None else "--:--"
+        return (f"{self.percent:.0f}% ({self.time:.1f}/{self.total:.1f}s) "
+                f"{self.fps:.0f} fps {self.speed:.2f}x ETA {eta_text}")
+
+
+def _parse_number(value: str) -> float:
+    try:
+        return float(value.rstrip('x'))
+    except ValueError:
+        return 0.0  # 'N/A' khi ffmpeg chưa có số liệu
+
+
+def _start(cmd: List[str], **kwargs) -> subprocess.Popen:
+    """Chạy process trong process group riêng để có thể kill cả ffmpeg lẫn process con của nó"""
+    if os.name == 'nt':
+        kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    return subprocess.Popen(cmd, **kwargs)
+
+
+def kill_process_group(process: subprocess.Popen, grace: float = KILL_GRACE_SECONDS):
+    """Dừng process (và cả group): terminate trước, quá grace giây vẫn chưa thoát thì kill"""
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == 'nt':
+            process.terminate()
+        else:
+            os.killpg(process.pid, signal.SIGTERM)
+        process.wait(grace)
+    except subprocess.TimeoutExpired:
+        logger.warning(f"Process {process.pid} ignored SIGTERM, killing")
+        if os.name == 'nt':
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        process.wait()
+
+
+def run_process(cmd: List[str], timeout: Optional[float] = None, cancel_event=None) -> str:
+    """Chạy lệnh ngắn (ffprobe...) và trả về stdout, có timeout và hủy được
+
+    Raise subprocess.CalledProcessError nếu lệnh lỗi, subprocess.TimeoutExpired nếu quá timeout
+    và Cancelled nếu cancel_event được set. Process bị dừng trong cả hai trường hợp sau.
+    """
+    start = time.monotonic()
+    process = _start(cmd, stdout=subprocess.PIPE, text=True)
+    chunks = []
+    try:
+        while True:
+            try:
+                # communicate có thể gọi lại sau TimeoutExpired mà không mất output
+                stdout, _ = process.communicate(timeout=WATCH_INTERVAL)
+                chunks.append(stdout or '')
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if cancel_event is not None and cancel_event.is_set():
+                raise Cancelled()
+            if timeout and time.monotonic() - start > timeout:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+    except BaseException:
+        kill_process_group(process)
+        raise
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd, ''.join(chunks))
+    return ''.join(chunks)
+
+
+def run_ffmpeg(cmd: List[str], total_duration: float = 0.0,
+               on_progress: Optional[Callable[[FfmpegProgress], None]] = None, cancel_event=None,
+               timeout: Optional[float] = None, stall_timeout: Optional[float] = DEFAULT_STALL_SECONDS):
+    """Chạy lệnh ffmpeg với -progress pipe:1 và gọi on_progress mỗi lần ffmpeg báo tiến độ (~0.5s)
+
+    stderr vẫn được in ra console như khi chạy subprocess.run.
+    Raise subprocess.CalledProcessError nếu ffmpeg lỗi, như subprocess.run(check=True).
+
+    Output của ffmpeg được đọc ở thread riêng nên cancel, timeout và watchdog vẫn được kiểm tra
+    khi ffmpeg bị treo và không in gì (ví dụ đọc file trên NAS bị treo). Mọi trường hợp dừng
+    giữa chừng đều kill cả process group của ffmpeg.
+
+    Args:
+        cancel_event: threading.Event hoặc Event của multiprocessing.Manager; khi được set thì
+            dừng ffmpeg và raise Cancelled
+        timeout: Thời gian chạy tối đa (giây), quá thì raise subprocess.TimeoutExpired
+        stall_timeout: Số giây tối đa vị trí encode không tiến lên, quá thì raise Stalled
+    """
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+    progress = FfmpegProgress(total=total_duration)
+    start = time.monotonic()
+    last_advance = start
+    last_position = (0.0, 0)
+    process = _start(cmd, stdout=subprocess.PIPE, text=True, bufsize=1)
+    lines: queue.Queue = queue.Queue()
+
+    def read_output():
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=WATCH_INTERVAL)
+            except queue.Empty:
+                line = ''
+            if line is None:
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                raise Cancelled()
+            now = time.monotonic()
+            if timeout and now - start > timeout:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            if stall_timeout and now - last_advance > stall_timeout:
+                raise Stalled(f"ffmpeg made no progress for {stall_timeout:.0f}s")
+
+            key, _, value = line.strip().partition('=')
+            if key == 'out_time_us' or key == 'out_time_ms':  # out_time_ms thực ra cũng là microsecond
+                progress.time = max(0.0, _parse_number(value) / 1_000_000)
+            elif key == 'frame':
+                progress.frame = int(_parse_number(value))
+            elif key == 'fps':
+                progress.fps = _parse_number(value)
+            elif key == 'speed':
+                progress.speed = _parse_number(value)
+            elif key == 'progress':
+                progress.elapsed = now - start
+                progress.done = value == 'end'
+                if (progress.time, progress.frame) > last_position:
+                    last_position = (progress.time, progress.frame)
+                    last_advance = now
+                if on_progress:
+                    on_progress(replace(progress))
+        returncode = process.wait()
+    except BaseException:
+        kill_process_group(process)
+        raise
+    finally:
+        # Chờ thread đọc gặp EOF (ffmpeg đã thoát) trước khi đóng pipe nó đang đọc
+        reader.join(KILL_GRACE_SECONDS)
+        process.stdout.close()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+def with_retries(func: Callable, retries: int = 0, backoff: float = 5.0, cancel_event=None):
+    """Gọi func(), thử lại tối đa retries lần nếu bị timeout hoặc treo (lỗi tạm thời như NAS chậm)
+
+    Thời gian chờ tăng gấp đôi sau mỗi lần (backoff, 2*backoff, ...). Lỗi ffmpeg thông thường
+    (CalledProcessError) không được thử lại vì chạy lại với cùng đầu vào sẽ lỗi y như cũ.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except (subprocess.TimeoutExpired, Stalled) as e:
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            logger.warning(f"{e}; retrying in {delay:.0f}s ({attempt + 1}/{retries})")
+            if cancel_event is None:
+                time.sleep(delay)
+            elif cancel_event.wait(delay):
+                raise Cancelled()
@@ -4,9 +4,13 @@ import os
 from video_processor import VideoProcessor
 from subtitle_settings import SubtitlePresetManager, SubtitleSettings
 from font_utils import get_system_fonts
+from log_setup import setup_logging
 import shutil
+import queue
 import threading
 
+POLL_INTERVAL_MS = 16  # ~60 fps
+
 class VideoProcessorGUI(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -66,6 +70,11 @@ class VideoProcessorGUI(ctk.CTk):
         # Create processor instance
         self.processor = None  # Initialize later when output folder is set
         
+        # Xử lý chạy ở thread nền, gửi tiến độ về main loop qua queue này
+        self.events = queue.Queue()
+        self.worker = None
+        self.cancel_event = None
+        
     def create_widgets(self):
         # Title
         title = ctk.CTkLabel(
@@ -108,7 +117,17 @@ class VideoProcessorGUI(ctk.CTk):
             font=("Helvetica", 14, "bold"),
             height=40
         )
-        self.process_button.pack(pady=20)
+        self.process_button.pack(pady=(20, 5))
+        
+        # Cancel button (chỉ bật khi đang xử lý)
+        self.cancel_button = ctk.CTkButton(
+            self.main_frame,
+            text="Cancel",
+            command=self.cancel_processing,
+            height=30,
+            state="disabled"
+        )
+        self.cancel_button.pack(pady=5)
         
     def create_subtitle_settings_frame(self):
         settings_frame = ctk.CTkFrame(self.main_frame)
@@ -369,26 +388,34 @@ class VideoProcessorGUI(ctk.CTk):
         if not self.output_folder_path:
             messagebox.showerror("Error", "Output folder is required!")
             return
-                
+        
+        # Đọc các biến Tk trên main thread, thread xử lý không được đụng vào Tk
+        try:
+            settings = SubtitleSettings(
+                font=self.font_var.get(),
+                font_size=self.font_size_var.get(),
+                primary_color=self.primary_color_var.get(),
+                outline_color=self.outline_color_var.get(),
+                back_color=self.back_color_var.get(),
+                outline=self.outline_width_var.get(),
+                shadow=self.shadow_var.get(),
+                margin_v=self.margin_v_var.get(),
+                margin_h=self.margin_h_var.get(),
+                spacing=self.spacing_var.get(),
+                max_chars=self.max_chars_var.get()
+            )
+        except Exception as error:
+            messagebox.showerror("Error", str(error))
+            return
+        
         # Disable process button
         self.process_button.configure(state="disabled")
+        self.cancel_button.configure(state="normal")
+        self.cancel_event = threading.Event()
         
         # Start processing in a new thread
         def process_thread():
             try:
-                settings = SubtitleSettings(
-                    font=self.font_var.get(),
-                    font_size=self.font_size_var.get(),
-                    primary_color=self.primary_color_var.get(),
-                    outline_color=self.outline_color_var.get(),
-                    back_color=self.back_color_var.get(),
-                    outline=self.outline_width_var.get(),
-                    shadow=self.shadow_var.get(),
-                    margin_v=self.margin_v_var.get(),
-                    margin_h=self.margin_h_var.get(),
-                    spacing=self.spacing_var.get(),
-                    max_chars=self.max_chars_var.get()
-                )
                 output = self.processor.process_video(
                     hook_mp3=self.hook_mp3_path,
                     audio_mp3=self.audio_mp3_path,
@@ -397,29 +424,56 @@ class VideoProcessorGUI(ctk.CTk):
                     thumbnail=self.thumbnail_path,
                     video_folder=self.video_folder_path,
                     subtitle_settings=settings,
-                    callback=self.update_progress
+                    callback=self.update_progress,
+                    cancel_event=self.cancel_event
                 )
-                if output and os.path.exists(output):
+                if self.cancel_event.is_set():
+                    self.events.put(("progress", "Cancelled", 0))
+                elif output and os.path.exists(output):
                     print("Successfully processed video!")
-                    return output
                 else:
                     raise Exception("Failed to create output video")
             except Exception as error:
-                error_msg = str(error)
-                self.after(0, lambda: messagebox.showerror("Error", error_msg))
-            finally:
-                self.after(0, lambda: self.process_button.configure(state="normal"))
-        
-        thread = threading.Thread(target=process_thread)
-        thread.daemon = True
-        thread.start()
+                self.events.put(("error", str(error)))
+        
+        self.worker = threading.Thread(target=process_thread, daemon=True)
+        self.worker.start()
+        self.after(POLL_INTERVAL_MS, self.poll_events)
+
+    def update_progress(self, status, progress, encode_progress=None):
+        """Callback của process_video, chạy trên thread xử lý: chỉ đưa vào queue cho main loop"""
+        # Trong lúc encode, status đã gồm vị trí, fps, speed và ETA (encode_progress.describe())
+        self.events.put(("progress", status, progress))
+
+    def poll_events(self):
+        """Áp tiến độ/lỗi từ thread xử lý lên UI (~60 lần/giây) cho tới khi thread kết thúc"""
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == "progress":
+                _, status, progress = event
+                self.status_label.configure(text=status)
+                self.progress_bar.set(progress / 100)
+            elif event[0] == "error":
+                messagebox.showerror("Error", event[1])
+        
+        if self.worker is not None and (self.worker.is_alive() or not self.events.empty()):
+            self.after(POLL_INTERVAL_MS, self.poll_events)
+        else:
+            self.worker = None
+            self.process_button.configure(state="normal")
+            self.cancel_button.configure(state="disabled")
 
-    def update_progress(self, status, progress):
-        self.status_label.configure(text=status)
-        self.progress_bar.set(progress / 100)
-        self.update()
+    def cancel_processing(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.cancel_button.configure(state="disabled")
+            self.status_label.configure(text="Cancelling...")
 
 def main():
+    setup_logging("INFO")
     app = VideoProcessorGUI()
     app.mainloop()
 
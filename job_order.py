@@ -0,0 +1,62 @@
+import fnmatch
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("name", "shortest_first", "longest_first")
+
+
+@dataclass
+class JobOrder:
+    """Thứ tự chạy job trong batch: theo priority trước, trong cùng priority theo policy
+
+    - name: theo tên (như trước)
+    - shortest_first: job ngắn xong sớm, giảm thời gian chờ trung bình của cả batch
+    - longest_first: job dài chạy trước để cuối batch chỉ còn job ngắn, các worker xong gần cùng lúc
+
+    priorities map pattern tên (fnmatch, không phân biệt hoa thường, ví dụ 'short_*') sang priority;
+    số lớn chạy trước, job không khớp pattern nào có priority 0. Job không đọc được thời lượng
+    luôn xếp cuối trong cùng priority.
+    """
+    policy: str = "name"
+    priorities: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown job order policy: {self.policy} (available: {', '.join(POLICIES)})")
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict]) -> "JobOrder":
+        """Tạo từ mục 'job_order' trong batch_settings.json"""
+        settings = settings or {}
+        return cls(
+            policy=settings.get("policy") or "name",
+            priorities={str(k).lower(): int(v) for k, v in (settings.get("priorities") or {}).items()},
+        )
+
+    def priority(self, base_name: str) -> int:
+        """Priority của pattern đầu tiên khớp với base name (0 nếu không khớp)"""
+        name = base_name.lower()
+        for pattern, value in self.priorities.items():
+            if fnmatch.fnmatchcase(name, pattern):
+                return value
+        return 0
+
+    def sort(self, names: List[str], durations: Dict[str, Optional[float]]) -> List[str]:
+        """Sắp xếp base name theo priority rồi policy, cùng điều kiện thì theo tên"""
+        def key(name):
+            duration = durations.get(name)
+            if self.policy == "name":
+                rank = 0.0
+            elif duration is None:
+                rank = float('inf')
+            else:
+                rank = duration if self.policy == "shortest_first" else -duration
+            return (-self.priority(name), rank, name)
+
+        ordered = sorted(names, key=key)
+        if self.policy != "name" or self.priorities:
+            logger.debug("Job order (%s): %s", self.policy, ', '.join(ordered))
+        return ordered
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_key TEXT NOT NULL UNIQUE,
+    base_name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    lease_owner TEXT,
+    lease_expires REAL,
+    output TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    base_name: str
+    payload: Dict
+    attempts: int
+
+
+class JobQueue:
+    """Hàng đợi job render lưu trong SQLite, dùng chung giữa nhiều worker/máy qua thư mục share
+
+    Mỗi job được worker nhận bằng một lease có thời hạn. Worker phải gia hạn (heartbeat) trong
+    lúc render; nếu worker chết, lease hết hạn và job được worker khác nhận lại. Job lỗi được
+    thử lại tới max_attempts lần rồi chuyển sang trạng thái failed.
+
+    Dùng journal mode DELETE (mặc định) vì WAL không an toàn trên network filesystem.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 600, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        folder = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(folder, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: tự quản lý transaction bằng BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, job_key: str, base_name: str, payload: Dict) -> bool:
+        """Thêm job nếu chưa có job cùng job_key
+
+        job_key nên gồm fingerprint nội dung đầu vào (xem worker.enqueue_jobs) để bộ file thay đổi
+        được enqueue thành job mới thay vì bị bỏ qua.
+
+        Returns:
+            True nếu job mới được thêm
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_key, base_name, payload, max_attempts, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_key, base_name, json.dumps(payload), self.max_attempts, now, now)
+            )
+            return cursor.rowcount > 0
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """Nhận một job đang chờ (hoặc job có lease đã hết hạn) cho worker này"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Job bị bỏ dở quá số lần cho phép thì đánh dấu failed
+            conn.execute(
+                "UPDATE jobs SET state = ?, error = COALESCE(error, 'Lease expired'), updated = ? "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (FAILED, now, RUNNING, now)
+            )
+            row = conn.execute(
+                "SELECT id, base_name, payload, attempts FROM jobs "
+                "WHERE state = ? OR (state = ? AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1",
+                (PENDING, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = ?, lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                (RUNNING, worker_id, now + self.lease_seconds, now, row["id"])
+            )
+            conn.execute("COMMIT")
+            return Job(row["id"], row["base_name"], json.loads(row["payload"]), row["attempts"] + 1)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Gia hạn lease. Trả về False nếu job đã bị worker khác nhận lại"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = ?",
+                (now + self.lease_seconds, now, job_id, worker_id, RUNNING)
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, job_id: int, worker_id: str, output: Optional[str]) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, output = ?, error = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = ?",
+                (DONE, output, now, job_id, worker_id, RUNNING)
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Ghi nhận lỗi: còn lượt thì trả job về pending để thử lại, hết lượt thì failed"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, "
+                "error = ?, lease_owner = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = ?",
+                (FAILED, PENDING, error, now, job_id, worker_id, RUNNING)
+            )
+            return cursor.rowcount > 0
+
+    def release(self, job_id: int, worker_id: str) -> bool:
+        """Trả job về pending mà không tính là một lần thử (worker dừng giữa chừng, không phải do lỗi)"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, attempts = MAX(attempts - 1, 0), lease_owner = NULL, "
+                "lease_expires = NULL, updated = ? WHERE id = ? AND lease_owner = ? AND state = ?",
+                (PENDING, now, job_id, worker_id, RUNNING)
+            )
+            return cursor.rowcount > 0
+
+    def retry_failed(self) -> int:
+        """Đưa tất cả job failed về pending với số lần thử reset về 0"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, error = NULL, updated = ? WHERE state = ?",
+                (PENDING, time.time(), FAILED)
+            )
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+    def failed_jobs(self) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT base_name, attempts, error FROM jobs WHERE state = ? ORDER BY id", (FAILED,)
+            ).fetchall()
+        return [dict(row) for row in rows]
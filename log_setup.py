@@ -0,0 +1,16 @@
+import logging
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(processName)s] %(name)s: %(message)s"
+
+
+def setup_logging(level="INFO"):
+    """Cấu hình logging cho process hiện tại (gọi ở entry point và trong mỗi worker process)
+
+    Args:
+        level: Tên level ('DEBUG', 'INFO', ...) hoặc số level của logging
+    """
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+    logging.basicConfig(level=level, format=LOG_FORMAT, force=True)
@@ -0,0 +1,198 @@
+import os
+import logging
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+from ffmpeg_utils import ProcessLimits, run_process, with_retries
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = ".media_index.json"
+INDEX_VERSION = 1
+VIDEO_EXTENSIONS = ('.mp4',)
+KEYFRAME_PROBE_SECONDS = 10  # Chỉ đọc packet trong 10s đầu để ước lượng GOP
+
+
+@dataclass
+class ClipInfo:
+    path: str
+    size: int
+    mtime_ns: int
+    duration: float
+    codec: str = ""
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    keyframe_interval: float = 0.0  # Khoảng cách trung bình giữa 2 keyframe (giây)
+
+
+def _parse_rate(rate: str) -> float:
+    """Chuyển frame rate dạng '30000/1001' sang số thực"""
+    try:
+        num, _, den = rate.partition('/')
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def probe_clip(path: str, limits: Optional[ProcessLimits] = None) -> Dict:
+    """Đọc metadata của một clip bằng một lần gọi ffprobe
+
+    Chỉ đọc header packet (không decode) trong KEYFRAME_PROBE_SECONDS giây đầu để tính GOP.
+    Raise subprocess.CalledProcessError nếu ffprobe không đọc được file, subprocess.TimeoutExpired nếu
+    ffprobe vẫn chạy quá limits.probe_seconds giây sau các lần thử lại (ffprobe treo khi file trên NAS
+    không đọc được).
+    """
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-read_intervals', f'%+{KEYFRAME_PROBE_SECONDS}',
+        '-show_entries', 'format=duration:stream=codec_name,width,height,avg_frame_rate:packet=pts_time,flags',
+        '-of', 'json',
+        path
+    ]
+    limits = limits or ProcessLimits()
+    data = json.loads(with_retries(lambda: run_process(cmd, limits.probe_seconds or None),
+                                   limits.retries, limits.retry_backoff) or "{}")
+
+    stream = (data.get('streams') or [{}])[0]
+    keyframes = [
+        float(p['pts_time']) for p in data.get('packets', [])
+        if 'K' in p.get('flags', '') and p.get('pts_time') not in (None, 'N/A')
+    ]
+    keyframes.sort()
+    gaps = [b - a for a, b in zip(keyframes, keyframes[1:])]
+
+    return {
+        'duration': float(data.get('format', {}).get('duration') or 0),
+        'codec': stream.get('codec_name', ''),
+        'width': int(stream.get('width') or 0),
+        'height': int(stream.get('height') or 0),
+        'fps': _parse_rate(stream.get('avg_frame_rate', '0/1')),
+        'keyframe_interval': sum(gaps) / len(gaps) if gaps else 0.0,
+    }
+
+
+class MediaIndex:
+    """Index metadata của thư mục video nền, lưu trên đĩa để không phải ffprobe lại mỗi job
+
+    Mỗi clip được nhận diện bằng (tên file, size, mtime). Clip hỏng (duration <= 0 hoặc ffprobe lỗi)
+    bị đưa vào quarantine và không bao giờ bị probe lại cho tới khi file thay đổi; clip probe bị
+    timeout thì không được ghi vào index và sẽ được probe lại ở lần refresh sau.
+    """
+
+    def __init__(self, video_folder: str, index_path: Optional[str] = None, max_workers: int = 8,
+                 limits: Optional[ProcessLimits] = None):
+        self.video_folder = video_folder
+        self.limits = limits
+        self.index_path = index_path or os.path.join(video_folder, INDEX_FILENAME)
+        self.max_workers = max_workers
+        self.clips: Dict[str, ClipInfo] = {}
+        self.quarantine: Dict[str, Dict] = {}
+        self.load()
+
+    def load(self):
+        """Load index từ đĩa, bỏ qua nếu file không tồn tại hoặc hỏng"""
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_VERSION:
+                return
+            self.clips = {name: ClipInfo(**info) for name, info in data.get('clips', {}).items()}
+            self.quarantine = data.get('quarantine', {})
+        except Exception as e:
+            logger.error(f"Error loading media index: {e}")
+            self.clips = {}
+            self.quarantine = {}
+
+    def save(self):
+        """Ghi index ra đĩa (ghi file tạm rồi rename để các process khác không đọc phải file dở)"""
+        data = {
+            'version': INDEX_VERSION,
+            'clips': {name: asdict(info) for name, info in self.clips.items()},
+            'quarantine': self.quarantine,
+        }
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logger.error(f"Error saving media index: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _probe_entry(self, name: str, path: str, size: int, mtime_ns: int) -> Tuple[Optional[ClipInfo], bool]:
+        """Probe một clip, trả về (ClipInfo hoặc None, clip có hỏng thật không)
+
+        Chỉ ffprobe báo lỗi, JSON không đọc được hoặc duration <= 0 mới là clip hỏng. Timeout và
+        lỗi tạm thời khác (NAS chậm, ffprobe bị kill) không được ghi vào index để lần sau probe lại.
+        """
+        try:
+            info = probe_clip(path, self.limits)
+        except (subprocess.CalledProcessError, ValueError) as e:
+            logger.error(f"Error probing {name}: {e}")
+            return None, True
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.warning(f"Could not probe {name}, will retry on next refresh: {e}")
+            return None, False
+        if info['duration'] <= 0:
+            return None, True
+        return ClipInfo(path=path, size=size, mtime_ns=mtime_ns, **info), False
+
+    def refresh(self) -> List[ClipInfo]:
+        """Quét thư mục, chỉ probe các clip mới hoặc đã thay đổi (song song), rồi lưu index
+
+        Returns:
+            Danh sách clip hợp lệ hiện có trong thư mục
+        """
+        current = {}
+        with os.scandir(self.video_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                    stat = entry.stat()
+                    current[entry.name] = (entry.path, stat.st_size, stat.st_mtime_ns)
+
+        changed = False
+        # Bỏ các clip đã bị xóa khỏi thư mục
+        for table in (self.clips, self.quarantine):
+            for name in [n for n in table if n not in current]:
+                del table[name]
+                changed = True
+
+        misses = []
+        for name, (path, size, mtime_ns) in current.items():
+            cached = self.clips.get(name)
+            if cached and cached.size == size and cached.mtime_ns == mtime_ns:
+                if cached.path != path:
+                    cached.path = path  # Thư mục được mount ở đường dẫn khác
+                continue
+            bad = self.quarantine.get(name)
+            if bad and bad.get('size') == size and bad.get('mtime_ns') == mtime_ns:
+                continue
+            misses.append((name, path, size, mtime_ns))
+
+        if misses:
+            logger.info(f"Probing {len(misses)} new or changed clips...")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(lambda m: self._probe_entry(*m), misses))
+            for (name, path, size, mtime_ns), (info, corrupt) in zip(misses, results):
+                self.clips.pop(name, None)
+                self.quarantine.pop(name, None)
+                if info:
+                    self.clips[name] = info
+                elif corrupt:
+                    logger.warning(f"Quarantined corrupt clip: {name}")
+                    self.quarantine[name] = {'size': size, 'mtime_ns': mtime_ns}
+            changed = True
+
+        if changed:
+            self.save()
+
+        logger.info(f"Media index: {len(self.clips)} clips, {len(self.quarantine)} quarantined")
+        return list(self.clips.values())
@@ -0,0 +1,189 @@
+"""Chạy render không cần GUI
+
+    python -m render_cli render KB2                 # một bộ file trong input folder
+    python -m render_cli render --audio a.wav --subtitle a.srt --output-folder out
+    python -m render_cli batch                      # cả input folder, như nút "Process All Files"
+    python -m render_cli worker run                 # worker của hàng đợi (xem worker.py)
+
+Cấu hình lấy từ batch_settings.json và subtitle_presets.json. Module này không import GUI,
+các module render (pysubs2, ffmpeg...) chỉ được import khi subcommand cần tới.
+"""
+import os
+import sys
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+
+def load_preset(presets_file: str, name: str):
+    from subtitle_settings import SubtitlePresetManager
+
+    preset = SubtitlePresetManager(presets_file).get_preset(name)
+    if preset is None:
+        raise Exception(f"Subtitle preset not found: {name}")
+    return preset
+
+
+def cmd_render(args, batch_settings) -> int:
+    """Render một job: theo base name trong input folder hoặc theo các file chỉ định"""
+    from artifact_cache import ArtifactCache
+    from batch_runner import run_job
+    from ffmpeg_utils import ProcessLimits
+    from transcode_cache import TranscodeCache
+
+    settings = batch_settings.settings
+    if args.input_folder:
+        settings["input_folder"] = args.input_folder
+
+    if args.audio:
+        files = {
+            "audio": args.audio,
+            "hook": args.hook,
+            "subtitle": args.subtitle,
+            "hook_subtitle": args.hook_subtitle,
+            "thumbnail": args.thumbnail,
+        }
+        base_name = args.base_name or os.path.splitext(os.path.basename(args.audio))[0]
+    elif args.base_name:
+        files = batch_settings.find_matching_files(args.base_name)
+        base_name = args.base_name
+    else:
+        raise Exception("Specify a base name or --audio")
+
+    output_folder = args.output_folder or settings["output_folder"]
+    os.makedirs(output_folder, exist_ok=True)
+    limits = ProcessLimits.from_settings(settings.get("timeouts"))
+    result = run_job(
+        base_name, files, args.work_dir, output_folder,
+        args.video_folder or settings["video_folder"],
+        load_preset(args.presets, args.preset or settings["preset_name"]),
+        encoder=settings.get("encoder"),
+        transcode_cache=TranscodeCache.from_settings(settings.get("transcode_cache"), limits),
+        segments=settings.get("segments", 1),
+        artifact_cache=ArtifactCache.from_settings(settings.get("artifact_cache")),
+        limits=limits,
+    )
+    if not result.success:
+        logger.error(f"{base_name} failed: {result.error}")
+        return 1
+    print(result.output)
+    return 0
+
+
+def cmd_batch(args, batch_settings) -> int:
+    """Render tất cả bộ file trong input folder song song"""
+    from artifact_cache import ArtifactCache
+    from batch_runner import BatchRunner
+    from concurrency import ConcurrencyController
+    from ffmpeg_utils import ProcessLimits
+    from job_order import JobOrder
+    from transcode_cache import TranscodeCache
+
+    settings = batch_settings.settings
+    for key in ("input_folder", "output_folder", "video_folder"):
+        if getattr(args, key):
+            settings[key] = getattr(args, key)
+    if not all(os.path.exists(settings[k]) for k in ("input_folder", "output_folder", "video_folder")):
+        raise Exception("All folders must exist!")
+
+    jobs = {}
+    for base_name in batch_settings.get_base_names():
+        files = batch_settings.find_matching_files(base_name)
+        if not files["audio"]:
+            logger.warning(f"Skipping {base_name}: No audio file found")
+            continue
+        jobs[base_name] = files
+    if not jobs:
+        raise Exception("No valid files found in input folder!")
+
+    limits = ProcessLimits.from_settings(settings.get("timeouts"))
+    runner = BatchRunner(
+        args.work_dir,
+        settings["output_folder"],
+        settings["video_folder"],
+        subtitle_settings=load_preset(args.presets, args.preset or settings["preset_name"]),
+        max_workers=args.workers or settings.get("max_workers") or None,
+        seed=settings.get("background_seed"),
+        encoder=settings.get("encoder"),
+        transcode_cache=TranscodeCache.from_settings(settings.get("transcode_cache"), limits),
+        segments=settings.get("segments", 1),
+        incremental=settings.get("incremental", True) and not args.force,
+        artifact_cache=ArtifactCache.from_settings(settings.get("artifact_cache")),
+        report_dir=settings.get("report_dir") or os.path.join(settings["output_folder"], "reports"),
+        limits=limits,
+        concurrency=ConcurrencyController.from_settings(settings.get("concurrency")),
+        job_order=JobOrder.from_settings(settings.get("job_order")),
+    )
+    summary = runner.run(
+        jobs,
+        callback=lambda done, total, r: logger.info(
+            f"[{done}/{total}] {r.base_name} "
+            f"{'up to date' if r.skipped else 'done' if r.success else 'failed: ' + str(r.error)}"
+        )
+    )
+    for result in summary.failed:
+        print(f"FAILED {result.base_name}: {result.error}")
+    return 1 if summary.failed else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m render_cli", description="Headless video rendering")
+    parser.add_argument("--settings", default="batch_settings.json", help="Batch settings file")
+    parser.add_argument("--presets", default="subtitle_presets.json", help="Subtitle presets file")
+    parser.add_argument("--preset", help="Subtitle preset name (default: preset_name in settings)")
+    parser.add_argument("--work-dir", default=os.path.join(os.getcwd(), "temp"))
+    parser.add_argument("--log-level", help="Override log_level in settings")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    render = sub.add_parser("render", help="Render a single file set")
+    render.add_argument("base_name", nargs="?", help="Base name in the input folder (e.g. KB2)")
+    render.add_argument("--input-folder")
+    render.add_argument("--output-folder")
+    render.add_argument("--video-folder")
+    render.add_argument("--audio")
+    render.add_argument("--hook")
+    render.add_argument("--subtitle")
+    render.add_argument("--hook-subtitle")
+    render.add_argument("--thumbnail")
+
+    batch = sub.add_parser("batch", help="Render every file set in the input folder")
+    batch.add_argument("--input-folder")
+    batch.add_argument("--output-folder")
+    batch.add_argument("--video-folder")
+    batch.add_argument("--workers", type=int, default=0, help="Parallel jobs (default: settings, 0 = auto)")
+    batch.add_argument("--force", action="store_true", help="Re-render jobs that are up to date")
+
+    sub.add_parser("worker", help="Job queue worker, remaining arguments go to worker.py", add_help=False)
+    return parser
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+
+    if args.command == "worker":
+        import worker
+        return worker.main(["--settings", args.settings] + rest)
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+
+    from batch_settings import BatchSettings
+    from log_setup import setup_logging
+
+    batch_settings = BatchSettings(args.settings)
+    setup_logging(args.log_level or batch_settings.settings.get("log_level", "INFO"))
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    try:
+        if args.command == "render":
+            return cmd_render(args, batch_settings)
+        return cmd_batch(args, batch_settings)
+    except Exception as e:
+        logger.error(str(e))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
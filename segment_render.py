@@ -0,0 +1,166 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
+
+from concurrency import available_cores
+from ffmpeg_utils import OUTPUT_FPS, FfmpegProgress, write_concat_file
+
+logger = logging.getLogger(__name__)
+
+MIN_SEGMENT_SECONDS = 20  # Đoạn quá ngắn thì chi phí khởi động ffmpeg lớn hơn lợi ích song song
+
+
+@dataclass
+class Segment:
+    index: int
+    start_frame: int
+    frames: int
+
+    @property
+    def start(self) -> float:
+        return self.start_frame / OUTPUT_FPS
+
+    @property
+    def end(self) -> float:
+        return (self.start_frame + self.frames) / OUTPUT_FPS
+
+
+def plan_segments(total_duration: float, count: int,
+                  min_duration: float = MIN_SEGMENT_SECONDS) -> List[Segment]:
+    """Chia timeline thành các đoạn có biên nằm đúng trên frame (fps đầu ra cố định)
+
+    Tổng số frame của các đoạn bằng đúng số frame của video một lượt, nên ghép lại
+    bằng stream copy không bị lệch so với audio.
+    """
+    total_frames = max(1, round(total_duration * OUTPUT_FPS))
+    count = max(1, min(count, int(total_duration // min_duration) or 1))
+    base, extra = divmod(total_frames, count)
+
+    segments = []
+    start = 0
+    for index in range(count):
+        frames = base + (1 if index < extra else 0)
+        segments.append(Segment(index, start, frames))
+        start += frames
+    return segments
+
+
+class SegmentRenderer:
+    """Render một video thành nhiều đoạn song song rồi ghép lại bằng stream copy
+
+    Mỗi đoạn tự seek vào concat list của nền, burn phần subtitle của riêng nó và chỉ overlay
+    thumbnail nếu đoạn đó nằm trong khoảng hiển thị thumbnail. Audio không được cắt: file audio
+    đầy đủ được mux một lần khi ghép, nên luôn khớp với video.
+    """
+
+    def __init__(self, processor, profile, segments: int, max_parallel: Optional[int] = None):
+        self.processor = processor
+        self.segments = segments
+        self.max_parallel = max_parallel or segments
+        if profile.threads == 0 and profile.spec.cpu:
+            # Job chạy một mình (batch runner đã đặt threads theo số job song song):
+            # chia đều core cho các đoạn chạy cùng lúc để không oversubscribe CPU
+            profile = replace(profile, threads=max(1, available_cores() // self.max_parallel))
+        self.profile = profile
+        self.progress: Dict[int, FfmpegProgress] = {}
+        self.progress_lock = threading.Lock()
+        self.on_progress = None
+
+    def report_progress(self, segment: Segment, progress: FfmpegProgress, total_duration: float):
+        """Gộp tiến độ của các đoạn đang chạy song song thành tiến độ của cả video"""
+        with self.progress_lock:
+            self.progress[segment.index] = progress
+            parts = list(self.progress.values())
+        if self.on_progress:
+            running = [p for p in parts if not p.done]
+            self.on_progress(FfmpegProgress(
+                time=sum(p.time for p in parts),
+                total=total_duration,
+                frame=sum(p.frame for p in parts),
+                fps=sum(p.fps for p in running),
+                speed=sum(p.speed for p in running),
+                elapsed=max(p.elapsed for p in parts),
+            ))
+
+    def build_segment_command(self, segment: Segment, concat_list: str, ass_path: Optional[str],
+                              thumbnail: Optional[str], overlay_duration: float, output_path: str) -> List[str]:
+        inputs = ['-ss', f"{segment.start:.6f}", '-f', 'concat', '-safe', '0', '-i', concat_list]
+        thumb_input = None
+        if thumbnail and segment.start < overlay_duration:
+            inputs.extend(['-i', thumbnail])
+            thumb_input = 1
+
+        filter_complex, last_output = self.processor.build_video_filters(
+            ass_path, thumb_input, overlay_duration, time_offset=segment.start
+        )
+        return ['ffmpeg'] + self.profile.input_args() + ['-y', '-v', 'error'] + inputs + [
+            '-filter_complex', ';'.join(filter_complex),
+            '-map', f'[{last_output}]',
+            '-an',
+        ] + self.profile.output_args() + [
+            '-r', str(OUTPUT_FPS),
+            '-frames:v', str(segment.frames),
+            output_path
+        ]
+
+    def render_segment(self, segment: Segment, concat_list: str, subtitle_track, subtitle_settings,
+                       thumbnail: Optional[str], overlay_duration: float, total_duration: float = 0) -> str:
+        processor = self.processor
+        ass_path = None
+        if subtitle_track is not None:
+            start_ms = round(segment.start * 1000)
+            end_ms = round(segment.end * 1000)
+            part = subtitle_track.window(start_ms, end_ms)
+            if len(part):
+                ass_path = processor.write_subtitle_track(
+                    part, processor.get_temp_path(f"segment{segment.index:03d}", '.ass'), subtitle_settings
+                )
+
+        output_path = processor.get_temp_path(f"segment{segment.index:03d}", '.mp4')
+        cmd = self.build_segment_command(segment, concat_list, ass_path, thumbnail, overlay_duration, output_path)
+        logger.info(f"Rendering segment {segment.index + 1}/{self.segments} "
+                    f"({segment.start:.2f}s - {segment.end:.2f}s, {segment.frames} frames)")
+        logger.debug("Executing command: %s", ' '.join(cmd))
+        processor.run_ffmpeg(cmd, segment.end - segment.start,
+                             lambda progress: self.report_progress(segment, progress, total_duration))
+        return output_path
+
+    def render(self, concat_list: str, final_audio: str, total_duration: float, output_path: str,
+               subtitle_track=None, subtitle_settings=None, thumbnail: Optional[str] = None,
+               overlay_duration: float = 0, on_progress=None) -> str:
+        """Render các đoạn song song rồi ghép
+
+        Args:
+            on_progress: Hàm (FfmpegProgress) nhận tiến độ gộp của tất cả các đoạn
+        """
+        self.on_progress = on_progress
+        self.progress = {}
+        segments = plan_segments(total_duration, self.segments)
+        self.segments = len(segments)
+        logger.info(f"Rendering {len(segments)} segments with {self.profile.name}, "
+                    f"{self.profile.threads or 'auto'} threads each")
+
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel, len(segments))) as executor:
+            parts = list(executor.map(
+                lambda seg: self.render_segment(seg, concat_list, subtitle_track, subtitle_settings,
+                                                thumbnail, overlay_duration, total_duration),
+                segments
+            ))
+
+        # Ghép video bằng stream copy và mux audio đầy đủ một lần
+        parts_list = write_concat_file(self.processor.get_temp_path('segments', '.txt'), parts)
+        cmd = [
+            'ffmpeg', '-y',
+            '-f', 'concat', '-safe', '0', '-i', parts_list,
+            '-i', final_audio,
+            '-map', '0:v', '-map', '1:a',
+            '-c:v', 'copy',
+            '-c:a', 'aac',
+            '-t', str(total_duration),
+            output_path
+        ]
+        logger.info("Executing command: %s", ' '.join(cmd))
+        self.processor.run_ffmpeg(cmd, total_duration)
+        return output_path
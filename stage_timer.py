@@ -0,0 +1,167 @@
+import os
+import csv
+import json
+import time
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REPORT_PERCENTILES = (50, 90, 99)
+# Windows: os.times() không có CPU của process con (luôn 0), nên child_cpu được ghi là không đo được
+CHILD_CPU_AVAILABLE = os.name != 'nt'
+
+
+@dataclass
+class StageTiming:
+    name: str
+    wall: float        # Thời gian thực (giây)
+    cpu: float         # CPU của chính process (user + system, mọi thread)
+    child_cpu: Optional[float]  # CPU của process con đã kết thúc trong stage (ffmpeg), None nếu không đo được
+
+
+class StageTimer:
+    """Đo thời gian từng stage của một job: wall time và CPU time, tính cả process con (ffmpeg)
+
+    CPU của process con chỉ được tính khi process con đã kết thúc (os.times), nên mỗi stage
+    phải chờ ffmpeg của nó xong trước khi ra khỏi khối with (subprocess.run/Popen.wait đều vậy).
+    Trên Windows os.times không đo được process con nên child_cpu là None.
+    """
+
+    def __init__(self):
+        self.timings: List[StageTiming] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start_wall = time.perf_counter()
+        start = os.times()
+        try:
+            yield
+        finally:
+            end = os.times()
+            self.timings.append(StageTiming(
+                name,
+                time.perf_counter() - start_wall,
+                (end.user - start.user) + (end.system - start.system),
+                (end.children_user - start.children_user) + (end.children_system - start.children_system)
+                if CHILD_CPU_AVAILABLE else None,
+            ))
+            logger.debug("Stage %s: %.2fs wall", name, self.timings[-1].wall)
+
+    def as_dict(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Tổng thời gian theo tên stage (stage chạy nhiều lần được cộng dồn), dạng serialize được"""
+        result: Dict[str, Dict[str, Optional[float]]] = {}
+        for timing in self.timings:
+            entry = result.setdefault(timing.name, {'wall': 0.0, 'cpu': 0.0, 'child_cpu': 0.0})
+            entry['wall'] += timing.wall
+            entry['cpu'] += timing.cpu
+            if timing.child_cpu is None or entry['child_cpu'] is None:
+                entry['child_cpu'] = None
+            else:
+                entry['child_cpu'] += timing.child_cpu
+        return result
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentile có nội suy tuyến tính (giống numpy.percentile mặc định)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_stages(job_timings: Iterable[Dict[str, Dict[str, Optional[float]]]]) -> Dict[str, Dict[str, float]]:
+    """Gộp timing của nhiều job thành thống kê theo stage: số job, mean, max và các percentile
+
+    Metric không đo được (child_cpu = None trên Windows) không có thống kê.
+    """
+    samples: Dict[str, Dict[str, List[float]]] = {}
+    for timings in job_timings:
+        for name, values in timings.items():
+            stage = samples.setdefault(name, {'wall': [], 'cpu': [], 'child_cpu': []})
+            for metric in stage:
+                value = values.get(metric, 0.0)
+                if value is not None:
+                    stage[metric].append(value)
+
+    summary = {}
+    for name, metrics in samples.items():
+        entry = {'jobs': len(metrics['wall'])}
+        for metric, values in metrics.items():
+            if not values:
+                continue
+            entry[f'{metric}_mean'] = sum(values) / len(values)
+            entry[f'{metric}_max'] = max(values)
+            for p in REPORT_PERCENTILES:
+                entry[f'{metric}_p{p}'] = percentile(values, p)
+        summary[name] = entry
+    return summary
+
+
+def cpu_cell(timing: Dict[str, Optional[float]]) -> str:
+    """Ô CSV cho CPU của một stage: process + process con, rỗng nếu không đo được CPU process con"""
+    child_cpu = timing.get('child_cpu', 0.0)
+    if child_cpu is None:
+        return ""
+    return f"{timing.get('cpu', 0.0) + child_cpu:.3f}"
+
+
+def write_batch_report(summary, report_dir: str, extra: Dict = None) -> str:
+    """Ghi báo cáo hiệu năng của batch ra batch_<timestamp>.json và .csv
+
+    JSON gồm timing từng job và percentile theo stage; CSV có một dòng mỗi job, một cột wall time
+    mỗi stage để mở bằng Excel hoặc so sánh giữa các lần chạy. Cột CPU (process + process con)
+    để trống khi CPU của process con không đo được (Windows).
+
+    Args:
+        summary: BatchSummary của batch runner
+        extra: Thông tin thêm ghi vào JSON (encoder, số worker...)
+
+    Returns:
+        Đường dẫn file JSON
+    """
+    os.makedirs(report_dir, exist_ok=True)
+    base = os.path.join(report_dir, f"batch_{int(time.time())}")
+    rendered = [r for r in summary.results if not r.skipped]
+    stage_names = sorted({name for r in rendered for name in r.timings})
+
+    data = {
+        'created': time.time(),
+        'elapsed': summary.elapsed,
+        'jobs_total': len(summary.results),
+        'jobs_succeeded': len(summary.succeeded),
+        'jobs_failed': len(summary.failed),
+        'jobs_skipped': len(summary.skipped),
+        'videos_per_hour': summary.videos_per_hour,
+        'stages': summarize_stages(r.timings for r in rendered if r.success),
+        'jobs': [
+            {'base_name': r.base_name, 'success': r.success, 'elapsed': r.elapsed,
+             'error': r.error, 'stages': r.timings}
+            for r in rendered
+        ],
+    }
+    if extra:
+        data.update(extra)
+
+    with open(f"{base}.json", 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+    with open(f"{base}.csv", 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['base_name', 'success', 'elapsed'] +
+                        [f'{name}_wall' for name in stage_names] +
+                        [f'{name}_cpu' for name in stage_names])
+        for r in rendered:
+            writer.writerow(
+                [r.base_name, int(r.success), f"{r.elapsed:.3f}"] +
+                [f"{r.timings.get(name, {}).get('wall', 0.0):.3f}" for name in stage_names] +
+                [cpu_cell(r.timings.get(name, {})) for name in stage_names]
+            )
+
+    logger.info(f"Performance report written to {base}.json")
+    return f"{base}.json"
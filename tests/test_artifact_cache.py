@@ -0,0 +1,82 @@
+import os
+import time
+
+from artifact_cache import ArtifactCache
+from batch_manifest import BatchManifest
+
+
+def make_builder(content, calls):
+    def build(path):
+        calls.append(path)
+        with open(path, "wb") as f:
+            f.write(content)
+        return {"duration": 1.5}
+    return build
+
+
+def test_fetch_builds_once_and_reuses(tmp_path):
+    source = tmp_path / "a.wav"
+    source.write_bytes(b"audio")
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=1024)
+    calls = []
+    path, meta = cache.fetch("audio", [str(source), None], {"x": 1}, ".wav", make_builder(b"joined", calls))
+    assert meta == {"duration": 1.5}
+    assert open(path, "rb").read() == b"joined"
+    again, meta = cache.fetch("audio", [str(source), None], {"x": 1}, ".wav", make_builder(b"other", calls))
+    assert again == path and meta == {"duration": 1.5} and len(calls) == 1
+    # Đổi tham số hoặc nội dung đầu vào là artifact khác
+    assert cache.fetch("audio", [str(source), None], {"x": 2}, ".wav", make_builder(b"2", calls))[0] != path
+    source.write_bytes(b"new audio")
+    assert cache.fetch("audio", [str(source), None], {"x": 1}, ".wav", make_builder(b"3", calls))[0] != path
+    assert not [name for name in os.listdir(cache.cache_dir) if ".tmp" in name]
+
+
+def test_failed_build_leaves_nothing(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=1024)
+
+    def build(path):
+        open(path, "wb").close()
+        raise RuntimeError("ffmpeg failed")
+
+    try:
+        cache.fetch("ass", [], None, ".ass", build)
+    except RuntimeError:
+        pass
+    assert os.listdir(cache.cache_dir) == []
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=25, evict_grace_seconds=60)
+    paths = [cache.fetch("s", [], {"n": n}, ".bin", make_builder(b"x" * 10, []))[0] for n in range(3)]
+    old = time.time() - 3600
+    for age, path in enumerate(paths):
+        os.utime(path, (old + age, old + age))
+    cache.evict()
+    assert [os.path.exists(p) for p in paths] == [False, True, True]
+    assert not os.path.exists(f"{paths[0]}.json")
+
+
+def test_evict_keeps_recently_used_entries(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=5, evict_grace_seconds=60)
+    stale = cache.fetch("s", [], {"n": 0}, ".bin", make_builder(b"x" * 10, []))[0]
+    os.utime(stale, (time.time() - 3600,) * 2)
+    # Vượt giới hạn khi fetch nhưng artifact vừa trả về cho job không bị xóa
+    fresh = cache.fetch("s", [], {"n": 1}, ".bin", make_builder(b"x" * 10, []))[0]
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+
+
+def test_remembered_hashes_skip_reading_inputs(tmp_path, monkeypatch):
+    source = tmp_path / "a.wav"
+    source.write_bytes(b"audio")
+    manifest = BatchManifest(str(tmp_path))
+    sha1 = manifest.file_hash(str(source))
+
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=1024)
+    cache.remember_hashes(manifest.hashes_for([str(source), None, str(tmp_path / "unknown.wav")]))
+
+    def fail(path):
+        raise AssertionError(f"{path} was hashed again")
+
+    monkeypatch.setattr("artifact_cache.hash_file", fail)
+    assert cache.file_hash(str(source)) == sha1
@@ -0,0 +1,78 @@
+import struct
+import wave
+
+from audio_join import read_wav_info
+
+
+def write_wav(path, frames=44100, channels=2, rate=44100, width=2):
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(width)
+        f.setframerate(rate)
+        f.writeframes(b'\x00' * frames * channels * width)
+
+
+def riff(chunks):
+    body = b'WAVE' + b''.join(chunk_id + struct.pack('<I', len(data)) + data + b'\x00' * (len(data) % 2)
+                              for chunk_id, data in chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def test_read_pcm_header(tmp_path):
+    path = tmp_path / "a.wav"
+    write_wav(path, frames=22050)
+    info = read_wav_info(str(path))
+    assert (info.audio_format, info.channels, info.sample_rate, info.bits_per_sample) == (1, 2, 44100, 16)
+    assert info.codec == 'pcm_s16le'
+    assert info.data_offset == 44
+    assert info.duration == 0.5
+
+
+def test_skips_unknown_chunks(tmp_path):
+    fmt = struct.pack('<HHIIHH', 1, 1, 8000, 16000, 2, 16)
+    path = tmp_path / "list.wav"
+    path.write_bytes(riff([(b'fmt ', fmt), (b'LIST', b'odd'), (b'data', b'\x00' * 16000)]))
+    info = read_wav_info(str(path))
+    assert info.duration == 1.0
+    assert info.data_offset == 12 + 8 + 16 + 8 + 4 + 8
+
+
+def test_extensible_format(tmp_path):
+    # WAVE_FORMAT_EXTENSIBLE, sub-format GUID bắt đầu bằng 3 (IEEE float)
+    fmt = struct.pack('<HHIIHH', 0xFFFE, 1, 48000, 192000, 4, 32) + struct.pack('<HHI', 22, 32, 4) + \
+        struct.pack('<H', 3) + b'\x00' * 14
+    path = tmp_path / "float.wav"
+    path.write_bytes(riff([(b'fmt ', fmt), (b'data', b'\x00' * 192000)]))
+    info = read_wav_info(str(path))
+    assert info.audio_format == 3
+    assert info.codec == 'pcm_f32le'
+
+
+def test_streamed_data_size_uses_file_size(tmp_path):
+    path = tmp_path / "stream.wav"
+    write_wav(path, frames=8000, channels=1, rate=8000)
+    data = bytearray(path.read_bytes())
+    data[40:44] = struct.pack('<I', 0xFFFFFFFF)
+    path.write_bytes(bytes(data))
+    info = read_wav_info(str(path))
+    assert info.data_size == 16000
+    assert info.duration == 1.0
+
+
+def test_same_format(tmp_path):
+    for name, rate in (("a", 44100), ("b", 44100), ("c", 48000)):
+        write_wav(tmp_path / f"{name}.wav", frames=100, rate=rate)
+    a, b, c = (read_wav_info(str(tmp_path / f"{name}.wav")) for name in "abc")
+    assert a.same_format(b)
+    assert not a.same_format(c)
+
+
+def test_invalid_files(tmp_path):
+    mp3 = tmp_path / "a.mp3"
+    mp3.write_bytes(b'ID3' + b'\x00' * 100)
+    no_fmt = tmp_path / "no_fmt.wav"
+    no_fmt.write_bytes(riff([(b'data', b'\x00' * 10)]))
+    truncated = tmp_path / "truncated.wav"
+    truncated.write_bytes(b'RIFF')
+    for path in (mp3, no_fmt, truncated, tmp_path / "missing.wav"):
+        assert read_wav_info(str(path)) is None
@@ -0,0 +1,70 @@
+import os
+
+from batch_manifest import BatchManifest, hash_file
+
+
+def make_files(tmp_path):
+    audio = tmp_path / "a_audio.wav"
+    srt = tmp_path / "a_audio.srt"
+    audio.write_bytes(b"audio")
+    srt.write_text("1\n00:00:00,000 --> 00:00:01,000\nhi\n", encoding="utf-8")
+    return {"audio": str(audio), "hook": None, "subtitle": str(srt)}
+
+
+def test_fingerprint_changes_with_inputs(tmp_path):
+    files = make_files(tmp_path)
+    manifest = BatchManifest(str(tmp_path))
+    base = manifest.fingerprint(files, {"font": "Arial"}, {"name": "x264"})
+    assert manifest.fingerprint(files, {"font": "Arial"}, {"name": "x264"}) == base
+    assert manifest.fingerprint(files, {"font": "Roboto"}, {"name": "x264"}) != base
+    assert manifest.fingerprint(files, {"font": "Arial"}, {"name": "x265"}) != base
+
+    with open(files["audio"], "ab") as f:
+        f.write(b"more")
+    assert manifest.fingerprint(files, {"font": "Arial"}, {"name": "x264"}) != base
+
+
+def test_file_hash_is_cached_by_size_and_mtime(tmp_path):
+    files = make_files(tmp_path)
+    manifest = BatchManifest(str(tmp_path))
+    sha1 = manifest.file_hash(files["audio"])
+    assert sha1 == hash_file(files["audio"])
+    # Cache dựa trên (size, mtime): đổi nội dung nhưng giữ nguyên cả hai thì dùng hash cũ
+    stat = os.stat(files["audio"])
+    with open(files["audio"], "wb") as f:
+        f.write(b"AUDIO")
+    os.utime(files["audio"], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert manifest.file_hash(files["audio"]) == sha1
+
+
+def test_output_if_current(tmp_path):
+    manifest = BatchManifest(str(tmp_path))
+    output = tmp_path / "a.mp4"
+    output.write_bytes(b"video")
+    manifest.record("a", "fp1", str(output))
+    assert manifest.output_if_current("a", "fp1") == str(output)
+    assert manifest.output_if_current("a", "fp2") is None
+    assert manifest.output_if_current("b", "fp1") is None
+    os.remove(output)
+    assert manifest.output_if_current("a", "fp1") is None
+
+
+def test_save_and_load(tmp_path):
+    files = make_files(tmp_path)
+    output = tmp_path / "a.mp4"
+    output.write_bytes(b"video")
+    manifest = BatchManifest(str(tmp_path))
+    fingerprint = manifest.fingerprint(files)
+    manifest.record("a", fingerprint, str(output))
+    manifest.save()
+
+    loaded = BatchManifest(str(tmp_path))
+    assert loaded.output_if_current("a", fingerprint) == str(output)
+    assert loaded.files == manifest.files
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_corrupt_manifest_starts_empty(tmp_path):
+    (tmp_path / ".batch_manifest.json").write_text("{not json", encoding="utf-8")
+    manifest = BatchManifest(str(tmp_path))
+    assert manifest.jobs == {} and manifest.files == {}
@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+from batch_settings import BatchSettings
+
+
+@pytest.fixture
+def settings(tmp_path):
+    input_folder = tmp_path / "input"
+    input_folder.mkdir()
+    settings_file = tmp_path / "batch_settings.json"
+    batch_settings = BatchSettings(str(settings_file))
+    batch_settings.settings["input_folder"] = str(input_folder)
+    return batch_settings
+
+
+def touch(settings, *names):
+    for name in names:
+        open(os.path.join(settings.settings["input_folder"], name), "wb").close()
+
+
+def test_complete_set(settings):
+    touch(settings, "KB2_audio.wav", "KB2_audio.srt", "KB2_hook.mp3", "KB2_hook.srt", "KB2_Hook.png")
+    index = settings.scan_input_folder()
+    files = {role: os.path.basename(path) if path else None for role, path in index["kb2"].items()}
+    assert files == {
+        "audio": "KB2_audio.wav",
+        "hook": "KB2_hook.mp3",
+        "subtitle": "KB2_audio.srt",
+        "hook_subtitle": "KB2_hook.srt",
+        "thumbnail": "KB2_Hook.png",
+    }
+    assert settings.problems == []
+    assert settings.get_base_names() == ["kb2"]
+
+
+def test_ambiguous_match_prefers_exact_name(settings):
+    touch(settings, "KB2_audio_old.wav", "KB2_audio.wav", "KB2_audio.srt")
+    index = settings.scan_input_folder()
+    assert os.path.basename(index["kb2"]["audio"]) == "KB2_audio.wav"
+    assert len(settings.problems) == 1
+    assert "2 files match audio" in settings.problems[0]
+
+
+def test_ambiguous_match_falls_back_to_name_order(settings):
+    touch(settings, "KB2_audio_v2.wav", "KB2_audio_v1.wav", "KB2_audio.srt")
+    index = settings.scan_input_folder()
+    assert os.path.basename(index["kb2"]["audio"]) == "KB2_audio_v1.wav"
+    assert "using KB2_audio_v1.wav" in settings.problems[0]
+
+
+def test_incomplete_sets_are_reported(settings):
+    touch(settings, "A_audio.wav", "B_hook.mp3", "B_audio.wav", "B_audio.srt", "C_audio.srt")
+    settings.scan_input_folder(log_problems=False)
+    assert sorted(settings.problems) == [
+        "a: no subtitle file",
+        "b: hook audio without hook subtitle",
+        "c: no audio file, ignoring C_audio.srt",
+    ]
+    assert settings.get_base_names() == ["a", "b"]
+
+
+def test_find_matching_files_rescans_when_suffixes_change(settings):
+    touch(settings, "X_audio.wav", "X_voice.wav")
+    assert os.path.basename(settings.find_matching_files("X")["audio"]) == "X_audio.wav"
+    settings.settings["suffixes"]["audio"] = "_voice"
+    assert os.path.basename(settings.find_matching_files("x")["audio"]) == "X_voice.wav"
+    assert settings.find_matching_files("missing")["audio"] is None
+
+
+def test_load_saved_settings(tmp_path):
+    path = tmp_path / "saved.json"
+    path.write_text(json.dumps({"input_folder": "in", "suffixes": {"audio": "_a"}}), encoding="utf-8")
+    assert BatchSettings(str(path)).settings["suffixes"] == {"audio": "_a"}
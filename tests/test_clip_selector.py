@@ -0,0 +1,57 @@
+from clip_selector import ClipSelector
+from media_index import ClipInfo
+
+
+def make_clips(durations):
+    return [ClipInfo(path=f"clip{i}.mp4", size=1, mtime_ns=1, duration=d) for i, d in enumerate(durations)]
+
+
+def test_select_covers_duration():
+    clips = make_clips([5, 7, 11, 13, 17, 19, 23])
+    selected = ClipSelector(seed=1).select(clips, 40)
+    assert sum(c.duration for c in selected) >= 40
+    assert len({c.path for c in selected}) == len(selected)
+
+
+def test_select_drops_unneeded_clips():
+    clips = make_clips([10, 10, 10, 100])
+    selected = ClipSelector(seed=1, usage_weight=0).select(clips, 25)
+    # Không giữ clip nào mà bỏ đi vẫn đủ thời lượng
+    total = sum(c.duration for c in selected)
+    assert all(total - c.duration < 25 for c in selected)
+
+
+def test_select_uses_everything_when_library_is_short():
+    clips = make_clips([5, 6])
+    selected = ClipSelector(seed=1).select(clips, 60)
+    assert sorted(c.path for c in selected) == ["clip0.mp4", "clip1.mp4"]
+
+
+def test_select_empty_library():
+    assert ClipSelector(seed=1).select([], 30) == []
+
+
+def test_same_seed_same_result():
+    clips = make_clips([3, 4, 5, 6, 7, 8, 9, 10])
+
+    def run():
+        selector = ClipSelector(seed=42)
+        return [[c.path for c in selector.select(clips, d)] for d in (12, 20)]
+
+    assert run() == run()
+
+
+def test_same_seed_ignores_input_order():
+    clips = make_clips([3, 4, 5, 6, 7, 8, 9, 10])
+    first = ClipSelector(seed=7).select(clips, 17)
+    second = ClipSelector(seed=7).select(list(reversed(clips)), 17)
+    assert [c.path for c in first] == [c.path for c in second]
+
+
+def test_usage_spreads_clips_across_jobs():
+    clips = make_clips([10] * 6)
+    selector = ClipSelector(seed=3)
+    for _ in range(3):
+        selector.select(clips, 15)
+    # 3 job x 2 clip trên 6 clip bằng nhau: mỗi clip được dùng đúng một lần
+    assert sorted(selector.usage.values()) == [1] * 6
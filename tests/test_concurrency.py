@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+import concurrency
+from concurrency import ConcurrencyController
+
+
+def encoder(name="libx264", cpu=True):
+    return SimpleNamespace(name=name, speed="medium", spec=SimpleNamespace(cpu=cpu))
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    """Giả lập số core và RAM trống của máy"""
+    def configure(cores, memory_mb=None):
+        monkeypatch.setattr(concurrency, "available_cores", lambda: cores)
+        monkeypatch.setattr(concurrency, "available_memory_mb", lambda: memory_mb)
+    return configure
+
+
+@pytest.fixture
+def controller(tmp_path):
+    return ConcurrencyController(state_file=str(tmp_path / "concurrency.json"))
+
+
+def test_first_batch_splits_cores_by_encoder_threads(machine, controller):
+    machine(32)
+    assert controller.choose_workers(encoder(), segments=1, job_count=10) == 4
+    assert controller.choose_workers(encoder(), segments=2, job_count=10) == 2
+    assert controller.choose_workers(encoder(), segments=1, job_count=3) == 3
+    machine(4)
+    assert controller.choose_workers(encoder(), segments=1, job_count=10) == 1
+
+
+def test_gpu_encoder_limited_by_sessions(machine, controller):
+    machine(32)
+    assert controller.choose_workers(encoder("h264_nvenc", cpu=False), 1, 10) == 2
+    assert controller.max_workers(encoder("h264_nvenc", cpu=False), 10) == 3
+
+
+def test_memory_limits_workers(machine, controller):
+    machine(32, memory_mb=1024 + 1500 * 2 + 100)
+    assert controller.max_workers(encoder(), 10) == 2
+    machine(32, memory_mb=500)
+    assert controller.max_workers(encoder(), 10) == 1
+
+
+def test_history_tries_neighbours_then_keeps_fastest(machine, controller):
+    machine(32)
+    enc = encoder()
+    controller.record(enc, 1, 4, media_seconds=400, elapsed=100)
+    assert controller.choose_workers(enc, 1, 10) == 5
+    controller.record(enc, 1, 5, media_seconds=300, elapsed=100)
+    assert controller.choose_workers(enc, 1, 10) == 3
+    controller.record(enc, 1, 3, media_seconds=350, elapsed=100)
+    assert controller.choose_workers(enc, 1, 10) == 4
+
+
+def test_record_smooths_speed(machine, controller):
+    machine(8)
+    enc = encoder()
+    controller.record(enc, 1, 2, media_seconds=100, elapsed=100)
+    controller.record(enc, 1, 2, media_seconds=300, elapsed=100)
+    controller.record(enc, 1, 2, media_seconds=0, elapsed=100)  # Không có gì được render: bỏ qua
+    history = controller.load_history()
+    assert history[controller.history_key(enc, 1)] == {"2": pytest.approx(2.0)}
+
+
+def test_plan_divides_cores(machine, controller):
+    machine(16)
+    budget = controller.plan(encoder(), segments=1, job_count=10, workers=2)
+    assert (budget.workers, budget.threads, budget.filter_threads) == (2, 8, 4)
+    budget = controller.plan(encoder(), segments=2, job_count=10, workers=4)
+    assert (budget.workers, budget.threads, budget.filter_threads) == (4, 2, 2)
+    assert budget.cpu_slots is None
+
+
+def test_plan_never_exceeds_job_count(machine, controller):
+    machine(16)
+    budget = controller.plan(encoder(), segments=1, job_count=1, workers=6)
+    assert budget.workers == 1
+    assert budget.threads == 8
+
+
+def test_from_settings(tmp_path):
+    assert ConcurrencyController.from_settings({"auto": False}) is None
+    controller = ConcurrencyController.from_settings({"state_file": str(tmp_path / "c.json"), "gpu_sessions": 0})
+    assert controller.state_file == str(tmp_path / "c.json")
+    assert controller.gpu_sessions == 1
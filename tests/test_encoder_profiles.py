@@ -0,0 +1,23 @@
+import subprocess
+
+import encoder_profiles
+
+
+def test_hung_ffmpeg_means_no_capabilities(monkeypatch):
+    def hang(cmd, timeout=None, cancel_event=None):
+        assert timeout  # Lệnh dò khả năng luôn có timeout
+        raise subprocess.TimeoutExpired(cmd, timeout)
+
+    monkeypatch.setattr(encoder_profiles, "run_process", hang)
+    encoder_profiles.detect_capabilities.cache_clear()
+    try:
+        caps = encoder_profiles.detect_capabilities()
+        assert not caps.encoders and not caps.filters and not caps.hwaccels
+    finally:
+        encoder_profiles.detect_capabilities.cache_clear()
+
+
+def test_encoder_list_is_parsed(monkeypatch):
+    output = "Encoders:\n V..... = Video\n ------\n V....D libx264   H.264\n A....D aac   AAC\n"
+    monkeypatch.setattr(encoder_profiles, "run_process", lambda cmd, timeout=None: output)
+    assert encoder_profiles._names(encoder_profiles._ffmpeg_list('-encoders')) == {"libx264", "aac"}
@@ -0,0 +1,132 @@
+import os
+import stat
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from ffmpeg_utils import Cancelled, FfmpegProgress, Stalled, escape_filter_path, run_ffmpeg, with_retries
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    """Tạo script thay cho ffmpeg; run_ffmpeg chèn -progress pipe:1 vào sau tên lệnh nên script bỏ qua mọi tham số"""
+    if os.name == 'nt':
+        pytest.skip("fake ffmpeg is a POSIX script")
+
+    def make(body: str) -> str:
+        path = tmp_path / "ffmpeg"
+        path.write_text(f"#!{sys.executable}\nimport sys, time\n" + textwrap.dedent(body), encoding="utf-8")
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+        return str(path)
+    return make
+
+
+def test_escape_filter_path():
+    assert escape_filter_path("/tmp/job/merged.ass") == "/tmp/job/merged.ass"
+    # Windows: '\\' thành '/'; ':' escape ở mức option, '\\' của nó lại được escape ở mức filtergraph
+    assert escape_filter_path("C:\\subs\\a.ass") == "C\\\\:/subs/a.ass"
+    assert escape_filter_path("/tmp/it's [1],x;y.ass") == "/tmp/it\\\\\\'s \\[1\\]\\,x\\;y.ass"
+
+
+def test_progress_is_parsed(fake_ffmpeg):
+    script = fake_ffmpeg("""
+        for position, frame in ((1_000_000, 30), (2_500_000, 75)):
+            print(f"frame={frame}\\nfps=60.5\\nout_time_us={position}\\nspeed=2.5x\\nprogress=continue", flush=True)
+        print("frame=N/A\\nout_time_ms=4000000\\nspeed=N/A\\nprogress=end", flush=True)
+    """)
+    reports = []
+    run_ffmpeg([script], total_duration=4.0, on_progress=reports.append)
+    assert [(p.time, p.frame, p.done) for p in reports] == [(1.0, 30, False), (2.5, 75, False), (4.0, 0, True)]
+    assert reports[1].fps == 60.5 and reports[1].speed == 2.5
+    assert reports[-1].percent == 100.0
+
+
+def test_error_exit_raises(fake_ffmpeg):
+    script = fake_ffmpeg("sys.exit(3)\n")
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        run_ffmpeg([script])
+    assert error.value.returncode == 3
+
+
+def test_progress_eta_and_describe():
+    progress = FfmpegProgress(time=30.0, total=90.0, fps=60, speed=2.0, elapsed=15.0)
+    assert progress.percent == pytest.approx(100 / 3)
+    assert progress.eta == 30.0
+    assert progress.describe() == "33% (30.0/90.0s) 60 fps 2.00x ETA 0:30"
+    assert FfmpegProgress(total=0).eta is None
+
+
+def test_stalled_ffmpeg_is_stopped(fake_ffmpeg):
+    script = fake_ffmpeg("""
+        print("out_time_us=1000000\\nprogress=continue", flush=True)
+        time.sleep(60)
+    """)
+    start = time.monotonic()
+    with pytest.raises(Stalled):
+        run_ffmpeg([script], stall_timeout=1)
+    assert time.monotonic() - start < 10
+
+
+def test_timeout_stops_ffmpeg_that_keeps_progressing(fake_ffmpeg):
+    script = fake_ffmpeg("""
+        for i in range(1, 600):
+            print(f"out_time_us={i * 100000}\\nprogress=continue", flush=True)
+            time.sleep(0.1)
+    """)
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_ffmpeg([script], timeout=1, stall_timeout=5)
+    assert time.monotonic() - start < 10
+
+
+def test_silent_ffmpeg_can_be_cancelled(fake_ffmpeg):
+    script = fake_ffmpeg("time.sleep(60)\n")
+    cancel = threading.Event()
+    threading.Timer(0.5, cancel.set).start()
+    start = time.monotonic()
+    with pytest.raises(Cancelled):
+        run_ffmpeg([script], cancel_event=cancel, stall_timeout=None)
+    assert time.monotonic() - start < 10
+
+
+def flaky(failures):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return "ok"
+    return func, calls
+
+
+def test_with_retries_retries_timeouts_and_stalls():
+    func, calls = flaky([subprocess.TimeoutExpired("ffmpeg", 1), Stalled("stuck")])
+    assert with_retries(func, retries=2, backoff=0) == "ok"
+    assert len(calls) == 3
+
+
+def test_with_retries_gives_up():
+    func, calls = flaky([subprocess.TimeoutExpired("ffmpeg", 1)] * 3)
+    with pytest.raises(subprocess.TimeoutExpired):
+        with_retries(func, retries=1, backoff=0)
+    assert len(calls) == 2
+
+
+def test_with_retries_does_not_retry_ffmpeg_errors():
+    func, calls = flaky([subprocess.CalledProcessError(1, "ffmpeg")])
+    with pytest.raises(subprocess.CalledProcessError):
+        with_retries(func, retries=3, backoff=0)
+    assert len(calls) == 1
+
+
+def test_with_retries_cancel_during_backoff():
+    func, calls = flaky([subprocess.TimeoutExpired("ffmpeg", 1)])
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(Cancelled):
+        with_retries(func, retries=1, backoff=60, cancel_event=cancel)
+    assert len(calls) == 1
@@ -0,0 +1,41 @@
+import pytest
+
+from job_order import JobOrder
+
+DURATIONS = {"a": 30.0, "b": 10.0, "c": None, "d": 20.0}
+
+
+def test_name_policy():
+    assert JobOrder().sort(["d", "b", "a", "c"], DURATIONS) == ["a", "b", "c", "d"]
+
+
+def test_shortest_first_puts_unknown_last():
+    assert JobOrder("shortest_first").sort(list(DURATIONS), DURATIONS) == ["b", "d", "a", "c"]
+
+
+def test_longest_first_puts_unknown_last():
+    assert JobOrder("longest_first").sort(list(DURATIONS), DURATIONS) == ["a", "d", "b", "c"]
+
+
+def test_ties_are_broken_by_name():
+    durations = {"y": 5.0, "x": 5.0}
+    assert JobOrder("shortest_first").sort(["y", "x"], durations) == ["x", "y"]
+
+
+def test_priorities_before_policy():
+    order = JobOrder.from_settings({"policy": "shortest_first", "priorities": {"A*": 10, "c": -1}})
+    assert order.priority("a_long") == 10
+    assert order.priority("b") == 0
+    names = ["a_long", "b", "c", "d"]
+    durations = {"a_long": 100.0, "b": 10.0, "c": 1.0, "d": 20.0}
+    assert order.sort(names, durations) == ["a_long", "b", "d", "c"]
+
+
+def test_from_settings_defaults():
+    order = JobOrder.from_settings(None)
+    assert order.policy == "name" and order.priorities == {}
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        JobOrder("random")
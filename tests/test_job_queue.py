@@ -0,0 +1,106 @@
+import os
+import time
+
+import pytest
+
+from job_queue import DONE, FAILED, PENDING, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), lease_seconds=60, max_attempts=2)
+
+
+def test_enqueue_is_idempotent_per_key(queue):
+    assert queue.enqueue("a.wav#1", "a", {"files": {}})
+    assert not queue.enqueue("a.wav#1", "a", {"files": {}})
+    # Cùng file nhưng nội dung khác là job mới
+    assert queue.enqueue("a.wav#2", "a", {"files": {}})
+    assert queue.counts() == {PENDING: 2}
+
+
+def test_claim_in_order_and_complete(queue):
+    queue.enqueue("a", "a", {"n": 1})
+    queue.enqueue("b", "b", {"n": 2})
+    job = queue.claim("w1")
+    assert (job.base_name, job.payload, job.attempts) == ("a", {"n": 1}, 1)
+    assert queue.claim("w2").base_name == "b"
+    assert queue.claim("w3") is None
+    assert queue.complete(job.id, "w1", "out.mp4")
+    assert queue.counts()[DONE] == 1
+
+
+def test_only_lease_owner_can_update(queue):
+    queue.enqueue("a", "a", {})
+    job = queue.claim("w1")
+    assert not queue.heartbeat(job.id, "w2")
+    assert not queue.complete(job.id, "w2", "out.mp4")
+    assert queue.heartbeat(job.id, "w1")
+
+
+def test_expired_lease_is_reclaimed(queue):
+    queue.lease_seconds = -1  # Lease hết hạn ngay
+    queue.enqueue("a", "a", {})
+    first = queue.claim("w1")
+    second = queue.claim("w2")
+    assert second.id == first.id and second.attempts == 2
+    # Worker cũ mất lease: heartbeat báo False để nó dừng render
+    assert not queue.heartbeat(first.id, "w1")
+    # Hết lượt thử: job bỏ dở bị chuyển sang failed thay vì nhận lại mãi
+    assert queue.claim("w3") is None
+    assert queue.counts() == {FAILED: 1}
+
+
+def test_fail_retries_then_gives_up(queue):
+    queue.enqueue("a", "a", {})
+    job = queue.claim("w1")
+    assert queue.fail(job.id, "w1", "boom")
+    assert queue.counts() == {PENDING: 1}
+    job = queue.claim("w1")
+    assert job.attempts == 2
+    queue.fail(job.id, "w1", "boom again")
+    assert queue.counts() == {FAILED: 1}
+    assert queue.failed_jobs() == [{"base_name": "a", "attempts": 2, "error": "boom again"}]
+
+    assert queue.retry_failed() == 1
+    assert queue.claim("w1").attempts == 1
+
+
+def test_release_does_not_count_attempt(queue):
+    queue.enqueue("a", "a", {})
+    job = queue.claim("w1")
+    assert queue.release(job.id, "w1")
+    assert queue.claim("w2").attempts == 1
+
+
+def test_heartbeat_extends_lease(queue):
+    queue.lease_seconds = 0.5
+    queue.enqueue("a", "a", {})
+    job = queue.claim("w1")
+    time.sleep(0.3)
+    assert queue.heartbeat(job.id, "w1")
+    time.sleep(0.3)
+    # Lease đã được gia hạn nên worker khác chưa nhận được
+    assert queue.claim("w2") is None
+
+
+def test_worker_resolves_library_clips_through_its_own_cache(tmp_path):
+    from media_index import ClipInfo
+    from worker import resolve_backgrounds
+
+    class FakeCache:
+        def __init__(self):
+            self.ingested = []
+
+        def ingest(self, clips):
+            self.ingested.extend(clips)
+
+        def resolve(self, clips):
+            return [f"/local/cache/{os.path.basename(clip.path)}" for clip in clips]
+
+    clips = [{"path": "/share/videos/a.mp4", "size": 1, "mtime_ns": 2, "duration": 3.0}]
+    assert resolve_backgrounds(None, FakeCache()) is None
+    assert resolve_backgrounds(clips, None) == ["/share/videos/a.mp4"]
+    cache = FakeCache()
+    assert resolve_backgrounds(clips, cache) == ["/local/cache/a.mp4"]
+    assert cache.ingested == [ClipInfo(**clips[0])]
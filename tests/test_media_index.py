@@ -0,0 +1,83 @@
+import subprocess
+
+import pytest
+
+import media_index
+from media_index import MediaIndex
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    folder = tmp_path / "videos"
+    folder.mkdir()
+    results = {}
+    calls = []
+
+    def fake_probe(path, limits=None):
+        calls.append(path.rsplit("/", 1)[-1])
+        result = results[path.rsplit("/", 1)[-1]]
+        if isinstance(result, Exception):
+            raise result
+        return {"duration": result}
+
+    monkeypatch.setattr(media_index, "probe_clip", fake_probe)
+    return folder, results, calls
+
+
+def add(folder, name):
+    (folder / name).write_bytes(b"x")
+
+
+def test_valid_clips_are_cached(library):
+    folder, results, calls = library
+    add(folder, "a.mp4")
+    add(folder, "notes.txt")
+    results["a.mp4"] = 12.5
+    clips = MediaIndex(str(folder)).refresh()
+    assert [(c.path.rsplit("/", 1)[-1], c.duration) for c in clips] == [("a.mp4", 12.5)]
+    # Index mới đọc từ đĩa không probe lại clip không đổi
+    MediaIndex(str(folder)).refresh()
+    assert calls == ["a.mp4"]
+
+
+def test_corrupt_clips_are_quarantined(library):
+    folder, results, calls = library
+    for name in ("bad.mp4", "empty.mp4", "garbage.mp4"):
+        add(folder, name)
+    results["bad.mp4"] = subprocess.CalledProcessError(1, "ffprobe")
+    results["empty.mp4"] = 0.0
+    results["garbage.mp4"] = ValueError("bad json")
+    index = MediaIndex(str(folder))
+    assert index.refresh() == []
+    assert sorted(index.quarantine) == ["bad.mp4", "empty.mp4", "garbage.mp4"]
+    MediaIndex(str(folder)).refresh()
+    assert len(calls) == 3
+
+
+def test_timeouts_are_retried_on_next_refresh(library):
+    folder, results, calls = library
+    add(folder, "slow.mp4")
+    results["slow.mp4"] = subprocess.TimeoutExpired("ffprobe", 60)
+    index = MediaIndex(str(folder))
+    assert index.refresh() == []
+    assert index.quarantine == {}
+    results["slow.mp4"] = 8.0
+    assert [c.duration for c in MediaIndex(str(folder)).refresh()] == [8.0]
+    assert calls == ["slow.mp4", "slow.mp4"]
+
+
+def test_changed_or_removed_clips(library):
+    folder, results, calls = library
+    add(folder, "a.mp4")
+    add(folder, "b.mp4")
+    results["a.mp4"] = subprocess.CalledProcessError(1, "ffprobe")
+    results["b.mp4"] = 5.0
+    MediaIndex(str(folder)).refresh()
+
+    # File hỏng được ghi đè (đổi size) thì probe lại và ra khỏi quarantine
+    (folder / "a.mp4").write_bytes(b"fixed")
+    results["a.mp4"] = 4.0
+    (folder / "b.mp4").unlink()
+    index = MediaIndex(str(folder))
+    assert [c.duration for c in index.refresh()] == [4.0]
+    assert index.quarantine == {} and list(index.clips) == ["a.mp4"]
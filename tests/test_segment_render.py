@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+from ffmpeg_utils import OUTPUT_FPS
+from segment_render import Segment, SegmentRenderer, plan_segments
+
+
+@pytest.mark.parametrize("duration,count", [(95.37, 4), (60.0, 3), (123.456, 5), (41.0, 2)])
+def test_segments_cover_every_frame_once(duration, count):
+    segments = plan_segments(duration, count)
+    assert len(segments) == count
+    assert segments[0].start_frame == 0
+    # Đoạn sau bắt đầu đúng ở frame kết thúc của đoạn trước, tổng frame bằng video một lượt
+    assert all(a.start_frame + a.frames == b.start_frame for a, b in zip(segments, segments[1:]))
+    assert sum(s.frames for s in segments) == round(duration * OUTPUT_FPS)
+    assert max(s.frames for s in segments) - min(s.frames for s in segments) <= 1
+    assert [s.index for s in segments] == list(range(count))
+
+
+def test_segment_bounds_are_on_frames():
+    segments = plan_segments(95.37, 4)
+    for segment in segments:
+        assert segment.start * OUTPUT_FPS == pytest.approx(segment.start_frame)
+        assert segment.end * OUTPUT_FPS == pytest.approx(segment.start_frame + segment.frames)
+    assert segments[-1].end == pytest.approx(round(95.37 * OUTPUT_FPS) / OUTPUT_FPS)
+
+
+def test_short_video_gets_fewer_segments():
+    assert len(plan_segments(45, 8)) == 2
+    assert len(plan_segments(45, 8, min_duration=5)) == 8
+    assert len(plan_segments(5, 4)) == 1
+    assert plan_segments(0, 3) == [Segment(0, 0, 1)]
+
+
+class FakeProcessor:
+    def build_video_filters(self, ass_path, thumb_input, overlay_duration, time_offset=0):
+        self.time_offset = time_offset
+        return ['[0:v]null[v]'], 'v'
+
+
+def fake_profile():
+    return SimpleNamespace(name="libx264", threads=2, spec=SimpleNamespace(cpu=True),
+                           input_args=lambda: [], output_args=lambda: ['-c:v', 'libx264'])
+
+
+def test_segment_command_seeks_and_counts_frames():
+    processor = FakeProcessor()
+    renderer = SegmentRenderer(processor, fake_profile(), segments=3)
+    segment = plan_segments(100.0, 3)[1]
+    cmd = renderer.build_segment_command(segment, "bg.txt", None, "thumb.png", 5.0, "out.mp4")
+    assert cmd[cmd.index('-ss') + 1] == f"{segment.start:.6f}"
+    assert cmd[cmd.index('-frames:v') + 1] == str(segment.frames)
+    assert cmd[cmd.index('-r') + 1] == str(OUTPUT_FPS)
+    # Đoạn giữa bắt đầu sau khi thumbnail đã tắt nên không cần input thumbnail
+    assert "thumb.png" not in cmd
+    assert processor.time_offset == segment.start
@@ -0,0 +1,81 @@
+import csv
+import json
+
+import pytest
+
+from batch_runner import BatchSummary, JobResult
+from stage_timer import StageTimer, cpu_cell, percentile, summarize_stages, write_batch_report
+
+
+def test_percentile_interpolates():
+    values = [4.0, 1.0, 3.0, 2.0]
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 50) == 2.5
+    assert percentile(values, 90) == pytest.approx(3.7)
+    assert percentile(values, 100) == 4.0
+    assert percentile([7.0], 99) == 7.0
+    assert percentile([], 50) == 0.0
+
+
+def test_timer_adds_up_repeated_stages():
+    timer = StageTimer()
+    for _ in range(2):
+        with timer.stage("render"):
+            pass
+    with pytest.raises(RuntimeError):
+        with timer.stage("audio"):
+            raise RuntimeError("stage failed")
+    timings = timer.as_dict()
+    assert set(timings) == {"render", "audio"}
+    assert len(timer.timings) == 3
+    assert timings["render"]["wall"] == pytest.approx(sum(t.wall for t in timer.timings[:2]))
+
+
+def test_summarize_stages():
+    jobs = [{"render": {"wall": float(i), "cpu": 1.0, "child_cpu": 2.0}} for i in range(1, 11)]
+    summary = summarize_stages(jobs)["render"]
+    assert summary["jobs"] == 10
+    assert summary["wall_mean"] == 5.5
+    assert summary["wall_max"] == 10.0
+    assert summary["wall_p50"] == 5.5
+    assert summary["wall_p90"] == pytest.approx(9.1)
+    assert summary["child_cpu_p99"] == 2.0
+
+
+def test_summarize_skips_unmeasured_child_cpu():
+    jobs = [{"render": {"wall": 1.0, "cpu": 0.5, "child_cpu": None}}] * 2
+    summary = summarize_stages(jobs)["render"]
+    assert summary["jobs"] == 2
+    assert "cpu_mean" in summary
+    assert not any(key.startswith("child_cpu") for key in summary)
+
+
+def test_cpu_cell():
+    assert cpu_cell({"cpu": 0.25, "child_cpu": 1.5}) == "1.750"
+    assert cpu_cell({"cpu": 0.25, "child_cpu": None}) == ""
+    assert cpu_cell({}) == "0.000"
+
+
+def test_write_batch_report(tmp_path):
+    summary = BatchSummary(results=[
+        JobResult("a", True, elapsed=3.0, timings={"audio": {"wall": 1.0, "cpu": 0.1, "child_cpu": 0.4},
+                                                  "render": {"wall": 2.0, "cpu": 0.2, "child_cpu": None}}),
+        JobResult("b", False, elapsed=1.0, error="boom", timings={"audio": {"wall": 0.5, "cpu": 0.1, "child_cpu": 0.1}}),
+        JobResult("c", True, skipped=True),
+    ], elapsed=7200.0)
+    path = write_batch_report(summary, str(tmp_path), extra={"encoder": "libx264"})
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    assert (data["jobs_total"], data["jobs_succeeded"], data["jobs_failed"], data["jobs_skipped"]) == (3, 1, 1, 1)
+    assert data["videos_per_hour"] == 0.5
+    assert data["encoder"] == "libx264"
+    assert [job["base_name"] for job in data["jobs"]] == ["a", "b"]
+    # Chỉ job thành công được tính vào thống kê stage
+    assert data["stages"]["audio"]["jobs"] == 1
+
+    with open(path[:-len(".json")] + ".csv", encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["base_name", "success", "elapsed", "audio_wall", "render_wall", "audio_cpu", "render_cpu"]
+    assert rows[1] == ["a", "1", "3.000", "1.000", "2.000", "0.500", ""]
+    assert rows[2] == ["b", "0", "1.000", "0.500", "0.000", "0.200", "0.000"]
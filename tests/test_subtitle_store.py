@@ -0,0 +1,75 @@
+from subtitle_store import SubtitleTrack, _ass_time, merge_tracks
+
+SRT = """1
+00:00:01,500 --> 00:00:03,000
+Hello <i>world</i>
+
+2
+00:00:04,000 --> 00:00:05.25
+Second
+line
+"""
+
+
+def test_from_srt(tmp_path):
+    path = tmp_path / "a.srt"
+    path.write_text("\ufeff" + SRT.replace("\n", "\r\n"), encoding="utf-8")
+    track = SubtitleTrack.from_srt(str(path))
+    assert list(track.events()) == [
+        (1500, 3000, "Hello {\\i1}world{\\i0}"),
+        (4000, 5250, "Second\\Nline"),
+    ]
+
+
+def test_shift_is_applied_on_read():
+    track = SubtitleTrack.from_events([(0, 1000, "a"), (2000, 3000, "b")])
+    track.shift(500).shift(250)
+    assert list(track.events()) == [(750, 1750, "a"), (2750, 3750, "b")]
+    assert list(track.starts) == [0, 2000]
+
+
+def test_merge_tracks_sorts_by_start():
+    hook = SubtitleTrack.from_events([(0, 1000, "h1"), (1500, 2500, "h2")])
+    audio = SubtitleTrack.from_events([(0, 1000, "a1"), (500, 900, "a2")]).shift(2000)
+    unsorted = SubtitleTrack.from_events([(900, 950, "u2"), (100, 200, "u1")])
+    merged = merge_tracks([hook, audio, unsorted])
+    assert [text for _, _, text in merged.events()] == ["h1", "u1", "u2", "h2", "a1", "a2"]
+    assert merged.is_sorted()
+
+
+def test_window_clips_and_rebases():
+    track = SubtitleTrack.from_events([(0, 1000, "a"), (900, 2100, "b"), (3000, 4000, "c")])
+    window = track.window(1000, 2000)
+    assert list(window.events()) == [(0, 1000, "b")]
+
+
+def test_wrap_short_text_unchanged():
+    track = SubtitleTrack.from_events([(0, 1000, "short line")])
+    assert list(track.wrap(20).events()) == [(0, 1000, "short line")]
+
+
+def test_wrap_breaks_lines():
+    track = SubtitleTrack.from_events([(0, 1000, "one two three four")])
+    assert list(track.wrap(10).events()) == [(0, 1000, "one two\\Nthree four")]
+
+
+def test_wrap_splits_long_event_by_characters():
+    text = "aaaa bbbb cccc dddd eeee ffff"
+    track = SubtitleTrack.from_events([(1000, 4000, text)])
+    events = list(track.wrap(4, max_lines=2).events())
+    assert [t for _, _, t in events] == ["aaaa\\Nbbbb", "cccc\\Ndddd", "eeee\\Nffff"]
+    # Các phần nối tiếp nhau và phủ đúng thời gian của event gốc
+    assert events[0][0] == 1000 and events[-1][1] == 4000
+    assert all(a[1] == b[0] for a, b in zip(events, events[1:]))
+
+
+def test_wrap_keeps_ass_tags():
+    text = "{\\i1}a very long line that would otherwise wrap{\\i0}"
+    track = SubtitleTrack.from_events([(0, 1000, text)])
+    assert list(track.wrap(10).events()) == [(0, 1000, text)]
+
+
+def test_ass_time():
+    assert _ass_time(0) == "0:00:00.00"
+    assert _ass_time(3723456) == "1:02:03.46"
+    assert _ass_time(-10) == "0:00:00.00"
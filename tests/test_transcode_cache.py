@@ -0,0 +1,34 @@
+import os
+import time
+
+from media_index import ClipInfo
+from transcode_cache import TranscodeCache
+
+
+def cached_clip(cache, name, size, age):
+    clip = ClipInfo(path=f"/videos/{name}", size=size, mtime_ns=1, duration=5.0)
+    path = cache.cache_path(clip)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return clip, path
+
+
+def test_lookup_and_resolve(tmp_path):
+    cache = TranscodeCache(str(tmp_path), max_bytes=100)
+    clip, path = cached_clip(cache, "a.mp4", 10, age=3600)
+    missing = ClipInfo(path="/videos/b.mp4", size=1, mtime_ns=1, duration=5.0)
+    assert cache.resolve([clip, missing]) == [path, "/videos/b.mp4"]
+    # lookup đánh dấu clip vừa được dùng cho LRU
+    assert os.path.getmtime(path) > time.time() - 60
+
+
+def test_evict_lru_but_keep_recent(tmp_path):
+    cache = TranscodeCache(str(tmp_path), max_bytes=15, evict_grace_seconds=600)
+    _, oldest = cached_clip(cache, "a.mp4", 10, age=7200)
+    _, old = cached_clip(cache, "b.mp4", 10, age=3600)
+    _, recent = cached_clip(cache, "c.mp4", 10, age=60)
+    cache.evict()
+    # Vẫn vượt giới hạn nhưng clip dùng gần đây có thể đang được job đọc
+    assert [os.path.exists(p) for p in (oldest, old, recent)] == [False, False, True]
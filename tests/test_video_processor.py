@@ -0,0 +1,11 @@
+from video_processor import VideoProcessor
+
+
+def test_start_job_forgets_previous_encoder(tmp_path):
+    processor = VideoProcessor(str(tmp_path / "work"), str(tmp_path / "out"), encoder="libx264")
+    processor.used_encoder = processor.encoder
+    processor.start_job()
+    try:
+        assert processor.used_encoder is None
+    finally:
+        processor.cleanup()
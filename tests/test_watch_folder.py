@@ -0,0 +1,111 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import watch_folder
+from batch_settings import BatchSettings
+from watch_folder import FolderWatcher
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(watch_folder, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(watch_folder, "INotify", None)  # Chỉ quét, không phụ thuộc inotify của máy test
+    input_folder = tmp_path / "input"
+    input_folder.mkdir()
+    batch_settings = BatchSettings(str(tmp_path / "batch_settings.json"))
+    batch_settings.settings["input_folder"] = str(input_folder)
+    return FolderWatcher(batch_settings, settle_seconds=10)
+
+
+def write(watcher, name, data=b"x"):
+    with open(os.path.join(watcher.batch_settings.settings["input_folder"], name), "ab") as f:
+        f.write(data)
+
+
+def test_set_is_ready_after_settling(watcher, clock):
+    write(watcher, "KB2_audio.wav")
+    write(watcher, "KB2_audio.srt")
+    assert watcher.poll() == {}
+    clock.now += 5
+    assert watcher.poll() == {}
+    clock.now += 5
+    ready = watcher.poll()
+    assert list(ready) == ["kb2"]
+    assert os.path.basename(ready["kb2"]["audio"]) == "KB2_audio.wav"
+    # Mỗi bộ chỉ được trả về một lần
+    clock.now += 60
+    assert watcher.poll() == {}
+
+
+def test_write_in_progress_restarts_settle(watcher, clock):
+    write(watcher, "KB2_audio.wav")
+    write(watcher, "KB2_audio.srt")
+    watcher.poll()
+    clock.now += 8
+    write(watcher, "KB2_audio.wav", b"more")
+    assert watcher.poll() == {}
+    clock.now += 8
+    assert watcher.poll() == {}
+    clock.now += 2
+    assert list(watcher.poll()) == ["kb2"]
+
+
+def test_incomplete_sets_wait(watcher, clock):
+    write(watcher, "A_audio.wav")               # Thiếu subtitle
+    write(watcher, "B_audio.wav")
+    write(watcher, "B_audio.srt")
+    write(watcher, "B_hook.mp3")                # Hook không có hook subtitle
+    watcher.poll()
+    clock.now += 30
+    assert watcher.poll() == {}
+    write(watcher, "B_hook.srt")
+    watcher.poll()
+    clock.now += 10
+    assert list(watcher.poll()) == ["b"]
+
+
+def test_overwritten_set_is_ready_again(watcher, clock):
+    write(watcher, "KB2_audio.wav")
+    write(watcher, "KB2_audio.srt")
+    watcher.poll()
+    clock.now += 10
+    assert list(watcher.poll()) == ["kb2"]
+    write(watcher, "KB2_audio.srt", b"new subtitle")
+    assert watcher.poll() == {}
+    clock.now += 10
+    assert list(watcher.poll()) == ["kb2"]
+
+
+def test_removed_set_is_forgotten(watcher, clock):
+    write(watcher, "KB2_audio.wav")
+    write(watcher, "KB2_audio.srt")
+    watcher.poll()
+    assert "kb2" in watcher.pending
+    os.remove(os.path.join(watcher.batch_settings.settings["input_folder"], "KB2_audio.wav"))
+    os.remove(os.path.join(watcher.batch_settings.settings["input_folder"], "KB2_audio.srt"))
+    assert watcher.poll() == {}
+    assert watcher.pending == {}
+
+
+def test_from_settings(watcher):
+    watcher.batch_settings.settings["watch"] = {"settle_seconds": 3, "require": ["audio"]}
+    configured = FolderWatcher.from_settings(watcher.batch_settings)
+    assert configured.settle_seconds == 3.0
+    assert configured.require == ("audio",)
+    assert configured.is_complete({"audio": "a.wav", "subtitle": None, "hook": None, "hook_subtitle": None})
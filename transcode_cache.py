@@ -0,0 +1,149 @@
+import os
+import time
+import logging
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+
+from ffmpeg_utils import OUTPUT_FPS, OUTPUT_HEIGHT, OUTPUT_WIDTH, ProcessLimits, run_ffmpeg, with_retries
+from media_index import ClipInfo
+
+logger = logging.getLogger(__name__)
+
+# Format chuẩn của clip nền sau khi ingest: cùng codec, độ phân giải, fps và GOP
+CANONICAL_WIDTH = OUTPUT_WIDTH
+CANONICAL_HEIGHT = OUTPUT_HEIGHT
+CANONICAL_FPS = OUTPUT_FPS
+CANONICAL_GOP = 60
+# Clip được chọn lúc lập kế hoạch batch nhưng có thể hàng giờ sau mới được job đọc: không xóa clip dùng gần đây
+EVICT_GRACE_SECONDS = 24 * 3600
+
+
+class TranscodeCache:
+    """Cache các clip nền đã được transcode về format chuẩn, giới hạn dung lượng, xóa theo LRU
+
+    Tên file cache là hash của (đường dẫn gốc, size, mtime) nên clip gốc thay đổi thì bản cache cũ
+    không còn được dùng và sẽ bị xóa dần khi vượt giới hạn. mtime của file cache được cập nhật
+    mỗi lần dùng để làm thời điểm truy cập cho LRU. Clip được dùng trong evict_grace_seconds giây
+    gần đây không bị xóa dù cache vượt giới hạn, vì job đang chạy (hoặc đang chờ) có thể đã nhận
+    đường dẫn của nó.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, max_workers: int = 2,
+                 evict_grace_seconds: float = EVICT_GRACE_SECONDS, limits: Optional[ProcessLimits] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.evict_grace_seconds = evict_grace_seconds
+        self.limits = limits or ProcessLimits()  # Timeout, watchdog và thử lại của lệnh transcode
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls, settings: Optional[dict], limits: Optional[ProcessLimits] = None) -> Optional['TranscodeCache']:
+        """Tạo cache từ mục 'transcode_cache' trong batch_settings.json, None nếu không bật
+
+        Args:
+            limits: Giới hạn thời gian của lệnh ffmpeg (mục 'timeouts')
+        """
+        if not settings or not settings.get("enabled"):
+            return None
+        return cls(
+            settings.get("dir") or os.path.join(os.getcwd(), "cache", "clips"),
+            int(float(settings.get("max_gb", 50)) * 1024 ** 3),
+            int(settings.get("workers", 2)),
+            float(settings.get("evict_grace_seconds", EVICT_GRACE_SECONDS)),
+            limits,
+        )
+
+    def cache_path(self, clip: ClipInfo) -> str:
+        key = hashlib.sha1(f"{clip.path}|{clip.size}|{clip.mtime_ns}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    def lookup(self, clip: ClipInfo) -> Optional[str]:
+        """Trả về bản cache của clip nếu có (và đánh dấu vừa dùng), không thì None"""
+        path = self.cache_path(clip)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def resolve(self, clips: Iterable[ClipInfo]) -> List[str]:
+        """Map danh sách clip sang bản cache nếu có, không thì dùng file gốc"""
+        return [self.lookup(clip) or clip.path for clip in clips]
+
+    def transcode(self, clip: ClipInfo) -> Optional[str]:
+        """Transcode một clip về format chuẩn (ghi file tạm rồi rename để không để lại file dở)"""
+        dst = self.cache_path(clip)
+        tmp = f"{dst}.{os.getpid()}.tmp.mp4"
+        vf = (f"scale={CANONICAL_WIDTH}:{CANONICAL_HEIGHT}:force_original_aspect_ratio=increase,"
+              f"crop={CANONICAL_WIDTH}:{CANONICAL_HEIGHT},fps={CANONICAL_FPS},setsar=1,format=yuv420p")
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-i', clip.path,
+            '-an', '-vf', vf,
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18',
+            '-g', str(CANONICAL_GOP), '-keyint_min', str(CANONICAL_GOP), '-sc_threshold', '0',
+            '-movflags', '+faststart',
+            tmp
+        ]
+        try:
+            # Watchdog dừng ffmpeg nếu đọc clip bị treo, timeout/treo thì thử lại theo self.limits
+            limits = self.limits
+            with_retries(lambda: run_ffmpeg(cmd, clip.duration, timeout=limits.stage_seconds or None,
+                                            stall_timeout=limits.stall_seconds),
+                         limits.retries, limits.retry_backoff)
+            os.replace(tmp, dst)
+            return dst
+        except Exception as e:
+            logger.error(f"Error transcoding {os.path.basename(clip.path)}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return None
+
+    def ingest(self, clips: Iterable[ClipInfo]) -> int:
+        """Transcode các clip chưa có trong cache (song song), rồi dọn cache theo LRU
+
+        Returns:
+            Số clip được transcode mới
+        """
+        missing = [clip for clip in clips if not self.lookup(clip)]
+        if not missing:
+            return 0
+
+        logger.info(f"Transcoding {len(missing)} background clips to canonical format...")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            done = sum(1 for path in executor.map(self.transcode, missing) if path)
+        self.evict()
+        return done
+
+    def evict(self):
+        """Xóa các file ít được dùng gần đây nhất cho tới khi cache nằm trong giới hạn
+
+        Clip được dùng trong evict_grace_seconds giây gần đây được giữ lại.
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.mp4') and '.tmp' not in entry.name:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        protected_after = time.time() - self.evict_grace_seconds
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if mtime >= protected_after:
+                logger.warning(f"Transcode cache over limit by {(total - self.max_bytes) / 1024 ** 3:.1f} GB, "
+                               f"remaining clips are in use")
+                break
+            try:
+                os.remove(path)
+                total -= size
+                logger.info(f"Evicted cached clip: {os.path.basename(path)}")
+            except OSError as e:
+                logger.error(f"Error evicting {path}: {e}")
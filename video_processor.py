@@ -1,48 +1,125 @@
 import os
+import logging
 import subprocess
-from pydub import AudioSegment
-import glob
+from dataclasses import asdict, is_dataclass
 from typing import Optional, List, Tuple
-import re
 import math
-import random
-import pysubs2
 import time
-import json
 import shutil
+import tempfile
+from artifact_cache import ArtifactCache
+from audio_join import join_audio, read_wav_info
+from ffmpeg_utils import (OUTPUT_FPS, OUTPUT_HEIGHT, OUTPUT_WIDTH, Cancelled, FfmpegProgress, JobTimeout,
+                          ProcessLimits, escape_filter_path, run_ffmpeg, run_process, with_retries, write_concat_file)
+from encoder_profiles import EncoderProfile, detect_capabilities, make_profile, resolve_profiles
+from media_index import MediaIndex
+from transcode_cache import TranscodeCache
+from clip_selector import ClipSelector
+from subtitle_store import SubtitleTrack, merge_tracks, write_ass
+from segment_render import SegmentRenderer
+from stage_timer import StageTimer
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_MARGIN = 0.5  # Chọn dư nền một chút để video không kết thúc trước audio
+THUMBNAIL_FADE = 0.5  # Thời gian fade out của thumbnail ở cuối đoạn hook (giây)
 
 class VideoProcessor:
-    def __init__(self, work_dir: str, output_folder: str):
+    def __init__(self, work_dir: str, output_folder: str, encoder=None,
+                 transcode_cache: Optional[TranscodeCache] = None, segments: int = 1,
+                 artifact_cache: Optional[ArtifactCache] = None, limits: Optional[ProcessLimits] = None):
+        """
+        Args:
+            encoder: Tên encoder, dict cấu hình hoặc EncoderProfile (mặc định: nvenc như trước)
+            transcode_cache: Nếu có, dùng bản clip nền đã chuẩn hóa trong cache khi có sẵn
+            segments: > 1 để chia video thành nhiều đoạn và encode song song (xem segment_render)
+            artifact_cache: Nếu có, audio đã ghép, file ASS và thumbnail đã scale được dùng lại giữa các job/lần chạy
+            limits: Timeout từng lệnh/cả job, watchdog ffmpeg treo và số lần thử lại (xem ProcessLimits)
+        """
+        self.segments = max(1, int(segments or 1))
         self.work_dir = work_dir
         self.output_folder = output_folder
-        self.temp_dir = work_dir  # Use work_dir directly for temp files
-        os.makedirs(self.temp_dir, exist_ok=True)
+        self.encoder = make_profile(encoder)
+        self.transcode_cache = transcode_cache
+        self.artifact_cache = artifact_cache
+        self.limits = limits or ProcessLimits()
+        self.deadline = None  # time.monotonic() mà job hiện tại phải xong, None = không giới hạn
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.temp_dir = None  # Thư mục tạm riêng của job hiện tại, tạo trong start_job()
+        self.timer = StageTimer()  # Thời gian từng stage của job gần nhất
+        self.cancel_event = None  # Event của job đang chạy, set để hủy (xem process_video)
+        self.used_encoder = None  # EncoderProfile thực sự encode job gần nhất (có thể là encoder dự phòng)
         self.timestamp = int(time.time())  # Thêm timestamp cho temp files
 
+    def check_cancelled(self):
+        """Raise Cancelled nếu job hiện tại đã bị yêu cầu hủy"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise Cancelled()
+
+    def command_timeout(self, limit: float) -> Optional[float]:
+        """Timeout cho lệnh tiếp theo: limit của lệnh, nhưng không vượt quá thời gian còn lại của job"""
+        timeout = limit or None
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise JobTimeout(f"Job exceeded {self.limits.job_seconds:g}s")
+            timeout = min(timeout, remaining) if timeout else remaining
+        return timeout
+
+    def run_with_limits(self, func):
+        """Gọi func() với thử lại theo self.limits; lệnh bị timeout vì hết thời gian của job thì không thử lại"""
+        def attempt():
+            try:
+                return func()
+            except subprocess.TimeoutExpired as e:
+                if self.deadline is not None and time.monotonic() >= self.deadline:
+                    raise JobTimeout(f"Job exceeded {self.limits.job_seconds:g}s") from e
+                raise
+
+        return with_retries(attempt, self.limits.retries, self.limits.retry_backoff, self.cancel_event)
+
+    def run_ffmpeg(self, cmd: List[str], total_duration: float = 0.0, on_progress=None):
+        """Chạy ffmpeg với cancel_event, timeout, watchdog và thử lại theo self.limits"""
+        return self.run_with_limits(
+            lambda: run_ffmpeg(cmd, total_duration, on_progress, self.cancel_event,
+                               self.command_timeout(self.limits.stage_seconds), self.limits.stall_seconds)
+        )
+
+    def run_probe(self, cmd: List[str]) -> str:
+        """Chạy ffprobe với timeout và thử lại theo self.limits, trả về stdout"""
+        return self.run_with_limits(
+            lambda: run_process(cmd, self.command_timeout(self.limits.probe_seconds), self.cancel_event)
+        )
+
+    def start_job(self):
+        """Tạo thư mục tạm riêng cho một job để các job chạy song song không đụng file của nhau"""
+        self.timestamp = int(time.time())
+        self.timer = StageTimer()
+        self.used_encoder = None  # Job lỗi trước khi encode không được báo encoder của job trước
+        self.deadline = time.monotonic() + self.limits.job_seconds if self.limits.job_seconds else None
+        self.temp_dir = tempfile.mkdtemp(prefix=f"job_{self.timestamp}_", dir=self.work_dir)
+        logger.info(f"Using scratch directory: {self.temp_dir}")
+
     def cleanup(self):
-        """Clean up all temporary files in work directory"""
+        """Clean up temporary files of the current job only"""
         try:
-            # Remove all files in temp directory
-            if os.path.exists(self.temp_dir):
-                for file in os.listdir(self.temp_dir):
-                    file_path = os.path.join(self.temp_dir, file)
-                    try:
-                        os.remove(file_path)
-                        print(f"Removed temp file: {file}")
-                    except Exception as e:
-                        print(f"Error removing {file}: {e}")
-                print("Cleaned up temp directory")
-            
+            if self.temp_dir and os.path.exists(self.temp_dir):
+                shutil.rmtree(self.temp_dir)
+                logger.info(f"Cleaned up scratch directory: {self.temp_dir}")
         except Exception as e:
-            print(f"Error during cleanup: {e}")
+            logger.error(f"Error during cleanup: {e}")
+        finally:
+            self.temp_dir = None
 
     def get_temp_path(self, prefix: str, suffix: str) -> str:
-        """Tạo đường dẫn file tạm thởi với timestamp để tránh trùng
+        """Tạo đường dẫn file tạm trong thư mục riêng của job
         
         Args:
             prefix: Tiền tố của file (ví dụ: 'hook', 'main')
             suffix: Hậu tố của file (ví dụ: '.mp3', '.ass')
         """
+        if not self.temp_dir:
+            self.start_job()
         return os.path.join(self.temp_dir, f"{prefix}_{self.timestamp}{suffix}")
 
     def get_audio_duration(self, audio_path: str) -> float:
@@ -51,331 +128,192 @@ class VideoProcessor:
             'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
             '-of', 'default=noprint_wrappers=1:nokey=1', audio_path
         ]
-        duration = float(subprocess.check_output(cmd).decode().strip())
+        duration = float(self.run_probe(cmd).strip())
         return duration
 
-    def prepare_and_get_duration(self, hook_mp3: Optional[str], audio_mp3: str) -> Tuple[str, float]:
-        """Ghép audio và trả về đường dẫn file final + thời lượng chính xác"""
-        final_audio = audio_mp3
-        if hook_mp3:
-            final_audio = self.get_temp_path("merged", ".mp3")  # Lưu ở thư mục tạm
-            print(f"Merging hook ({hook_mp3}) with audio ({audio_mp3})")
-            
-            # Ghép audio
-            def load_audio(path):
-                ext = os.path.splitext(path)[1].lower()
-                if ext == '.mp3':
-                    return AudioSegment.from_mp3(path)
-                elif ext == '.wav':
-                    return AudioSegment.from_wav(path)
-                else:
-                    raise ValueError(f"Unsupported audio format: {ext}")
-            
-            try:
-                hook = load_audio(hook_mp3)
-                audio = load_audio(audio_mp3)
-                print(f"Hook duration: {len(hook)/1000:.2f}s")
-                print(f"Audio duration: {len(audio)/1000:.2f}s")
-                
-                merged = hook + audio
-                print(f"Merged duration: {len(merged)/1000:.2f}s")
-                merged.export(final_audio, format="mp3")
-                print(f"Exported merged audio to: {final_audio}")
-            except Exception as e:
-                print(f"Error merging audio: {e}")
-                raise
+    def prepare_and_get_duration(self, hook_mp3: Optional[str], audio_mp3: str) -> Tuple[str, float, float]:
+        """Ghép audio và trả về đường dẫn file final + thời lượng chính xác
 
-        # Lấy thời lượng chính xác
-        duration = self.get_audio_duration(final_audio)
-        print(f"Final audio duration: {duration:.2f}s")
-        return final_audio, duration
+        Audio được ghép bằng ffmpeg/copy dữ liệu WAV (xem audio_join), không load vào RAM.
 
-    def merge_srt_files(self, srt_files: List[Tuple[str, float]]) -> Optional[str]:
-        """Merge nhiều file SRT thành một, với offset cho từng file
-        
-        Args:
-            srt_files: List of (srt_path, offset) tuples - offset in seconds
+        Returns:
+            (final_audio, total_duration, hook_duration)
         """
+        if not hook_mp3:
+            # Không cần ghép: WAV thì đọc thời lượng từ header, file khác mới cần ffprobe
+            info = read_wav_info(audio_mp3)
+            duration = info.duration if info else self.get_audio_duration(audio_mp3)
+            logger.info(f"Final audio duration: {duration:.2f}s")
+            return audio_mp3, duration, 0
+
+        logger.info(f"Merging hook ({hook_mp3}) with audio ({audio_mp3})")
         try:
-            if not srt_files:
-                return None
-                
-            if len(srt_files) == 1:
-                # Nếu chỉ có 1 file và không cần offset thì dùng luôn
-                if srt_files[0][1] == 0:
-                    return srt_files[0][0]
-            
-            # Đọc và merge tất cả subtitle
-            merged_subs = None
-            for srt_path, offset in srt_files:
-                try:
-                    subs = pysubs2.load(srt_path, encoding='utf-8')
-                    print(f"Successfully loaded SRT file: {srt_path}")
-                    
-                    # Apply offset nếu cần
-                    if offset > 0:
-                        offset_ms = int(offset * 1000)  # Convert to milliseconds
-                        for line in subs:
-                            old_start = line.start
-                            line.start += offset_ms
-                            line.end += offset_ms
-                            print(f"Line timing: {old_start}ms -> {line.start}ms (offset: +{offset_ms}ms)")
-                    
-                    if merged_subs is None:
-                        merged_subs = subs
-                    else:
-                        merged_subs.events.extend(subs.events)
-                except Exception as e:
-                    print(f"Error loading subtitle file {srt_path}: {e}")
-                    return None
-            
-            # Sắp xếp lại theo thời gian
-            if merged_subs:
-                merged_subs.events.sort(key=lambda x: x.start)
-                
-                # Lưu file merged SRT
-                output_path = self.get_temp_path('merged', '.srt')
-                merged_subs.save(output_path)
-                print(f"Successfully merged {len(srt_files)} SRT files to: {os.path.basename(output_path)}")
-                return output_path
-                
-            return None
-            
+            if self.artifact_cache:
+                def build(path):
+                    _, durations = join_audio([hook_mp3, audio_mp3], path, self.get_temp_path, self.run_ffmpeg)
+                    return {'durations': durations}
+
+                final_audio, meta = self.artifact_cache.fetch('audio', [hook_mp3, audio_mp3], None, '.wav', build)
+                hook_duration, audio_duration = meta['durations']
+            else:
+                final_audio, (hook_duration, audio_duration) = join_audio(
+                    [hook_mp3, audio_mp3], self.get_temp_path("merged", ".wav"), self.get_temp_path,
+                    self.run_ffmpeg
+                )
         except Exception as e:
-            print(f"Error merging SRT files: {e}")
-            return None
+            logger.error(f"Error merging audio: {e}")
+            raise
+
+        total_duration = hook_duration + audio_duration
+        logger.info(f"Hook duration: {hook_duration:.2f}s")
+        logger.info(f"Audio duration: {audio_duration:.2f}s")
+        logger.info(f"Final audio duration: {total_duration:.2f}s")
+        return final_audio, total_duration, hook_duration
+
+    @staticmethod
+    def build_style(subtitle_settings=None) -> 'pysubs2.SSAStyle':
+        """Tạo style ASS cho video dọc từ subtitle settings (preset)"""
+        import pysubs2  # Import khi cần để CLI/worker khởi động nhanh
 
-    def convert_srt_to_ass(self, srt_path: str, offset: float = 0, subtitle_settings=None) -> str:
-        """Chuyển đổi SRT sang ASS với offset thời gian và subtitle settings
+        # Tạo style mặc định cho video dọc
+        style = pysubs2.SSAStyle(
+            fontname="Ubuntu Bold",
+            fontsize=20,
+            primarycolor="&HFFFFFF&",  # Trắng
+            outlinecolor="&H000000&",  # Đen
+            backcolor="&H000000&",     # Đen
+            bold=0,
+            italic=0,
+            outline=2,    # Độ dày outline
+            shadow=1,     # Độ dày shadow
+            alignment=5,  # Middle-center cho video dọc
+            marginv=20,   # Margin dọc
+            marginl=20,   # Margin trái
+            marginr=20    # Margin phải
+        )
         
+        # Cập nhật style từ subtitle_settings nếu có
+        if subtitle_settings:
+            # Map field names
+            field_mapping = {
+                'font': 'fontname',
+                'font_size': 'fontsize',
+                'primary_color': 'primarycolor',
+                'outline_color': 'outlinecolor',
+                'back_color': 'backcolor',
+                'outline': 'outline',
+                'shadow': 'shadow',
+                'margin_v': 'marginv',
+                'margin_h': 'marginl',  # Use marginl for horizontal margin
+                'alignment': 'alignment'
+            }
+            
+            # Áp dụng settings
+            for preset_field, style_field in field_mapping.items():
+                if hasattr(subtitle_settings, preset_field):
+                    value = getattr(subtitle_settings, preset_field)
+                    if preset_field in ['font_size', 'outline', 'shadow', 'margin_v', 'margin_h', 'alignment']:
+                        value = int(str(value))
+                    # Set right margin equal to left margin
+                    setattr(style, style_field, value)
+                    if preset_field == 'margin_h':
+                        setattr(style, 'marginr', value)
+        
+        return style
+
+    @staticmethod
+    def style_text(text: str, alignment: int) -> str:
+        """Xóa các tag ASS cũ và thêm tag alignment vào đầu dòng"""
+        while '}{' in text:
+            text = text.replace('}{', '')
+        text = text.strip('{}')
+        return "{\\an%d}%s" % (alignment, text)
+
+    def build_subtitle_track(self, srt_files: List[Tuple[str, float]], subtitle_settings=None) -> SubtitleTrack:
+        """Đọc các file SRT, áp offset, merge và ngắt dòng theo max_chars, tất cả trong bộ nhớ
+
+        Các track đã sort được merge tuyến tính (SubtitleTrack dạng mảng, offset O(1)).
+
         Args:
-            srt_path (str): Đường dẫn file SRT
-            offset (float): Thời gian offset (giây), có thể là số thập phân (ví dụ: 10.534)
-            subtitle_settings: Cài đặt subtitle (font, size, etc.)
+            srt_files: List of (srt_path, offset) tuples - offset in seconds
+            subtitle_settings: Cài đặt subtitle (dùng max_chars)
         """
-        try:
-            if not srt_path:
-                return None
-                
-            # Đọc subtitle
-            try:
-                subs = pysubs2.load(srt_path, encoding='utf-8')
-                print(f"Successfully loaded SRT file: {srt_path}")
-            except Exception as e:
-                print(f"Error loading subtitle file: {e}")
-                return None
-            
-            # Tạo style mặc định cho video dọc
-            style = pysubs2.SSAStyle(
-                fontname="Ubuntu Bold",
-                fontsize=20,
-                primarycolor="&HFFFFFF&",  # Trắng
-                outlinecolor="&H000000&",  # Đen
-                backcolor="&H000000&",     # Đen
-                bold=0,
-                italic=0,
-                outline=2,    # Độ dày outline
-                shadow=1,     # Độ dày shadow
-                alignment=5,  # Middle-center cho video dọc
-                marginv=20,   # Margin dọc
-                marginl=20,   # Margin trái
-                marginr=20    # Margin phải
-            )
-            
-            # Cập nhật style từ subtitle_settings nếu có
-            if subtitle_settings:
-                # Map field names
-                field_mapping = {
-                    'font': 'fontname',
-                    'font_size': 'fontsize',
-                    'primary_color': 'primarycolor',
-                    'outline_color': 'outlinecolor',
-                    'back_color': 'backcolor',
-                    'outline': 'outline',
-                    'shadow': 'shadow',
-                    'margin_v': 'marginv',
-                    'margin_h': 'marginl',  # Use marginl for horizontal margin
-                    'alignment': 'alignment'
-                }
-                
-                # Áp dụng settings
-                for preset_field, style_field in field_mapping.items():
-                    if hasattr(subtitle_settings, preset_field):
-                        value = getattr(subtitle_settings, preset_field)
-                        if preset_field in ['font_size', 'outline', 'shadow', 'margin_v', 'margin_h', 'alignment']:
-                            value = int(str(value))
-                        # Set right margin equal to left margin
-                        setattr(style, style_field, value)
-                        if preset_field == 'margin_h':
-                            setattr(style, 'marginr', value)
-            
-            # Thêm style vào subtitle
-            subs.styles["Default"] = style
-            
-            # Áp dụng style và offset cho tất cả dòng
-            print(f"Applying offset of {offset:.3f}s to all subtitles")
-            for line in subs:
-                line.style = "Default"
-                
-                # Xóa các tag ASS cũ nếu có
-                text = line.text
-                while '}{' in text:
-                    text = text.replace('}{', '')
-                text = text.strip('{}')
-                
-                # Thêm alignment vào text
-                line.text = "{\\an%d}%s" % (style.alignment, text)
-                
-                # Thêm offset nếu có (giữ độ chính xác đến millisecond)
-                if offset > 0:
-                    old_start = line.start
-                    old_end = line.end
-                    # Convert offset từ giây sang millisecond, giữ độ chính xác
-                    offset_ms = int(offset * 1000)  # 10.534s -> 10534ms
-                    line.start += offset_ms
-                    line.end += offset_ms
-                    print(f"Line timing: {old_start}ms -> {line.start}ms (offset: +{offset_ms}ms)")
-            
-            # Lưu file ASS với timestamp
-            base_name = os.path.splitext(os.path.basename(srt_path))[0]
-            ass_path = os.path.join(self.work_dir, f"{base_name}_{self.timestamp}.ass")
-            subs.save(ass_path)
-            print(f"Created ASS file in work directory: {ass_path}")
-            
-            return ass_path
-            
-        except Exception as e:
-            print(f"Error converting SRT to ASS: {str(e)}")
-            return None
+        tracks = []
+        for srt_path, offset in srt_files:
+            track = SubtitleTrack.from_srt(srt_path)
+            logger.debug("Loaded %d events from %s", len(track), srt_path)
+            # Giữ độ chính xác đến millisecond (10.534s -> 10534ms)
+            tracks.append(track.shift(int(offset * 1000)) if offset > 0 else track)
+        
+        merged = merge_tracks(tracks)
+        max_chars = int(str(getattr(subtitle_settings, 'max_chars', 0) or 0))
+        return merged.wrap(max_chars)
 
-    def merge_ass_files(self, ass_files: List[str]) -> Optional[str]:
-        """Ghép nhiều file ASS thành một file duy nhất, giữ nguyên timing và style của từng file
+    def write_subtitle_track(self, track: SubtitleTrack, output_path: str, subtitle_settings=None) -> str:
+        """Áp style của preset và ghi track ra file ASS"""
+        write_ass(track, output_path, self.build_style(subtitle_settings), self.style_text)
+        return output_path
 
-        Args:
-            ass_files: Danh sách các file ASS cần ghép
+    def prepare_subtitles(self, srt_files: List[Tuple[str, float]], output_path: str,
+                          subtitle_settings=None) -> Tuple[str, Optional[SubtitleTrack]]:
+        """Tạo file ASS cho job, dùng lại bản trong artifact cache nếu cùng SRT, offset và preset
 
         Returns:
-            str: Đường dẫn tới file ASS đã ghép
+            (đường dẫn ASS, track trong bộ nhớ). Track chỉ chắc chắn có khi render theo đoạn,
+            vì mỗi đoạn cần cắt phần subtitle của riêng nó.
         """
-        try:
-            if not ass_files:
-                return None
-                
-            if len(ass_files) == 1:
-                return ass_files[0]
-                
-            # Load tất cả file ASS
-            all_subs = []
-            for ass_file in ass_files:
-                try:
-                    subs = pysubs2.load(ass_file, encoding='utf-8')
-                    all_subs.append(subs)
-                    print(f"Loaded ASS file: {ass_file}")
-                except Exception as e:
-                    print(f"Error loading ASS file {ass_file}: {e}")
-                    return None
-            
-            # Lấy file đầu tiên làm base
-            merged_subs = all_subs[0]
-            
-            # Thêm style và events từ các file còn lại
-            for i, subs in enumerate(all_subs[1:], 1):
-                # Thêm styles mới (nếu có)
-                for style_name, style in subs.styles.items():
-                    if style_name not in merged_subs.styles:
-                        new_style_name = f"{style_name}_{i}"
-                        merged_subs.styles[new_style_name] = style
-                        # Update style name trong events
-                        for line in subs.events:
-                            if line.style == style_name:
-                                line.style = new_style_name
-                
-                # Thêm events
-                merged_subs.events.extend(subs.events)
-            
-            # Sắp xếp lại events theo thời gian
-            merged_subs.events.sort(key=lambda x: x.start)
-            
-            # Lưu file merged với timestamp
-            output_path = self.get_temp_path('merged', '.ass')
-            merged_subs.save(output_path)
-            print(f"Successfully merged {len(ass_files)} ASS files to: {os.path.basename(output_path)}")
-            
-            return output_path
-            
-        except Exception as e:
-            print(f"Error merging ASS files: {e}")
-            return None
+        if not self.artifact_cache:
+            track = self.build_subtitle_track(srt_files, subtitle_settings)
+            return self.write_subtitle_track(track, output_path, subtitle_settings), track
 
-    def get_video_duration(self, video_path: str) -> float:
-        """Lấy thời lượng của video
-        
-        Args:
-            video_path: Đường dẫn đến file video
-        """
-        try:
-            cmd = [
-                'ffprobe',
-                '-v', 'error',
-                '-show_entries', 'format=duration',
-                '-of', 'json',
-                video_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            data = json.loads(result.stdout)
-            return float(data['format']['duration'])
-        except Exception as e:
-            print(f"Error getting video duration: {e}")
-            return 0
+        built = []
+
+        def build(path):
+            track = self.build_subtitle_track(srt_files, subtitle_settings)
+            self.write_subtitle_track(track, path, subtitle_settings)
+            built.append(track)
+            return {'events': len(track)}
+
+        params = {
+            'offsets': [round(offset, 3) for _, offset in srt_files],
+            'subtitle_settings': asdict(subtitle_settings) if is_dataclass(subtitle_settings) else subtitle_settings,
+        }
+        cached, _ = self.artifact_cache.fetch('ass', [path for path, _ in srt_files], params, '.ass', build)
+        shutil.copyfile(cached, output_path)  # File ASS trong output folder là bản của job, không phải của cache
 
-    def prepare_background_videos(self, video_folder: str, total_duration: float) -> List[str]:
+        track = built[0] if built else None
+        if track is None and self.segments > 1:
+            track = self.build_subtitle_track(srt_files, subtitle_settings)
+        return output_path, track
+
+    def prepare_background_videos(self, video_folder: str, total_duration: float,
+                                  selector: Optional[ClipSelector] = None) -> List[str]:
         """Chuẩn bị danh sách video background
         
         Args:
             video_folder: Thư mục chứa video background
             total_duration: Tổng thời lượng cần
+            selector: ClipSelector dùng chung cho cả batch (để chia đều clip và tái lập bằng seed)
         """
         try:
-            # Lấy tất cả file mp4 trong thư mục
-            video_files = []
-            for file in os.listdir(video_folder):
-                if file.endswith('.mp4'):
-                    video_files.append(os.path.join(video_folder, file))
-            
-            if not video_files:
-                raise Exception(f"No mp4 files found in {video_folder}")
-            
-            # Shuffle để random
-            random.shuffle(video_files)
-            
-            # Nếu chỉ có 1 file thì dùng luôn
-            if len(video_files) == 1:
-                return video_files
+            # Lấy metadata từ index trên đĩa, chỉ probe các clip mới
+            clips = MediaIndex(video_folder, limits=self.limits).refresh()
             
-            # Chọn đủ số file cần thiết
-            selected_files = []
-            current_duration = 0
+            if not clips:
+                raise Exception(f"No valid mp4 files found in {video_folder}")
             
-            for video in video_files:
-                duration = self.get_video_duration(video)
-                if duration <= 0:
-                    continue
-                    
-                selected_files.append(video)
-                current_duration += duration
+            # Chọn tập clip vừa đủ phủ thời lượng, dư ít nhất
+            selector = selector or ClipSelector()
+            selected = selector.select(clips, total_duration + BACKGROUND_MARGIN)
                 
-                # Nếu đã đủ thời lượng thì dừng
-                if current_duration >= total_duration:
-                    break
-            
-            if not selected_files:
-                raise Exception("No valid background videos found")
-                
-            print(f"Selected {len(selected_files)} background videos, total duration: {current_duration:.2f}s")
-            return selected_files
+            current_duration = sum(clip.duration for clip in selected)
+            logger.info(f"Selected {len(selected)} background videos, total duration: {current_duration:.2f}s")
+            if self.transcode_cache:
+                return self.transcode_cache.resolve(selected)
+            return [clip.path for clip in selected]
             
         except Exception as e:
-            print(f"Error preparing background videos: {e}")
+            logger.error(f"Error preparing background videos: {e}")
             return []
 
     def get_overlay_duration(self, hook_duration: float = 0) -> float:
@@ -385,47 +323,132 @@ class VideoProcessor:
         """
         return hook_duration if hook_duration > 0 else 5.0
 
-    def concat_background_videos(self, video_files: List[str], total_duration: float) -> Optional[str]:
-        """Ghép tất cả video nền thành một file duy nhất
+    def write_concat_list(self, video_files: List[str]) -> Optional[str]:
+        """Tạo file danh sách cho concat demuxer, được đọc trực tiếp bởi lệnh encode cuối
         
         Args:
             video_files: Danh sách các file video nền
-            total_duration: Tổng thời lượng cần
         """
         try:
             if not video_files:
                 return None
                 
-            # Tạo file concat.txt
-            concat_file = self.get_temp_path('concat', '.txt')
-            with open(concat_file, 'w', encoding='utf-8') as f:
-                for video in video_files:
-                    f.write(f"file '{video}'\n")
-            
-            # Ghép các video lại
-            output_path = self.get_temp_path('background', '.mp4')
-            cmd = [
-                'ffmpeg', '-y',
-                '-f', 'concat',
-                '-safe', '0',
-                '-i', concat_file,
-                '-c', 'copy',
-                '-t', str(total_duration),
-                output_path
-            ]
-            
-            print("Concatenating background videos...")
-            subprocess.run(cmd, check=True)
-            
-            # Xóa file concat.txt
-            os.remove(concat_file)
-            
-            return output_path
+            return write_concat_file(self.get_temp_path('concat', '.txt'), video_files)
             
         except Exception as e:
-            print(f"Error concatenating background videos: {e}")
+            logger.error(f"Error writing concat list: {e}")
             return None
 
+    def prepare_thumbnail(self, thumbnail: str) -> str:
+        """Thu nhỏ thumbnail cho vừa khung hình đầu ra một lần (dùng lại qua artifact cache nếu có)
+
+        Ảnh nhỏ hơn khung hình giữ nguyên kích thước như trước. Nếu ffmpeg lỗi thì dùng ảnh gốc.
+        """
+        vf = (f"scale='min(iw,{OUTPUT_WIDTH})':'min(ih,{OUTPUT_HEIGHT})':force_original_aspect_ratio=decrease,"
+              f"format=rgba")
+
+        def build(path):
+            cmd = ['ffmpeg', '-y', '-v', 'error', '-i', thumbnail, '-vf', vf, '-frames:v', '1', path]
+            self.run_ffmpeg(cmd)
+
+        try:
+            if self.artifact_cache:
+                scaled, _ = self.artifact_cache.fetch(
+                    'thumbnail', [thumbnail], {'width': OUTPUT_WIDTH, 'height': OUTPUT_HEIGHT}, '.png', build
+                )
+            else:
+                scaled = self.get_temp_path('thumbnail', '.png')
+                build(scaled)
+            return scaled
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.warning(f"Error scaling thumbnail, using original: {e}")
+            return thumbnail
+
+    def build_video_filters(self, ass_path: Optional[str], thumb_input: Optional[int],
+                            overlay_duration: float, time_offset: float = 0) -> Tuple[List[str], str]:
+        """Tạo filter complex cho video: nền (input 0) + subtitle + thumbnail overlay
+
+        Args:
+            ass_path: File ASS cần burn vào video (None nếu không có subtitle)
+            thumb_input: Index input của thumbnail (None nếu không có)
+            overlay_duration: Thời gian hiển thị thumbnail tính từ đầu video
+            time_offset: Thời điểm bắt đầu của đoạn video này trong video hoàn chỉnh (render theo segment)
+
+        Returns:
+            (danh sách filter, tên output cuối cùng)
+        """
+        filter_complex = ["[0:v]null[v0]"]
+        last_output = "v0"
+        
+        # Add subtitle nếu có
+        if ass_path:
+            # Dùng trực tiếp file ass trong thư mục tạm, đường dẫn được escape cho filtergraph
+            filter_complex.append(f"[{last_output}]ass=filename={escape_filter_path(ass_path)}[subbed]")
+            last_output = "subbed"
+        
+        # Add thumbnail nếu có
+        if thumb_input is not None:
+            overlay_end = overlay_duration - time_offset
+            # Đoạn (render theo segment) bắt đầu giữa lúc fade: fade phần còn lại từ đầu đoạn,
+            # vì fade của ffmpeg không nhận thời điểm bắt đầu âm
+            fade_start = max(0.0, overlay_end - THUMBNAIL_FADE)
+            fade_duration = max(1.0 / OUTPUT_FPS, overlay_end - fade_start)
+            # Ảnh được chuyển pixel format một lần rồi lặp trong bộ nhớ đúng số frame của đoạn hook.
+            # Khi stream thumbnail hết, overlay (eof_action=pass) chỉ chuyển tiếp frame nền,
+            # nên phần còn lại của video không phải blend hay fade.
+            frames = max(1, math.ceil(overlay_end * OUTPUT_FPS))
+            filter_complex.extend([
+                # Tạo overlay với fade out về trong suốt (alpha=1: fade kênh alpha, không phải fade về đen)
+                f"[{thumb_input}:v]format=yuva420p,loop=loop={frames - 1}:size=1:start=0,"
+                f"setpts=N/{OUTPUT_FPS}/TB,fade=t=out:st={fade_start}:d={fade_duration}:alpha=1[faded]",
+                
+                # Overlay thumbnail vào giữa video
+                f"[{last_output}][faded]overlay=(W-w)/2:(H-h)/2:eof_action=pass[v]"
+            ])
+            last_output = "v"
+        
+        return filter_complex, last_output
+
+    def build_final_command(self, profile: EncoderProfile, inputs: List[str], filter_complex: List[str],
+                            last_output: str, total_duration: float, output_path: str) -> List[str]:
+        """Tạo lệnh ffmpeg encode cuối với fps cố định và encoder theo profile"""
+        cmd = ['ffmpeg'] + profile.input_args() + ['-y'] + inputs + [
+            '-filter_complex', ';'.join(filter_complex),
+            '-map', f'[{last_output}]',  # video output
+            '-map', '1:a',  # audio output
+        ] + profile.output_args() + [
+            '-r', str(OUTPUT_FPS),
+            '-c:a', 'aac'
+        ]
+        
+        # Add duration if specified
+        if total_duration:
+            cmd.extend(['-t', str(total_duration)])
+        
+        cmd.append(output_path)
+        return cmd
+
+    def render_single_pass(self, profile: EncoderProfile, concat_list: str, final_audio: str,
+                           total_duration: float, output_path: str, ass_path: Optional[str],
+                           thumbnail: Optional[str], overlay_duration: float, on_progress=None):
+        """Encode toàn bộ video bằng một lệnh ffmpeg
+
+        Args:
+            on_progress: Hàm (FfmpegProgress) được gọi mỗi lần ffmpeg báo tiến độ
+        """
+        # Add background video + audio (+ thumbnail)
+        inputs = ['-f', 'concat', '-safe', '0', '-i', concat_list, '-i', final_audio]
+        thumb_input = None
+        if thumbnail:
+            inputs.extend(['-i', thumbnail])
+            thumb_input = 2  # background + audio + thumbnail
+        
+        filter_complex, last_output = self.build_video_filters(ass_path, thumb_input, overlay_duration)
+        cmd = self.build_final_command(profile, inputs, filter_complex, last_output,
+                                       total_duration, output_path)
+        logger.info("Executing command: %s", ' '.join(cmd))
+        self.run_ffmpeg(cmd, total_duration, on_progress)
+
     def process_video(self, 
                      hook_mp3: Optional[str],
                      audio_mp3: str,
@@ -434,22 +457,43 @@ class VideoProcessor:
                      thumbnail: Optional[str],
                      video_folder: str,
                      subtitle_settings=None,
-                     callback=None) -> str:
+                     callback=None,
+                     ass_output_dir: Optional[str] = None,
+                     background_videos: Optional[List[str]] = None,
+                     cancel_event=None) -> str:
+        """Render video hoàn chỉnh. Mọi file tạm nằm trong thư mục riêng của job và bị xóa khi xong
+
+        Args:
+            callback: Hàm (status, percent, progress=None). Trong lúc encode, progress là FfmpegProgress
+                (vị trí hiện tại, fps, speed, ETA); các bước khác chỉ truyền status và percent
+            ass_output_dir: Nếu có, file ASS được ghi thẳng vào thư mục này và giữ lại sau khi render
+            background_videos: Danh sách clip nền đã chọn trước (ví dụ bởi batch runner),
+                nếu không có thì tự chọn từ video_folder
+            cancel_event: Event để hủy job từ thread/process khác. Được kiểm tra giữa các bước và
+                trong lúc encode (ffmpeg bị dừng); job bị hủy trả về None
+        """
+        self.start_job()
+        self.cancel_event = cancel_event
         try:
+            filters = detect_capabilities().filters
+            if (hook_srt or audio_srt) and filters and 'ass' not in filters:
+                # Filter 'subtitles' cũng cần libass nên không có gì để dùng thay
+                raise Exception("This ffmpeg build has no libass ('ass' filter), cannot burn subtitles. "
+                                "Install an ffmpeg build with --enable-libass.")
+
             # 1. Chuẩn bị audio và lấy thời lượng
             if callback: callback("Preparing audio...", 10)
             
-            # Lấy hook duration trước khi merge
-            hook_duration = self.get_audio_duration(hook_mp3) if hook_mp3 else 0
-            print(f"Hook duration: {hook_duration:.2f}s")
-            
-            # Merge audio và lấy tổng thời lượng
-            final_audio, total_duration = self.prepare_and_get_duration(hook_mp3, audio_mp3)
-            print(f"Total audio duration: {total_duration:.2f}s")
+            # Merge audio, lấy tổng thời lượng và thời lượng hook trong cùng một bước
+            with self.timer.stage("audio"):
+                final_audio, total_duration, hook_duration = self.prepare_and_get_duration(hook_mp3, audio_mp3)
+            logger.info(f"Total audio duration: {total_duration:.2f}s")
 
             # 2. Chuẩn bị subtitle
+            self.check_cancelled()
             if callback: callback("Converting subtitles...", 30)
             merged_ass = None
+            subtitle_track = None
             if hook_srt or audio_srt:
                 # Tạo list các file SRT và offset tương ứng
                 srt_files = []
@@ -459,111 +503,92 @@ class VideoProcessor:
                     # Audio SRT luôn phải offset lên bằng hook_duration vì được ghép sau hook
                     srt_files.append((audio_srt, hook_duration))
                 
-                # Merge các file SRT
-                merged_srt = self.merge_srt_files(srt_files)
-                if not merged_srt:
-                    raise Exception("Failed to merge SRT files")
-                print(f"Using merged SRT file: {os.path.basename(merged_srt)}")
-                
-                # Convert merged SRT sang ASS, không cần offset vì đã offset trong merge_srt_files
-                merged_ass = self.convert_srt_to_ass(merged_srt, 0, subtitle_settings)
-                if not merged_ass:
-                    raise Exception("Failed to convert merged SRT to ASS")
-                print(f"Using merged ASS file: {os.path.basename(merged_ass)}")
+                # Merge + style + ghi ASS một lần; nếu cần giữ file ASS thì ghi thẳng vào thư mục đó
+                if ass_output_dir:
+                    audio_name = os.path.splitext(os.path.basename(audio_mp3))[0]
+                    ass_path = os.path.join(ass_output_dir, f"{audio_name}_{self.timestamp}.ass")
+                else:
+                    ass_path = self.get_temp_path('merged', '.ass')
+                try:
+                    with self.timer.stage("subtitles"):
+                        merged_ass, subtitle_track = self.prepare_subtitles(srt_files, ass_path, subtitle_settings)
+                except Exception as e:
+                    raise Exception(f"Failed to build ASS subtitles: {e}")
+                logger.info(f"Built ASS file: {merged_ass}")
 
             # 3. Chuẩn bị video background
+            self.check_cancelled()
             if callback: callback("Preparing background videos...", 20)
-            background_videos = self.prepare_background_videos(video_folder, total_duration)
+            if not background_videos:
+                with self.timer.stage("background"):
+                    background_videos = self.prepare_background_videos(video_folder, total_duration)
             if not background_videos:
                 raise Exception("No background videos found")
                 
-            # 4. Ghép tất cả video nền thành một file
-            if callback: callback("Concatenating background videos...", 40)
-            background_video = self.concat_background_videos(background_videos, total_duration)
-            if not background_video:
-                raise Exception("Failed to concatenate background videos")
-            print(f"Created background video: {os.path.basename(background_video)}")
-
-            # 5. Tạo filter complex cho ffmpeg
-            filter_complex = []
-            
-            # Add background video
-            inputs = ['-i', background_video]
-            filter_complex.append("[0:v]null[v0]")
-            last_output = "v0"
-            
-            # Add subtitle nếu có
-            if merged_ass:
-                # Copy file ass về thư mục code trước khi xử lý video
-                code_dir = os.getcwd()  # Thư mục chứa code
-                final_ass = os.path.join(code_dir, os.path.basename(merged_ass))
-                shutil.copy2(merged_ass, final_ass)
-                print(f"Copied subtitle to code directory: {final_ass}")
-                
-                # Dùng file ass từ thư mục code
-                filter_complex.append(f"[{last_output}]ass='{os.path.basename(final_ass)}'[subbed]")
-                last_output = "subbed"
-            
-            # Add audio
-            inputs.extend(['-i', final_audio])
-            
-            # Add thumbnail nếu có
+            # 4. Tạo concat list, nền được đọc thẳng từ thư viện trong lần encode cuối (không ghi file trung gian)
+            if callback: callback("Preparing background list...", 40)
+            with self.timer.stage("concat_list"):
+                concat_list = self.write_concat_list(background_videos)
+            if not concat_list:
+                raise Exception("Failed to write background concat list")
+
+            # 5. Chuẩn bị thumbnail
+            overlay_duration = self.get_overlay_duration(hook_duration)
             if thumbnail:
-                inputs.extend(['-i', thumbnail])
-                thumb_idx = 2  # background + audio + thumbnail
-                overlay_duration = self.get_overlay_duration(hook_duration)
-                print(f"Thumbnail overlay duration: {overlay_duration:.2f}s")
-                
-                # Thêm hiệu ứng fade cho thumbnail
-                filter_complex.extend([
-                    # Tạo overlay với fade out
-                    f"[{thumb_idx}:v]fade=t=out:st={overlay_duration-0.5}:d=0.5[faded]",
-                    
-                    # Overlay thumbnail vào giữa video
-                    f"[{last_output}][faded]overlay=(W-w)/2:(H-h)/2:enable='between(t,0,{overlay_duration})'[v]"
-                ])
-                last_output = "v"
-            
-            # Tạo command với fps và bitrate cố định
-            cmd = [
-                'ffmpeg', '-hwaccel', 'cuda', '-y'
-            ] + inputs + [
-                '-filter_complex', ';'.join(filter_complex),
-                '-map', f'[{last_output}]',  # video output
-                '-map', '1:a',  # audio output
-                '-c:v', 'h264_nvenc',
-                '-preset', 'p7',
-                '-b:v', '5M',
-                '-r', '30',  # 30fps
-                '-c:a', 'aac'
-            ]
-            
-            # Add duration if specified
-            if total_duration:
-                cmd.extend(['-t', str(total_duration)])
+                logger.info(f"Thumbnail overlay duration: {overlay_duration:.2f}s")
+                with self.timer.stage("thumbnail"):
+                    thumbnail = self.prepare_thumbnail(thumbnail)
             
             # Tạo tên output từ tên audio và timestamp
             audio_name = os.path.splitext(os.path.basename(audio_mp3))[0]
             output_name = f"{audio_name}_{self.timestamp}.mp4"
             output_path = os.path.join(self.output_folder, output_name)  # Tạo trực tiếp trong output folder
-            print(f"Output will be saved as: {output_path}")
-            
-            # Add output file
-            cmd.append(output_path)
+            logger.info(f"Output will be saved as: {output_path}")
             
-            # Thực thi command
-            print("Executing command:", ' '.join(cmd))
-            subprocess.run(cmd, check=True)
+            # 6. Encode. Thử lần lượt các encoder, encoder lỗi (ví dụ: không có GPU) thì chuyển sang encoder tiếp theo
+            self.check_cancelled()
+            if callback: callback("Encoding video...", 50)
+
+            def on_progress(progress: FfmpegProgress):
+                if callback:
+                    # Encode chiếm phần 50-99% của thanh tiến độ
+                    callback(f"Encoding video... {progress.describe()}", 50 + progress.percent * 0.49, progress)
+
+            profiles = resolve_profiles(self.encoder)
+            for attempt, profile in enumerate(profiles):
+                logger.info(f"Encoding with {profile.name} ({profile.speed})")
+                try:
+                    with self.timer.stage("encode"):
+                        if self.segments > 1:
+                            SegmentRenderer(self, profile, self.segments).render(
+                                concat_list, final_audio, total_duration, output_path,
+                                subtitle_track, subtitle_settings, thumbnail, overlay_duration, on_progress
+                            )
+                        else:
+                            self.render_single_pass(profile, concat_list, final_audio, total_duration,
+                                                    output_path, merged_ass, thumbnail, overlay_duration, on_progress)
+                    self.used_encoder = profile
+                    break
+                except subprocess.CalledProcessError as e:
+                    if attempt == len(profiles) - 1:
+                        raise
+                    logger.warning(f"Encoder {profile.name} failed ({e}), falling back to {profiles[attempt + 1].name}")
             
             # Đợi một chút để đảm bảo ffmpeg đã giải phóng hết file
             time.sleep(1)
             
-            # Cleanup tất cả file tạm sau khi đã hoàn thành
-            self.cleanup()
-            
             if callback: callback("Done!", 100)
             return output_path
             
+        except Cancelled:
+            logger.warning("Processing cancelled")
+            return None
+
         except Exception as e:
-            print(f"Error processing video: {str(e)}")
-            return None
\ No newline at end of file
+            logger.error(f"Error processing video: {str(e)}")
+            return None
+            
+        finally:
+            # Chỉ xóa thư mục tạm của job này, kể cả khi lỗi
+            with self.timer.stage("cleanup"):
+                self.cleanup()
\ No newline at end of file
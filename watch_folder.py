@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+from batch_settings import BatchSettings
+from clip_selector import ClipSelector
+from job_queue import JobQueue
+from worker import enqueue_jobs, load_preset
+
+try:
+    # Tùy chọn (Linux): nhận sự kiện ghi file ngay thay vì chờ tới lần quét tiếp theo
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTLE_SECONDS = 10  # File không đổi size/mtime trong chừng này giây thì coi là đã ghi xong
+DEFAULT_POLL_SECONDS = 5
+DEFAULT_REQUIRE = ("audio", "subtitle")
+
+
+class FolderWatcher:
+    """Theo dõi input folder và trả về các bộ file đã đủ và đã ghi xong
+
+    Một bộ file sẵn sàng khi có đủ các vai trò trong require (hook và hook subtitle phải đi cùng
+    nhau) và size/mtime của mọi file trong bộ không đổi trong settle_seconds giây. File được ghép
+    theo suffix của BatchSettings như nút batch.
+
+    Có inotify_simple thì thức dậy ngay khi có file được ghi; không có (Windows, macOS) hoặc
+    input folder nằm trên share mạng (inotify không thấy file do máy khác ghi) thì vẫn quét lại
+    mỗi poll_seconds giây.
+    """
+
+    def __init__(self, batch_settings: BatchSettings, settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+                 poll_seconds: float = DEFAULT_POLL_SECONDS, require: Iterable[str] = DEFAULT_REQUIRE):
+        self.batch_settings = batch_settings
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.require = tuple(require)
+        self.pending: Dict[str, Tuple[Tuple, float]] = {}  # base name -> (chữ ký file, lúc chữ ký đổi lần cuối)
+        self.queued: Dict[str, Tuple] = {}  # base name -> chữ ký lúc được đưa vào hàng đợi
+        self.inotify = None
+        if INotify is not None:
+            try:
+                self.inotify = INotify()
+                mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE | flags.MODIFY
+                self.inotify.add_watch(batch_settings.settings["input_folder"], mask)
+            except OSError as e:
+                logger.warning(f"inotify unavailable, polling only: {e}")
+                self.inotify = None
+
+    @classmethod
+    def from_settings(cls, batch_settings: BatchSettings) -> "FolderWatcher":
+        """Tạo từ mục 'watch' trong batch_settings.json"""
+        settings = batch_settings.settings.get("watch") or {}
+        return cls(
+            batch_settings,
+            settle_seconds=float(settings.get("settle_seconds", DEFAULT_SETTLE_SECONDS)),
+            poll_seconds=float(settings.get("poll_seconds", DEFAULT_POLL_SECONDS)),
+            require=settings.get("require") or DEFAULT_REQUIRE,
+        )
+
+    def is_complete(self, files: Dict[str, Optional[str]]) -> bool:
+        if not all(files.get(role) for role in self.require):
+            return False
+        return bool(files["hook"]) == bool(files["hook_subtitle"])
+
+    @staticmethod
+    def signature(files: Dict[str, Optional[str]]) -> Optional[Tuple]:
+        """(vai trò, path, size, mtime) của mọi file trong bộ, None nếu có file vừa bị xóa/đổi tên"""
+        result = []
+        for role, path in sorted(files.items()):
+            if not path:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            result.append((role, path, stat.st_size, stat.st_mtime_ns))
+        return tuple(result)
+
+    def poll(self) -> Dict[str, Dict[str, Optional[str]]]:
+        """Quét input folder một lần và trả về các bộ file vừa sẵn sàng (mỗi bộ chỉ trả về một lần)"""
+        now = time.monotonic()
+        index = self.batch_settings.scan_input_folder(log_problems=False)
+        ready = {}
+        for base_name, files in index.items():
+            if not self.is_complete(files):
+                continue
+            signature = self.signature(files)
+            if signature is None or self.queued.get(base_name) == signature:
+                continue
+            previous = self.pending.get(base_name)
+            if previous is None or previous[0] != signature:
+                # Bộ mới hoặc còn đang được ghi: tính lại thời gian chờ từ lúc này
+                self.pending[base_name] = (signature, now)
+                continue
+            if now - previous[1] >= self.settle_seconds:
+                del self.pending[base_name]
+                self.queued[base_name] = signature
+                ready[base_name] = files
+
+        for base_name in list(self.pending):
+            if base_name not in index:
+                del self.pending[base_name]
+        return ready
+
+    def wait(self):
+        """Chờ tới lần quét tiếp theo: có sự kiện inotify, hết thời gian settle của bộ đang chờ, hoặc hết poll_seconds"""
+        timeout = self.poll_seconds
+        if self.pending:
+            now = time.monotonic()
+            settle_at = min(changed for _, changed in self.pending.values()) + self.settle_seconds
+            timeout = max(0.1, min(timeout, settle_at - now))
+        if self.inotify is None:
+            time.sleep(timeout)
+            return
+        if self.inotify.read(timeout=int(timeout * 1000)):
+            # Gom các sự kiện liên tiếp thành một lần quét, nhưng không quá poll_seconds: file lớn
+            # đang được ghi sinh MODIFY liên tục và các bộ khác vẫn phải được kiểm tra đúng hạn
+            deadline = time.monotonic() + min(timeout, self.poll_seconds)
+            while time.monotonic() < deadline and self.inotify.read(timeout=100):
+                pass
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+
+
+def watch(queue: JobQueue, batch_settings: BatchSettings, presets_file: str = "subtitle_presets.json",
+          stop_event=None) -> int:
+    """Theo dõi input folder và đưa từng bộ file vào hàng đợi ngay khi nó sẵn sàng
+
+    Worker (python worker.py run, hoặc watch --processes N) nhận và render job như bình thường.
+    Job trong hàng đợi được nhận diện theo file audio và hash nội dung đầu vào: bộ file đã có
+    trong hàng đợi (kể cả từ lần chạy trước) không bị render lại, bộ file được ghi đè dưới cùng
+    tên thì được render lại.
+
+    Args:
+        stop_event: Event để dừng vòng lặp (mặc định chạy tới khi Ctrl+C)
+
+    Returns:
+        Số job mới được đưa vào hàng đợi
+    """
+    settings = batch_settings.settings
+    for folder in (settings["input_folder"], settings["output_folder"], settings["video_folder"]):
+        if not folder or not os.path.exists(folder):
+            raise Exception("All folders must exist!")
+    preset = load_preset(settings, presets_file)
+    # Một selector cho cả phiên để clip nền được chia đều giữa các bộ đến sau
+    selector = ClipSelector(seed=settings.get("background_seed"))
+
+    watcher = FolderWatcher.from_settings(batch_settings)
+    logger.info(f"Watching {settings['input_folder']} "
+                f"({'inotify' if watcher.inotify else 'polling'}, settle {watcher.settle_seconds:g}s)")
+    added = 0
+    try:
+        while stop_event is None or not stop_event.is_set():
+            ready = watcher.poll()
+            if ready:
+                logger.info(f"File sets ready: {', '.join(sorted(ready))}")
+                try:
+                    added += enqueue_jobs(queue, settings, ready, preset, selector)
+                except Exception as e:
+                    # Lỗi tạm thời (share mạng, database bận): quét lại và thử ở lần sau
+                    logger.error(f"Error enqueueing {', '.join(sorted(ready))}: {e}")
+                    for base_name in ready:
+                        watcher.queued.pop(base_name, None)
+            watcher.wait()
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+    finally:
+        watcher.close()
+    return added
@@ -0,0 +1,358 @@
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+from dataclasses import asdict
+from typing import Dict, List, Optional
+
+from artifact_cache import ArtifactCache
+from batch_manifest import BatchManifest
+from batch_runner import BatchRunner, run_job
+from batch_settings import BatchSettings
+from clip_selector import ClipSelector
+from ffmpeg_utils import ProcessLimits
+from job_order import JobOrder
+from job_queue import JobQueue
+from log_setup import setup_logging
+from media_index import ClipInfo
+from subtitle_settings import SubtitlePresetManager, SubtitleSettings
+from transcode_cache import TranscodeCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = os.path.join(os.getcwd(), "jobs.db")
+STOP_TIMEOUT = 30  # Giây chờ worker tự dừng (kill ffmpeg, trả job) trước khi terminate
+
+
+def open_queue(settings: dict, path: Optional[str] = None) -> JobQueue:
+    """Mở hàng đợi theo mục 'queue' trong batch_settings.json"""
+    queue_settings = settings.get("queue") or {}
+    return JobQueue(
+        path or queue_settings.get("path") or DEFAULT_QUEUE,
+        lease_seconds=float(queue_settings.get("lease_seconds", 600)),
+        max_attempts=int(queue_settings.get("max_attempts", 3)),
+    )
+
+
+def enqueue_batch(queue: JobQueue, batch_settings: BatchSettings,
+                  presets_file: str = "subtitle_presets.json") -> int:
+    """Đưa mọi bộ file trong input folder vào hàng đợi, bộ nào đã có trong hàng đợi với cùng nội dung thì bỏ qua
+
+    Clip nền được chọn ngay lúc enqueue (như BatchRunner) để cả batch chia đều thư viện video
+    dù job được render trên nhiều máy khác nhau. Job lưu clip gốc trong thư viện; mỗi worker tự
+    đổi sang bản trong transcode cache của máy mình (xem resolve_backgrounds).
+
+    Returns:
+        Số job mới được thêm
+    """
+    settings = batch_settings.settings
+    input_folder = settings["input_folder"]
+    output_folder = settings["output_folder"]
+    video_folder = settings["video_folder"]
+    if not all(os.path.exists(f) for f in [input_folder, output_folder, video_folder]):
+        raise Exception("All folders must exist!")
+
+    jobs = {}
+    for base_name in batch_settings.get_base_names():
+        files = batch_settings.find_matching_files(base_name)
+        if not files["audio"]:
+            logger.warning(f"Skipping {base_name}: No audio file found")
+            continue
+        jobs[base_name] = files
+
+    return enqueue_jobs(queue, settings, jobs, load_preset(settings, presets_file))
+
+
+def load_preset(settings: dict, presets_file: str = "subtitle_presets.json") -> SubtitleSettings:
+    preset = SubtitlePresetManager(presets_file).get_preset(settings["preset_name"])
+    if preset is None:
+        raise Exception(f"Subtitle preset not found: {settings['preset_name']}")
+    return preset
+
+
+def enqueue_jobs(queue: JobQueue, settings: dict, jobs: Dict[str, Dict[str, Optional[str]]],
+                 preset: SubtitleSettings, selector: Optional[ClipSelector] = None) -> int:
+    """Chọn clip nền cho các bộ file rồi đưa vào hàng đợi, bộ nào đã có trong hàng đợi với cùng nội dung thì bỏ qua
+
+    Args:
+        jobs: Map base_name -> files (từ BatchSettings.find_matching_files)
+        selector: ClipSelector dùng chung giữa nhiều lần gọi để chia đều clip nền
+
+    Returns:
+        Số job mới được thêm
+    """
+    output_folder = settings["output_folder"]
+    video_folder = settings["video_folder"]
+    runner = BatchRunner(
+        os.path.join(os.getcwd(), "temp"), output_folder, video_folder,
+        seed=settings.get("background_seed"),
+        incremental=False,
+        limits=ProcessLimits.from_settings(settings.get("timeouts")),
+    )
+    durations = runner.get_job_durations(jobs)
+    backgrounds = runner.select_backgrounds(jobs, selector, durations)
+
+    manifest = BatchManifest(output_folder)
+    added = 0
+    # Worker nhận job theo thứ tự enqueue
+    for base_name in JobOrder.from_settings(settings.get("job_order")).sort(list(jobs), durations):
+        files = jobs[base_name]
+        payload = {
+            "files": files,
+            "output_folder": output_folder,
+            "video_folder": video_folder,
+            "subtitle_settings": asdict(preset),
+            "encoder": settings.get("encoder"),
+            "segments": settings.get("segments", 1),
+            "transcode_cache": settings.get("transcode_cache"),
+            "artifact_cache": settings.get("artifact_cache"),
+            "timeouts": settings.get("timeouts"),
+            "background_clips": [asdict(clip) for clip in backgrounds[base_name]]
+            if base_name in backgrounds else None,
+        }
+        # Key gồm hash nội dung đầu vào: bộ file không đổi chỉ được enqueue một lần, còn bộ file
+        # được thay mới dưới cùng tên (hoặc đổi preset/encoder) thành job mới và được render lại
+        fingerprint = manifest.fingerprint(files, preset, settings.get("encoder"))
+        if queue.enqueue(f"{files['audio']}#{fingerprint}", base_name, payload):
+            added += 1
+    manifest.save()  # Lưu cache hash file để lần enqueue sau không phải đọc lại file không đổi
+    logger.info(f"Enqueued {added} new jobs ({len(jobs) - added} already queued)")
+    return added
+
+
+def resolve_backgrounds(clips: Optional[List[Dict]], transcode_cache: Optional[TranscodeCache]) -> Optional[List[str]]:
+    """Đổi clip nền của job (clip gốc trong thư viện) sang file worker này dùng được
+
+    Transcode cache nằm trên máy worker nên clip chưa có trong cache được transcode ở đây.
+    None (job không có clip chọn trước) thì process_video tự chọn.
+    """
+    if clips is None:
+        return None
+    clips = [ClipInfo(**clip) for clip in clips]
+    if transcode_cache is None:
+        return [clip.path for clip in clips]
+    try:
+        transcode_cache.ingest(clips)
+    except Exception as e:
+        logger.error(f"Error preparing cached background clips: {e}")
+    return transcode_cache.resolve(clips)
+
+
+class Heartbeat(threading.Thread):
+    """Gia hạn lease của job định kỳ trong lúc worker đang render
+
+    Mất lease (job đã bị worker khác nhận lại) thì set cancel_event để dừng render, tránh hai
+    worker cùng render một job. Worker được yêu cầu dừng (stop_event) cũng hủy job đang render.
+    """
+
+    def __init__(self, queue: JobQueue, job_id: int, worker_id: str, cancel_event: threading.Event,
+                 stop_event=None):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.cancel_event = cancel_event
+        self.stop_event = stop_event
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = max(1.0, self.queue.lease_seconds / 3)
+        next_beat = time.monotonic() + interval
+        while not self.stopped.wait(1.0):
+            if self.stop_event is not None and self.stop_event.is_set():
+                self.cancel_event.set()
+                return
+            if time.monotonic() < next_beat:
+                continue
+            next_beat = time.monotonic() + interval
+            try:
+                if not self.queue.heartbeat(self.job_id, self.worker_id):
+                    logger.warning(f"Lost lease on job {self.job_id}, cancelling render")
+                    self.cancel_event.set()
+                    return
+            except Exception as e:
+                # Lỗi tạm thời của filesystem share: thử lại ở lần sau, lease vẫn còn hạn
+                logger.error(f"Heartbeat failed for job {self.job_id}: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(queue_path: str, lease_seconds: float, max_attempts: int, work_dir: str,
+               poll_interval: float = 5.0, exit_when_empty: bool = False,
+               log_level="INFO", stop_event=None) -> int:
+    """Vòng lặp của một worker: nhận job, render, ghi kết quả, lặp lại
+
+    Args:
+        poll_interval: Số giây chờ trước khi hỏi lại khi hàng đợi trống
+        exit_when_empty: Thoát khi không còn job thay vì chờ job mới
+        stop_event: multiprocessing.Event của process cha; khi được set, job đang render bị hủy
+            (ffmpeg bị dừng), job được trả về hàng đợi và worker thoát
+
+    Returns:
+        Số job đã render thành công
+    """
+    setup_logging(log_level)
+    if stop_event is not None:
+        # Process cha dừng worker qua stop_event; Ctrl+C ở terminal chỉ để process cha xử lý
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    queue = JobQueue(queue_path, lease_seconds, max_attempts)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    os.makedirs(work_dir, exist_ok=True)
+    logger.info(f"Worker {worker_id} started on {queue_path}")
+
+    done = 0
+    while stop_event is None or not stop_event.is_set():
+        job = queue.claim(worker_id)
+        if job is None:
+            if exit_when_empty:
+                break
+            if stop_event is not None:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+
+        logger.info(f"Claimed job {job.id} ({job.base_name}), attempt {job.attempts}")
+        payload = job.payload
+        cancel_event = threading.Event()
+        heartbeat = Heartbeat(queue, job.id, worker_id, cancel_event, stop_event)
+        heartbeat.start()
+        try:
+            artifact_cache = ArtifactCache.from_settings(payload.get("artifact_cache"))
+            if artifact_cache:
+                # enqueue_jobs đã hash đầu vào và lưu vào manifest trong output folder
+                artifact_cache.remember_hashes(
+                    BatchManifest(payload["output_folder"]).hashes_for(payload["files"].values()))
+            limits = ProcessLimits.from_settings(payload.get("timeouts"))
+            transcode_cache = TranscodeCache.from_settings(payload.get("transcode_cache"), limits)
+            if "background_clips" in payload:
+                background_videos = resolve_backgrounds(payload["background_clips"], transcode_cache)
+            else:
+                background_videos = payload.get("background_videos")  # Job được enqueue bởi phiên bản cũ
+            result = run_job(
+                job.base_name,
+                payload["files"],
+                work_dir,
+                payload["output_folder"],
+                payload["video_folder"],
+                SubtitleSettings(**payload["subtitle_settings"]),
+                background_videos,
+                payload.get("encoder"),
+                transcode_cache,
+                payload.get("segments", 1),
+                artifact_cache,
+                limits=limits,
+                cancel_event=cancel_event,
+            )
+        finally:
+            heartbeat.stop()
+
+        if stop_event is not None and stop_event.is_set():
+            queue.release(job.id, worker_id)
+            logger.info(f"Worker stopping, job {job.id} returned to the queue")
+        elif cancel_event.is_set():
+            logger.warning(f"Job {job.id} was reclaimed by another worker, render stopped")
+        elif result.success:
+            if queue.complete(job.id, worker_id, result.output):
+                done += 1
+            else:
+                logger.warning(f"Job {job.id} was reclaimed by another worker, result discarded")
+        else:
+            queue.fail(job.id, worker_id, result.error or "Unknown error")
+
+    logger.info(f"Worker {worker_id} finished: {done} jobs rendered")
+    return done
+
+
+def start_workers(count: int, worker_args, stop_event=None) -> list:
+    """Chạy count worker (run_worker) trong các process riêng"""
+    processes = [multiprocessing.Process(target=run_worker, args=worker_args, kwargs={"stop_event": stop_event})
+                 for _ in range(count)]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def stop_workers(processes: list, stop_event, timeout: float = STOP_TIMEOUT):
+    """Yêu cầu worker dừng (hủy job, kill ffmpeg, trả job về hàng đợi), quá timeout thì terminate"""
+    stop_event.set()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning(f"Worker {process.pid} did not stop in time, terminating")
+            process.terminate()
+            process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless render worker backed by a SQLite job queue")
+    parser.add_argument("--settings", default="batch_settings.json", help="Batch settings file")
+    parser.add_argument("--queue", help="Path to the queue database (overrides settings)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = sub.add_parser("enqueue", help="Add every file set in the input folder to the queue")
+    enqueue.add_argument("--presets", default="subtitle_presets.json")
+
+    run = sub.add_parser("run", help="Claim and render jobs")
+    run.add_argument("--processes", type=int, default=1, help="Worker processes on this machine")
+    run.add_argument("--work-dir", default=os.path.join(os.getcwd(), "temp"))
+    run.add_argument("--poll", type=float, default=5.0, help="Seconds between polls when idle")
+    run.add_argument("--exit-when-empty", action="store_true")
+
+    watch = sub.add_parser("watch", help="Enqueue file sets as they arrive in the input folder")
+    watch.add_argument("--presets", default="subtitle_presets.json")
+    watch.add_argument("--processes", type=int, default=1,
+                       help="Worker processes started alongside the watcher (0 = only enqueue)")
+    watch.add_argument("--work-dir", default=os.path.join(os.getcwd(), "temp"))
+    watch.add_argument("--poll", type=float, default=2.0, help="Seconds between queue polls of the workers")
+
+    sub.add_parser("status", help="Show job counts per state and failed jobs")
+    sub.add_parser("retry", help="Move failed jobs back to pending")
+
+    args = parser.parse_args(argv)
+    batch_settings = BatchSettings(args.settings)
+    settings = batch_settings.settings
+    log_level = settings.get("log_level", "INFO")
+    setup_logging(log_level)
+    queue = open_queue(settings, args.queue)
+
+    if args.command == "enqueue":
+        enqueue_batch(queue, batch_settings, args.presets)
+    elif args.command == "run":
+        worker_args = (queue.db_path, queue.lease_seconds, queue.max_attempts, args.work_dir,
+                       args.poll, args.exit_when_empty, log_level)
+        if args.processes <= 1:
+            run_worker(*worker_args)
+        else:
+            for process in start_workers(args.processes, worker_args):
+                process.join()
+    elif args.command == "watch":
+        from watch_folder import watch
+        worker_args = (queue.db_path, queue.lease_seconds, queue.max_attempts, args.work_dir,
+                       args.poll, False, log_level)
+        stop_event = multiprocessing.Event()
+        processes = start_workers(args.processes, worker_args, stop_event)
+        try:
+            watch(queue, batch_settings, args.presets)
+        finally:
+            stop_workers(processes, stop_event)
+    elif args.command == "status":
+        for state, count in sorted(queue.counts().items()):
+            print(f"{state}: {count}")
+        for job in queue.failed_jobs():
+            print(f"FAILED {job['base_name']} (attempts: {job['attempts']}): {job['error']}")
+    elif args.command == "retry":
+        print(f"Requeued {queue.retry_failed()} failed jobs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())